@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+bench-rpc.py — RPC cost benchmark for uniswap-swap.py against local stand-ins.
+
+Starts one in-process HTTP server that plays every remote the script talks to:
+  /rpc/<chain>   JSON-RPC for base / ethereum / arbitrum (single and batch requests) —
+                 a tiny stateful chain: ETH + ERC20 balances, allowances, nonces, instant
+                 mining, receipts with logs, Multicall3, QuoterV2, the v3 factory,
+                 pools (slot0 / observe) and router, WETH, the v4 Universal Router /
+                 V4Quoter / StateView / Permit2 for RED's Clanker pool, the Clanker fee
+                 locker and the Across SpokePools (a Base deposit is filled on Arbitrum
+                 straight away)
+  /1claw/...     agent-token + private keys (throwaway test keys, one per secret path)
+  /across/...    suggested-fees
+
+Each scenario runs uniswap-swap.py in fresh processes (shared HOME, so the first run
+is cold and later runs see the on-disk caches) and reports JSON-RPC calls, HTTP round
+trips, bytes sent and p50/p95 wall time. Call counts are compared to
+bench-rpc-baseline.json; more calls than the baseline is a regression (exit 1).
+
+Usage:
+  python3 scripts/bench-rpc.py                        # all scenarios, 5 runs each
+  python3 scripts/bench-rpc.py --latency-ms 50 swap-v3 balance
+  python3 scripts/bench-rpc.py --update-baseline      # accept current call counts
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import function_signature_to_4byte_selector, keccak
+from hexbytes import HexBytes
+
+HERE     = os.path.dirname(os.path.abspath(__file__))
+SCRIPT   = os.path.join(HERE, "uniswap-swap.py")
+BASELINE = os.path.join(HERE, "bench-rpc-baseline.json")
+
+TEST_KEYS = {                        # throwaway keys served by the fake vault, by secret path
+    "punkwallet/private-key": "0x" + "4b" * 32,
+    "treasury2/private-key":  "0x" + "4c" * 32,
+}
+TEST_KEY = TEST_KEYS["punkwallet/private-key"]
+WALLET   = Account.from_key(TEST_KEY).address.lower()
+WALLETS  = [Account.from_key(k).address.lower() for k in TEST_KEYS.values()]   # all funded alike
+BURN     = "0x000000000000000000000000000000000000dead"
+
+MULTICALL3       = "0xca11bde05977b3631167028862be2a173976ca11"
+UNIVERSAL_ROUTER = "0x6ff5693b99212da76ad316178a184ab56d299b43"
+V4_QUOTER        = "0x0d5e0f971ed27fbff6c2837bf31316121532048d"
+STATE_VIEW       = "0xa3c0c9b65bad0b08107aa264b0f3db444b867a71"
+PERMIT2          = "0x000000000022d473030f116ddee9f6b43ac78ba3"
+FEE_LOCKER       = "0xf3622742b1e446d92e45e22923ef11c2fcd55d68"
+RED_HOOK         = "0xb429d62f8f3bffb98cdb9569533ea23bf0ba28cc"
+SPOKE_BASE       = "0x09aea4b2242abc8bb4bb78d537a67a245a7bec64"
+SPOKE_ARBITRUM   = "0xe35e9842fceaca96570b734083f4a58e8f7c5f2a"
+RED              = "0x2e662015a501f066e043d64d04f77ffe551a4b07"
+WETH_BASE        = "0x4200000000000000000000000000000000000006"
+V4_KEY           = "(address,address,uint24,int24,address)"
+RED_POOL_ID      = keccak(encode(["address", "address", "uint24", "int24", "address"],
+                                 [RED, WETH_BASE, 0x800000, 200, RED_HOOK]))   # the only v4 pool
+POOL_FEES        = (500, 3000)       # tiers that have a pool on every fake chain
+RATE             = 1000              # tokenOut per tokenIn, everywhere
+RELAY_FEE        = 10**14            # Across fee in wei
+SQRT_PRICE_2000  = 3543191142285914205922034   # sqrtPriceX96 of 2000e-12: $2000 per WETH against 6-decimal USDC
+TICK_2000        = -200312                     # its tick
+
+CHAINS = {
+    "base": {
+        "chain_id": 8453,
+        "weth":    "0x4200000000000000000000000000000000000006",
+        "router":  "0x2626664c2603336e57b271c5c0b26f421741e481",
+        "quoter":  "0x3d4e44eb1374240ce5f1b871ab261cd16335b76a",
+        "factory": "0x33128a8fc17869897dce68ed026d694621f6fdfd",
+        "funds":   {"eth": 10 * 10**18, "weth": 10 * 10**18, RED: 10**24},
+    },
+    "ethereum": {
+        "chain_id": 1,
+        "weth":    "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2",
+        "router":  "0x68b3465833fb72a70ecdf485e0e4c7bd8665fc45",
+        "quoter":  "0x61ffe014ba17989e743c5f6cb21bf9697530b21e",
+        "factory": "0x1f98431c8ad98523631ae4a59f267346ea31f984",
+        "funds":   {"eth": 10 * 10**18},
+    },
+    "arbitrum": {
+        "chain_id": 42161,
+        "weth":    "0x82af49447d8a07e3bd95bd0d56f35241523fbab1",
+        "router":  "0x68b3465833fb72a70ecdf485e0e4c7bd8665fc45",
+        "quoter":  "0x61ffe014ba17989e743c5f6cb21bf9697530b21e",
+        "factory": "0x1f98431c8ad98523631ae4a59f267346ea31f984",
+        "funds":   {},                # GRT leg has to bridge
+    },
+}
+
+SCENARIOS = {
+    "balance":      ["balance", "--token", "ALL", "--address", WALLET],
+    "check-burn":   ["check-burn", "--address", WALLET],
+    "transfer":     ["transfer", "--token", "RED", "--to", BURN, "--amount", "1"],
+    "swap-v3":      ["swap", "--token-out", "WBTC", "--amount", "0.01"],
+    "swap-clanker": ["swap", "--token-out", "RED", "--amount", "0.01"],
+    "swap-bridge":  ["swap", "--token-out", "GRT", "--amount", "0.01"],
+    "allocate":     ["allocate", "--weth", "0.03", "--split", "WBTC=50,CLAWD=50"],
+    "price":        ["price", "--token", "ALL", "--twap", "600"],
+    "swap-usd":     ["swap", "--token-out", "WBTC", "--amount-usd", "25"],
+    "events":       ["events", "--address", WALLET],
+    "plan-rebalance": ["plan-rebalance", "--weth", "0.01", "--split", "GRT=50,WBTC=50", "--address", WALLET],
+    "pool":         ["pool", "--wallets", ",".join(WALLETS), "balance", "--token", "ALL"],
+}
+
+
+def sel(signature):
+    return function_signature_to_4byte_selector(signature)
+
+def topic(value):
+    return "0x" + (int(value, 16) if isinstance(value, str) else value).to_bytes(32, "big").hex()
+
+def transfer_log(token, src, dst, amount):
+    return {"address": token.lower(), "data": "0x" + amount.to_bytes(32, "big").hex(), "topics": [
+        "0x" + keccak(b"Transfer(address,address,uint256)").hex(), topic(src), topic(dst)]}
+
+def hexint(v):
+    return hex(v)
+
+
+class Revert(Exception):
+    pass
+
+
+class FakeChain:
+    """Just enough EVM for uniswap-swap.py: state changes come from decoding the calldata
+    of each raw tx the script sends, and every tx is mined into its own block at once."""
+
+    def __init__(self, name, peers):
+        cfg = CHAINS[name]
+        self.name, self.cfg, self.peers = name, cfg, peers
+        self.chain_id = cfg["chain_id"]
+        self.head     = 1_000
+        self.eth      = {w: cfg["funds"].get("eth", 0) for w in WALLETS}
+        self.bal      = {}                       # token → {owner: amount}
+        self.allow    = {}                       # (token, owner, spender) → amount
+        self.nonces   = {}
+        self.receipts = {}
+        self.logs     = []
+        self.deposits = 0
+        self.permit2  = {}                       # (owner, token, spender) → (amount, expiration, nonce)
+        self.lock     = threading.RLock()
+        for wallet in WALLETS:
+            if cfg["funds"].get("weth"):
+                self.credit(cfg["weth"], wallet, cfg["funds"]["weth"])
+            for token, amount in cfg["funds"].items():
+                if token.startswith("0x"):
+                    self.credit(token, wallet, amount)
+
+    def credit(self, token, owner, amount):
+        book = self.bal.setdefault(token.lower(), {})
+        book[owner] = book.get(owner, 0) + amount
+
+    def debit(self, token, owner, amount):
+        book = self.bal.setdefault(token.lower(), {})
+        if book.get(owner, 0) < amount:
+            raise Revert("insufficient balance")
+        book[owner] -= amount
+
+    def pool(self, a, b, fee):
+        return "0x" + keccak(f"{self.name}{min(a, b)}{max(a, b)}{fee}".encode())[-20:].hex()
+
+    # ── eth_call ────────────────────────────────────────────────────────────
+    def call(self, to, data):
+        to, fn, args = to.lower(), data[:4], data[4:]
+        if to == MULTICALL3:
+            if fn == sel("aggregate3((address,bool,bytes)[])"):
+                (calls,) = decode(["(address,bool,bytes)[]"], args)
+                out = []
+                for target, _, cd in calls:
+                    try:
+                        out.append((True, self.call(target, cd)))
+                    except Revert:
+                        out.append((False, b""))
+                return encode(["(bool,bytes)[]"], [out])
+            if fn == sel("getEthBalance(address)"):
+                return encode(["uint256"], [self.eth.get(decode(["address"], args)[0].lower(), 0)])
+            if fn == sel("getBlockNumber()"):
+                return encode(["uint256"], [self.head])
+        if to == self.cfg["quoter"] and fn == sel("quoteExactInputSingle((address,address,uint256,uint24,uint160))"):
+            (tin, tout, amount, fee, _), = decode(["(address,address,uint256,uint24,uint160)"], args)
+            if fee not in POOL_FEES:
+                raise Revert("no pool")
+            return encode(["uint256", "uint160", "uint32", "uint256"], [amount * RATE * fee // 3000, 2**96, 1, 90_000])
+        if to == self.cfg["factory"] and fn == sel("getPool(address,address,uint24)"):
+            a, b, fee = decode(["address", "address", "uint24"], args)
+            return encode(["address"], [self.pool(a, b, fee) if fee in POOL_FEES else "0x" + "00" * 20])
+        if to == PERMIT2 and fn == sel("allowance(address,address,address)"):
+            owner, token, spender = (a.lower() for a in decode(["address", "address", "address"], args))
+            return encode(["uint160", "uint48", "uint48"], [*self.permit2.get((owner, token, spender), (0, 0, 0))])
+        if to == STATE_VIEW and fn == sel("getLiquidity(bytes32)"):
+            return encode(["uint128"], [10**20 if decode(["bytes32"], args)[0] == RED_POOL_ID else 0])
+        if to == FEE_LOCKER and fn == sel("availableFees(address,address)"):
+            return encode(["uint256"], [0])
+        if to == STATE_VIEW and fn == sel("getSlot0(bytes32)"):
+            return encode(["uint160", "int24", "uint24", "uint24"], [2**96 if decode(["bytes32"], args)[0] == RED_POOL_ID else 0, 0, 0, 0])
+        # v3 pools: every pool sits at WETH/USDC's $2000 (1 token0 = 2000e-12 token1) with a flat oracle
+        if fn == sel("slot0()"):
+            return encode(["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"],
+                          [SQRT_PRICE_2000, TICK_2000, 0, 1, 1, 0, True])
+        if fn == sel("liquidity()"):
+            return encode(["uint128"], [10**20])
+        if fn == sel("observe(uint32[])"):
+            (ago,) = decode(["uint32[]"], args)
+            return encode(["int56[]", "uint160[]"], [[-TICK_2000 * a for a in ago], [0] * len(ago)])
+        if to == V4_QUOTER and fn == sel(f"quoteExactInputSingle(({V4_KEY},bool,uint128,bytes))"):
+            (key, _, amount, _), = decode([f"({V4_KEY},bool,uint128,bytes)"], args)
+            if keccak(encode([V4_KEY], [key])) != RED_POOL_ID:
+                raise Revert("pool not initialized")
+            return encode(["uint256", "uint256"], [amount * RATE, 140_000])
+        if fn == sel("balanceOf(address)"):
+            return encode(["uint256"], [self.bal.get(to, {}).get(decode(["address"], args)[0].lower(), 0)])
+        if fn == sel("allowance(address,address)"):
+            owner, spender = (a.lower() for a in decode(["address", "address"], args))
+            return encode(["uint256"], [self.allow.get((to, owner, spender), 0)])
+        if fn == sel("totalSupply()"):
+            return encode(["uint256"], [10**27])
+        if fn == sel("decimals()"):
+            return encode(["uint8"], [18])
+        if fn == sel("symbol()"):
+            return encode(["string"], ["TKN"])
+        raise Revert(f"unknown call {to} {fn.hex()}")
+
+    # ── transactions ────────────────────────────────────────────────────────
+    def send(self, raw):
+        tx     = TypedTransaction.from_bytes(HexBytes(raw)).as_dict()
+        sender = Account.recover_transaction(raw).lower()
+        if tx["nonce"] != self.nonces.get(sender, 0):
+            raise ValueError(f"nonce too low: have {self.nonces.get(sender, 0)}, got {tx['nonce']}")
+        self.nonces[sender] = tx["nonce"] + 1
+        self.head += 1
+        tx_hash = "0x" + keccak(raw).hex()
+        to = "0x" + bytes(tx.get("to") or b"").hex()
+        logs, status = [], 1
+        try:
+            self.apply(sender, to, tx.get("value", 0), bytes(tx.get("data", b"")), logs)
+        except Revert:
+            status, logs = 0, []
+        block_hash = "0x" + keccak(f"{self.name}{self.head}".encode()).hex()
+        for i, lg in enumerate(logs):
+            lg.update(blockNumber=hexint(self.head), blockHash=block_hash, transactionHash=tx_hash,
+                      transactionIndex="0x0", logIndex=hexint(i), removed=False)
+        self.logs.extend(logs)
+        self.receipts[tx_hash] = {
+            "transactionHash": tx_hash, "transactionIndex": "0x0", "blockNumber": hexint(self.head),
+            "blockHash": block_hash, "from": sender, "to": to, "status": hexint(status),
+            "gasUsed": hexint(min(tx["gas"], 120_000)), "cumulativeGasUsed": hexint(120_000),
+            "effectiveGasPrice": hexint(10**7), "contractAddress": None, "type": "0x2",
+            "logs": logs, "logsBloom": "0x" + "00" * 256,
+        }
+        return tx_hash
+
+    def apply(self, sender, to, value, data, logs):
+        if self.eth.get(sender, 0) < value:
+            raise Revert("insufficient ETH")
+        self.eth[sender] = self.eth.get(sender, 0) - value
+        fn, args = data[:4], data[4:]
+        weth = self.cfg["weth"]
+        if to == weth and fn == sel("deposit()"):
+            self.credit(weth, sender, value)
+        elif to == weth and fn == sel("withdraw(uint256)"):
+            (wad,) = decode(["uint256"], args)
+            self.debit(weth, sender, wad)
+            self.eth[sender] += wad
+        elif fn == sel("approve(address,uint256)"):
+            spender, amount = decode(["address", "uint256"], args)
+            self.allow[(to, sender, spender.lower())] = amount
+            logs.append({"address": to, "data": "0x" + amount.to_bytes(32, "big").hex(), "topics": [
+                "0x" + keccak(b"Approval(address,address,uint256)").hex(), topic(sender), topic(spender)]})
+        elif fn == sel("transfer(address,uint256)"):
+            dest, amount = decode(["address", "uint256"], args)
+            self.debit(to, sender, amount)
+            self.credit(to, dest.lower(), amount)
+        elif to == UNIVERSAL_ROUTER and fn == sel("execute(bytes,bytes[],uint256)"):
+            self.universal_router(sender, value, *decode(["bytes", "bytes[]", "uint256"], args)[:2], logs)
+        elif to == self.cfg["router"] and fn == sel("exactInputSingle((address,address,uint24,address,uint256,uint256,uint160))"):
+            (tin, tout, fee, recipient, amount, min_out, _), = decode(
+                ["(address,address,uint24,address,uint256,uint256,uint160)"], args)
+            paid_in_eth = value == amount and tin.lower() == weth
+            if not paid_in_eth and self.allow.get((tin.lower(), sender, to), 0) < amount:
+                raise Revert("STF")
+            out = amount * RATE * fee // 3000
+            if out < min_out:
+                raise Revert("Too little received")
+            if not paid_in_eth:
+                self.debit(tin, sender, amount)
+            self.credit(tout, recipient.lower(), out)
+            logs.append(transfer_log(tout, to, recipient, out))
+        elif to == SPOKE_BASE and fn == sel(
+                "depositV3(address,address,address,address,uint256,uint256,uint256,address,uint32,uint32,uint32,bytes)"):
+            (_, recipient, tin, _, amount, output, dest, *_) = decode(
+                ["address", "address", "address", "address", "uint256", "uint256", "uint256",
+                 "address", "uint32", "uint32", "uint32", "bytes"], args)
+            self.debit(tin, sender, amount)
+            self.deposits += 1
+            logs.append({"address": to, "data": "0x", "topics": [
+                "0x" + keccak(b"FundsDeposited").hex(), topic(dest), topic(self.deposits), topic(sender)]})
+            self.peers["arbitrum"].fill(self.chain_id, self.deposits, recipient.lower(), output)
+
+    def permit2_pull(self, owner, token, amount):
+        allowed, expiration, _ = self.permit2.get((owner, token, UNIVERSAL_ROUTER), (0, 0, 0))
+        if self.allow.get((token, owner, PERMIT2), 0) < amount or allowed < amount or expiration < time.time():
+            raise Revert("AllowanceExpired / insufficient Permit2 allowance")
+        self.debit(token, owner, amount)
+
+    def universal_router(self, sender, value, commands, inputs, logs):
+        """PERMIT2_PERMIT, PERMIT2_TRANSFER_FROM, WRAP_ETH, UNWRAP_WETH and a V4_SWAP of
+        [SWAP_EXACT_IN_SINGLE, SETTLE, TAKE_ALL] on RED's pool; the router's own ETH/WETH
+        must cover whatever it settles."""
+        weth = self.cfg["weth"]
+        held = {"0x" + "00" * 20: value, weth: 0}
+        for cmd, data in zip(commands, inputs):
+            if cmd == 0x0a:
+                ((token, amount, expiration, nonce), spender, _), _ = decode(
+                    ["((address,uint160,uint48,uint48),address,uint256)", "bytes"], data)
+                key = (sender, token.lower(), spender.lower())
+                if nonce != self.permit2.get(key, (0, 0, 0))[2]:
+                    raise Revert("InvalidNonce")
+                self.permit2[key] = (amount, expiration, nonce + 1)
+            elif cmd == 0x02:
+                token, _, amount = decode(["address", "address", "uint160"], data)
+                self.permit2_pull(sender, token.lower(), amount)
+                held[token.lower()] += amount
+            elif cmd in (0x0b, 0x0c):
+                _, amount = decode(["address", "uint256"], data)
+                src, dst = ("0x" + "00" * 20, weth) if cmd == 0x0b else (weth, "0x" + "00" * 20)
+                if held[src] < amount:
+                    raise Revert("InsufficientETH / InsufficientToken")
+                held[src] -= amount
+                held[dst] += amount
+            elif cmd == 0x10:
+                actions, params = decode(["bytes", "bytes[]"], data)
+                (key, _, amount, min_out, _), = decode([f"({V4_KEY},bool,uint128,uint128,bytes)"], params[0])
+                pay, _, payer_is_user = decode(["address", "uint256", "bool"], params[1])
+                if actions != bytes([0x06, 0x0b, 0x0f]) or keccak(encode([V4_KEY], [key])) != RED_POOL_ID:
+                    raise Revert("bad v4 swap")
+                if payer_is_user:
+                    self.permit2_pull(sender, pay.lower(), amount)
+                elif held.get(pay.lower(), 0) < amount:
+                    raise Revert("router can't settle")
+                else:
+                    held[pay.lower()] -= amount
+                if amount * RATE < min_out:
+                    raise Revert("V4TooLittleReceived")
+                self.credit(RED, sender, amount * RATE)
+                logs.append(transfer_log(RED, UNIVERSAL_ROUTER, sender, amount * RATE))
+            else:
+                raise Revert(f"unexpected command {cmd:#x}")
+
+    def fill(self, origin, deposit_id, recipient, output):
+        """Across relayer: pay the recipient in native ETH and log the fill."""
+        with self.lock:
+            self.head += 1
+            self.eth[recipient] = self.eth.get(recipient, 0) + output
+            self.logs.append({
+                "address": SPOKE_ARBITRUM, "data": "0x", "blockNumber": hexint(self.head),
+                "blockHash": "0x" + "11" * 32, "transactionHash": "0x" + "22" * 32, "transactionIndex": "0x0",
+                "logIndex": "0x0", "removed": False,
+                "topics": ["0x" + keccak(b"FilledRelay").hex(), topic(origin), topic(deposit_id), topic(recipient)],
+            })
+
+    # ── JSON-RPC ────────────────────────────────────────────────────────────
+    def rpc(self, method, params):
+        with self.lock:
+            if method == "eth_chainId":
+                return hexint(self.chain_id)
+            if method == "net_version":
+                return str(self.chain_id)
+            if method == "web3_clientVersion":
+                return "bench-rpc/fake"
+            if method == "eth_blockNumber":
+                return hexint(self.head)
+            if method == "eth_call":
+                return "0x" + self.call(params[0]["to"], bytes.fromhex(params[0]["data"][2:])).hex()
+            if method == "eth_getBalance":
+                return hexint(self.eth.get(params[0].lower(), 0))
+            if method == "eth_getTransactionCount":
+                return hexint(self.nonces.get(params[0].lower(), 0))
+            if method == "eth_estimateGas":
+                return hexint(150_000)
+            if method in ("eth_gasPrice", "eth_maxPriorityFeePerGas"):
+                return hexint(10**7)
+            if method == "eth_feeHistory":
+                n = int(params[0], 16) if isinstance(params[0], str) else params[0]
+                return {"oldestBlock": hexint(self.head - n + 1), "baseFeePerGas": [hexint(10**7)] * (n + 1),
+                        "gasUsedRatio": [0.5] * n, "reward": [[hexint(10**6)] * len(params[2])] * n}
+            if method == "eth_sendRawTransaction":
+                return self.send(bytes.fromhex(params[0][2:]))
+            if method == "eth_getTransactionReceipt":
+                return self.receipts.get(params[0])
+            if method == "eth_getTransactionByHash":
+                r = self.receipts.get(params[0])
+                return r and {"hash": r["transactionHash"], "blockNumber": r["blockNumber"]}
+            if method == "eth_getLogs":
+                f = params[0]
+                start = int(f["fromBlock"], 16) if str(f.get("fromBlock", "")).startswith("0x") else 0
+                end   = int(f["toBlock"], 16) if str(f.get("toBlock", "")).startswith("0x") else self.head
+                addrs = f.get("address") or []
+                addrs = {a.lower() for a in ([addrs] if isinstance(addrs, str) else addrs)}
+                want  = f.get("topics") or []
+                return [lg for lg in self.logs
+                        if (not addrs or lg["address"].lower() in addrs)
+                        and start <= int(lg["blockNumber"], 16) <= end
+                        and all(t is None or (i < len(lg["topics"]) and lg["topics"][i] in
+                                              ([t] if isinstance(t, str) else t))
+                                for i, t in enumerate(want))]
+            if method == "eth_getBlockByNumber":
+                return {"number": hexint(self.head), "hash": "0x" + "33" * 32, "baseFeePerGas": hexint(10**7),
+                        "timestamp": hexint(int(time.time())), "transactions": []}
+            raise ValueError(f"method not supported by bench-rpc: {method}")
+
+
+class Stand:
+    """The HTTP server and per-run counters."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.reset_chains()
+        self.reset_counters()
+
+    def reset_chains(self):
+        self.chains = {}
+        for name in CHAINS:
+            self.chains[name] = FakeChain(name, self.chains)
+
+    def reset_counters(self):
+        self.counters = {"http": 0, "rpc": 0, "bytes_sent": 0, "methods": {}}
+        self.counter_lock = threading.Lock()
+
+    def count(self, body_len, methods):
+        with self.counter_lock:
+            self.counters["http"] += 1
+            self.counters["bytes_sent"] += body_len
+            self.counters["rpc"] += len(methods)
+            for m in methods:
+                self.counters["methods"][m] = self.counters["methods"].get(m, 0) + 1
+
+    def handle(self, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(path)
+        parts = url.path.strip("/").split("/")
+        if parts[0] == "rpc":
+            chain = self.chains[parts[1]]
+            req = json.loads(body)
+            batch = isinstance(req, list)
+            reqs = req if batch else [req]
+            self.count(len(body), [r["method"] for r in reqs])
+            replies = []
+            for r in reqs:
+                try:
+                    replies.append({"jsonrpc": "2.0", "id": r["id"], "result": chain.rpc(r["method"], r.get("params", []))})
+                except Revert as e:
+                    replies.append({"jsonrpc": "2.0", "id": r["id"], "error": {"code": 3, "message": f"execution reverted: {e}", "data": "0x"}})
+                except Exception as e:
+                    replies.append({"jsonrpc": "2.0", "id": r["id"], "error": {"code": -32000, "message": str(e)}})
+            return 200, replies if batch else replies[0]
+        self.count(len(body), [url.path])
+        if parts[0] == "1claw" and parts[-1] == "agent-token":
+            return 200, {"access_token": "bench-token", "expires_in": 900}
+        if parts[0] == "1claw" and parts[-1] == "private-key":
+            key = TEST_KEYS.get("/".join(parts[4:]))
+            return (200, {"value": key}) if key else (404, {"error": "no such secret"})
+        if parts[0] == "across" and parts[-1] == "suggested-fees":
+            q = parse_qs(url.query)
+            now = int(time.time())
+            return 200, {"totalRelayFee": {"total": str(min(RELAY_FEE, int(q["amount"][0]) // 10))},
+                         "timestamp": str(now), "fillDeadline": str(now + 3600), "exclusivityDeadline": 0,
+                         "exclusiveRelayer": "0x" + "00" * 20}
+        return 404, {"error": "not found"}
+
+    def serve(self):
+        stand = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body):
+                code, payload = stand.handle(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self._reply(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+            def do_GET(self):
+                self._reply(b"")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+def run_scenario(stand, base_url, name, argv, runs):
+    stand.reset_chains()
+    home = tempfile.mkdtemp(prefix="bench-rpc-")
+    os.makedirs(os.path.join(home, ".openclaw"))
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("ONECLAW_", "REDBOTSTER_"))}
+    env.update({
+        "HOME": home,
+        "ONECLAW_VAULT_ID": "bench", "ONECLAW_AGENT_ID": "bench", "ONECLAW_API_KEY": "bench",
+        "ONECLAW_API_BASE": f"{base_url}/1claw",
+        "REDBOTSTER_ACROSS_API": f"{base_url}/across",
+        **{f"REDBOTSTER_RPC_{c.upper()}": f"{base_url}/rpc/{c}" for c in CHAINS},
+    })
+    samples = []
+    for i in range(runs):
+        stand.reset_counters()
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, SCRIPT] + argv, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - t0
+        try:
+            reply = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            reply = {"status": "failed", "response": proc.stderr.strip()[-300:]}
+        if reply.get("status") != "completed":
+            raise RuntimeError(f"{name} run {i + 1}: {reply.get('response')}")
+        samples.append({**stand.counters, "wall": wall})
+    cold, warm = samples[0], samples[1:] or samples
+    return {
+        "calls_cold": cold["rpc"],
+        "calls_warm": max(s["rpc"] for s in warm),
+        "http_requests": int(statistics.median(s["http"] for s in warm)),
+        "bytes_sent": int(statistics.median(s["bytes_sent"] for s in warm)),
+        "p50_ms": round(percentile([s["wall"] for s in samples], 50) * 1000, 1),
+        "p95_ms": round(percentile([s["wall"] for s in samples], 95) * 1000, 1),
+        "methods": warm[-1]["methods"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPC cost benchmark for uniswap-swap.py")
+    parser.add_argument("scenarios", nargs="*", help=f"Subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per scenario; the first is cold (default: 5)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Injected delay per HTTP request")
+    parser.add_argument("--update-baseline", action="store_true", help=f"Write call counts to {os.path.basename(BASELINE)}")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    stand = Stand(args.latency_ms / 1000)
+    base_url = stand.serve()
+    try:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+
+    results, regressions = {}, []
+    for name in args.scenarios or SCENARIOS:
+        r = results[name] = run_scenario(stand, base_url, name, SCENARIOS[name], args.runs)
+        print(f"[bench-rpc] {name:<13} calls {r['calls_cold']:>3} cold / {r['calls_warm']:>3} warm  "
+              f"http {r['http_requests']:>4}  sent {r['bytes_sent']:>7} B  "
+              f"p50 {r['p50_ms']:>7.1f} ms  p95 {r['p95_ms']:>7.1f} ms", file=sys.stderr)
+        for key in ("calls_cold", "calls_warm"):
+            limit = baseline.get(name, {}).get(key)
+            if limit is not None and r[key] > limit:
+                regressions.append(f"{name} {key} {r[key]} > baseline {limit}")
+
+    if args.update_baseline:
+        baseline.update({n: {"calls_cold": r["calls_cold"], "calls_warm": r["calls_warm"]} for n, r in results.items()})
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        regressions = []
+
+    status = "failed" if regressions else "completed"
+    response = "; ".join(regressions) or f"{len(results)} scenarios within baseline call counts"
+    print(json.dumps({"status": status, "response": response, "data": {"scenarios": results}}))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+bench-startup.py — Cold-start benchmark for uniswap-swap.py subcommands.
+
+Runs `uniswap-swap.py <command> --help` in fresh interpreters (no network, no vault),
+reports the median wall time per command and the slowest imports from
+`python -X importtime`, and fails if a heavy module sneaks back onto the startup path
+or a command gets slower than --max-ms.
+
+Usage:
+  python3 scripts/bench-startup.py                 # all commands, 7 runs each
+  python3 scripts/bench-startup.py --runs 15 --max-ms 150 swap balance
+
+Output: JSON to stdout  {"status":"completed","response":"...","data":{"commands":{...}}}
+Exit status 1 on a regression.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uniswap-swap.py")
+
+COMMANDS = ["", "swap", "allocate", "plan-rebalance", "transfer", "balance", "check-burn", "price", "events", "verify-math", "bridges", "report", "serve", "pool"]
+
+# Must not be imported just to parse arguments — each costs 100+ ms cold.
+FORBIDDEN = ("web3", "eth_account", "requests", "urllib.request")
+
+DEFAULT_MAX_MS = 250
+
+
+def run_once(command, importtime=False):
+    argv = [sys.executable] + (["-X", "importtime"] if importtime else []) + [SCRIPT]
+    argv += ([command] if command else []) + ["--help"]
+    # Empty 1claw settings: startup must not need them
+    env = {k: v for k, v in os.environ.items() if not k.startswith("ONECLAW_")}
+    t0 = time.perf_counter()
+    proc = subprocess.run(argv, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv[1:])} exited {proc.returncode}: {proc.stderr.strip()[-500:]}")
+    return elapsed, proc.stderr
+
+
+def parse_importtime(stderr):
+    """{module: cumulative µs} from -X importtime output."""
+    mods = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        mods[name.strip()] = int(cumulative)
+    return mods
+
+
+def bench(command, runs):
+    times = sorted(run_once(command)[0] for _ in range(runs))
+    _, stderr = run_once(command, importtime=True)
+    mods = parse_importtime(stderr)
+    top_level = {m: us for m, us in mods.items() if "." not in m}
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "p95_ms": round(times[min(len(times) - 1, int(0.95 * len(times)))] * 1000, 1),
+        "imports_ms": round(sum(top_level.values()) / 1000, 1),
+        "slowest_imports": [
+            {"module": m, "ms": round(us / 1000, 1)}
+            for m, us in sorted(top_level.items(), key=lambda kv: -kv[1])[:5]
+        ],
+        "forbidden": sorted(m for m in mods if m in FORBIDDEN),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for uniswap-swap.py")
+    parser.add_argument("commands", nargs="*", help="Subcommands to time (default: all, plus bare --help)")
+    parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per command (default: 7)")
+    parser.add_argument("--max-ms", type=float, default=DEFAULT_MAX_MS,
+                        help=f"Fail if a command's median exceeds this (default: {DEFAULT_MAX_MS})")
+    args = parser.parse_args()
+
+    results, regressions = {}, []
+    for command in args.commands or COMMANDS:
+        name = command or "--help"
+        r = results[name] = bench(command, args.runs)
+        print(f"[bench-startup] {name:<12} median {r['median_ms']:>7.1f} ms   imports {r['imports_ms']:>7.1f} ms",
+              file=sys.stderr)
+        if r["forbidden"]:
+            regressions.append(f"{name} imports {', '.join(r['forbidden'])} at startup")
+        if r["median_ms"] > args.max_ms:
+            regressions.append(f"{name} median {r['median_ms']} ms > {args.max_ms} ms")
+
+    status = "failed" if regressions else "completed"
+    response = "; ".join(regressions) or f"{len(results)} commands under {args.max_ms} ms, no heavy imports"
+    print(json.dumps({"status": status, "response": response, "data": {"commands": results}}))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
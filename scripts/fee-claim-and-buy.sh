@@ -8,7 +8,8 @@
 #   4. Post character-driven tweet via xurl
 #   5. Log everything to ~/RedBotster/logs/
 #
-# Usage: ./fee-claim-and-buy.sh [--dry-run]
+# Usage: ./fee-claim-and-buy.sh [--dry-run] [--force]
+#   --force   run the full flow even when the event index saw nothing cross a threshold
 
 set -euo pipefail
 
@@ -21,6 +22,7 @@ TRACKER="$HOME/RedBotster.md"
 
 BANKR="$HOME/.openclaw/workspace/skills/bankr/scripts/bankr.sh"
 SWAP_SCRIPT="$SCRIPT_DIR/uniswap-swap.py"
+SWAP_SOCKET="${REDBOTSTER_SOCKET:-$HOME/.openclaw/redbotster.sock}"  # uniswap-swap.py serve
 RED_TOKEN="0x2e662015a501f066e043d64d04f77ffe551a4b07"
 GRT_TOKEN_ARB="0x9623063377AD1B27544C965cCd7342f7EA7e88C7"    # GRT on Arbitrum
 WBTC_TOKEN_BASE="0x0555E30da8f98308EdB960aa94C0Db47230d2B9c"  # WBTC on Base
@@ -40,12 +42,14 @@ CLAWD_SPLIT_PCT=20    # % to buy CLAWD (Base)
 RED_SPLIT_PCT=20      # % to buy RED (burn only if >5% of supply)
 YARR_SPLIT_PCT=20     # % to buy YARR
 DRY_RUN=false
+FORCE=false           # skip the event-index gate (Step 0b)
 TWEET_ENABLED=false   # disabled until X posting is working
 
 # ── Parse args ────────────────────────────────────────────────────────────────
 for arg in "$@"; do
   case "$arg" in
     --dry-run) DRY_RUN=true ;;
+    --force)   FORCE=true ;;
     --tweet)   TWEET_ENABLED=true ;;
   esac
 done
@@ -76,6 +80,9 @@ fi
 mkdir -p "$LOG_DIR"
 LOGFILE="$LOG_DIR/$(date +%Y-%m-%d).log"
 TIMESTAMP="$(date -u '+%Y-%m-%dT%H:%M:%SZ')"
+# Journal key for this run's swap legs: a rerun in the same hour (or with RUN_ID set
+# to a failed run's id) resumes those legs instead of buying twice
+RUN_ID="${RUN_ID:-$(date -u '+%Y%m%dT%H')}"
 
 # log writes to stderr + logfile only — stdout is reserved for clean JSON returns
 log() {
@@ -183,16 +190,30 @@ bankr_run() {
   "$BANKR" "$prompt" 2>>"$LOGFILE" || true
 }
 
+# Run a uniswap-swap.py command — through the warm `serve` daemon if its socket is up,
+# otherwise as a one-shot process. Prints the command's JSON reply to stdout.
+swap_cli() {
+  if [ -S "$SWAP_SOCKET" ]; then
+    python3 - "$SWAP_SOCKET" "$@" <<'PY' && return
+import json, socket, sys
+s = socket.socket(socket.AF_UNIX)
+s.connect(sys.argv[1])
+s.sendall((json.dumps({"argv": sys.argv[2:]}) + "\n").encode())
+print(s.makefile().readline().strip())
+PY
+    log "swap daemon at $SWAP_SOCKET not answering — falling back to one-shot run"
+  fi
+  python3 "$SWAP_SCRIPT" "$@"
+}
+
 # Swap via Uniswap v3 (punkwallet private key — used for punkwallet ops and fee-claim fallback)
 # uniswap_swap <token-out> <amount-usd>
-# Converts USD → WETH amount using global ETH_PRICE before calling uniswap-swap.py
+# uniswap-swap.py converts USD → WETH at the on-chain WETH/USDC price
 uniswap_swap() {
   local token_out="$1" amount_usd="$2"
-  local weth_amount
-  weth_amount=$(echo "$amount_usd ${ETH_PRICE:-2000}" | awk '{printf "%.8f", $1 / $2}')
-  log "UNISWAP: swap $amount_usd USD ($weth_amount WETH) → $token_out"
+  log "UNISWAP: swap $amount_usd USD of WETH → $token_out"
   if [ "$DRY_RUN" = "true" ]; then
-    log "[DRY RUN] Would uniswap swap $weth_amount WETH → $token_out"
+    log "[DRY RUN] Would uniswap swap $amount_usd USD of WETH → $token_out"
     if [ "$token_out" = "GRT" ]; then
       echo '{"status":"completed","response":"Swapped 0.01 WETH to GRT on ethereum."}'
     elif [ "$token_out" = "WBTC" ]; then
@@ -206,7 +227,72 @@ uniswap_swap() {
     fi
     return
   fi
-  python3 "$SWAP_SCRIPT" swap --token-out "$token_out" --amount "$weth_amount" 2>>"$LOGFILE" || true
+  swap_cli swap --token-out "$token_out" --amount-usd "$amount_usd" --run-id "$RUN_ID" 2>>"$LOGFILE" || true
+}
+
+# Run several Uniswap legs in one process — Base and Arbitrum legs execute concurrently.
+# Legs too small to be worth their gas wait in the journal's batches (status "deferred")
+# uniswap_allocate <amount-usd> <split>   e.g. uniswap_allocate 5.00 "GRT=20,WBTC=20,CLAWD=20"
+# Split percentages are of <amount-usd>; prints one JSON report with .data.legs[]
+uniswap_allocate() {
+  local amount_usd="$1" split="$2"
+  log "UNISWAP: allocate $amount_usd USD of WETH → $split"
+  if [ "$DRY_RUN" = "true" ]; then
+    log "[DRY RUN] Would allocate $amount_usd USD of WETH → $split"
+    echo "$split" | tr ',' '\n' | cut -d= -f1 \
+      | jq -R '{token: ., status: "completed", response: "Swapped 0.01 WETH to \(.)."}' \
+      | jq -sc '{status: "completed", response: "Dry-run allocation", data: {legs: .}}'
+    return
+  fi
+  swap_cli allocate --amount-usd "$amount_usd" --split "$split" --batch --run-id "$RUN_ID" 2>>"$LOGFILE" || true
+}
+
+# Split that tops up only the tokens the punkwallet is short of, from plan-rebalance
+# (holdings at pool prices vs the target split); the target split itself when planning fails
+# rebalance_split <amount-usd> <split>   prints TOKEN=PCT,...
+rebalance_split() {
+  local amount_usd="$1" split="$2" plan planned
+  if [ "$DRY_RUN" = "true" ]; then
+    log "[DRY RUN] Would plan a rebalance of $amount_usd USD against $split"
+    echo "$split"
+    return
+  fi
+  plan=$(swap_cli plan-rebalance --amount-usd "$amount_usd" --split "$split" 2>>"$LOGFILE" || true)
+  planned=$(echo "$plan" | jq -r 'select(.status == "completed") | .data.split | to_entries | map("\(.key)=\(.value)") | join(",")' 2>/dev/null)
+  if [ -z "$planned" ]; then
+    log "Rebalance plan unavailable — using the fixed split"
+    echo "$split"
+    return
+  fi
+  log "Rebalance plan: $(echo "$plan" | jq -r '.response')"
+  echo "$planned"
+}
+
+# Percent a TOKEN=PCT,... split gives one token (0 when absent)
+# split_pct <split> <token>
+split_pct() {
+  echo "$1" | tr ',' '\n' | awk -F= -v t="$2" '$1 == t {p = $2} END {print p + 0}'
+}
+
+# Response text of one leg from a uniswap_allocate report
+# leg_response <report-json> <token>
+leg_response() {
+  echo "$1" | jq -r --arg t "$2" '.data.legs[]? | select(.token == $t) | .response' 2>/dev/null || echo ""
+}
+
+# Tokens one leg received (decoded from its Transfer logs), "queued" for a batched leg,
+# "$<usd> worth" when unknown, or 0 for a token the split left out
+# leg_amount <report-json> <token> <usd>
+leg_amount() {
+  local amount
+  amount=$(echo "$1" | jq -r --arg t "$2" '.data.legs[]? | select(.token == $t) | .data.amount_out // (select(.status == "deferred") | "queued")' 2>/dev/null)
+  if [ -n "$amount" ]; then
+    echo "$amount"
+  elif [ "$(echo "$3" | awk '{print ($1 <= 0) ? "yes" : "no"}')" = "yes" ]; then
+    echo "0"
+  else
+    echo "\$$3 worth"
+  fi
 }
 
 # Transfer token to address via Uniswap script
@@ -219,7 +305,7 @@ uniswap_transfer() {
     echo '{"status":"completed","response":"Sent 42000 RED to burn address. Transaction confirmed."}'
     return
   fi
-  python3 "$SWAP_SCRIPT" transfer --token "$token" --to "$to" 2>>"$LOGFILE"
+  swap_cli transfer --token "$token" --to "$to" 2>>"$LOGFILE"
 }
 
 # Swap 5% of WETH balance into treasury allocations (GRT / WBTC / RED)
@@ -228,23 +314,24 @@ weth_allocation_swap() {
   log_section "WETH 5% Allocation Swap"
   local weth_result weth_response weth_usd fallback_usd
   local fb_grt_usd fb_wbtc_usd fb_clawd_usd fb_red_usd fb_yarr_usd
-  local fb_grt_result fb_grt_response fb_grt_tokens
-  local fb_wbtc_result fb_wbtc_response fb_wbtc_tokens
-  local fb_clawd_result fb_clawd_response fb_clawd_tokens
-  local fb_red_result fb_red_response fb_red_tokens
-  local fb_yarr_result fb_yarr_response fb_yarr_tokens
-
-  # Query punkwallet WETH balance directly via Base RPC (bankr can't read external wallets)
-  local weth_contract="0x4200000000000000000000000000000000000006"
-  local rpc_data="0x70a08231000000000000000000000000${PUNKWALLET:2}"
-  local raw_balance weth_amount
-  raw_balance=$(curl -s -X POST https://mainnet.base.org \
-    -H "Content-Type: application/json" \
-    -d "{\"jsonrpc\":\"2.0\",\"method\":\"eth_call\",\"params\":[{\"to\":\"$weth_contract\",\"data\":\"$rpc_data\"},\"latest\"],\"id\":1}" \
-    | jq -r '.result' 2>/dev/null || echo "0x0")
-  weth_amount=$(python3 -c "print(int('$raw_balance', 16) / 1e18)" 2>/dev/null || echo "0")
-  weth_usd=$(echo "$weth_amount ${ETH_PRICE:-2000}" | awk '{printf "%.2f", $1 * $2}')
-  log "Punkwallet WETH: $weth_amount WETH @ \$${ETH_PRICE:-2000} = \$$weth_usd"
+  local fb_grt_response fb_grt_tokens
+  local fb_wbtc_response fb_wbtc_tokens
+  local fb_clawd_response fb_clawd_tokens
+  local fb_red_response fb_red_tokens
+  local fb_yarr_response fb_yarr_tokens
+
+  # Query punkwallet WETH balance via uniswap-swap.py (pooled Base RPCs with failover;
+  # bankr can't read external wallets). WETH already queued in allocation batches is
+  # left out, so a deferred run doesn't count it again.
+  local weth_amount
+  weth_amount=$(swap_cli balance --token WETH 2>>"$LOGFILE" | jq -r '.data.WETH.free // .data.WETH.balance // 0' 2>/dev/null || echo "0")
+  weth_amount="${weth_amount:-0}"
+  if [ -z "$ETH_PRICE" ]; then
+    log "No on-chain ETH price — skipping WETH allocation swap rather than guess."
+    return
+  fi
+  weth_usd=$(echo "$weth_amount $ETH_PRICE" | awk '{printf "%.2f", $1 * $2}')
+  log "Punkwallet WETH (not batched): $weth_amount WETH @ \$$ETH_PRICE = \$$weth_usd"
 
   if [ -z "$weth_usd" ] || [ "$(echo "$weth_usd" | awk '{print ($1 <= 0) ? "yes" : "no"}')" = "yes" ]; then
     log "Punkwallet WETH balance is zero — skipping WETH allocation swap."
@@ -259,39 +346,42 @@ weth_allocation_swap() {
     return
   fi
 
-  fb_grt_usd=$(pct_of "$fallback_usd" "$GRT_SPLIT_PCT")
-  fb_wbtc_usd=$(pct_of "$fallback_usd" "$WBTC_SPLIT_PCT")
-  fb_clawd_usd=$(pct_of "$fallback_usd" "$CLAWD_SPLIT_PCT")
-  fb_red_usd=$(pct_of "$fallback_usd" "$RED_SPLIT_PCT")
-  fb_yarr_usd=$(pct_of "$fallback_usd" "$YARR_SPLIT_PCT")
+  # Buy only what the holdings are short of — often one or two legs instead of five
+  local split
+  split=$(rebalance_split "$fallback_usd" "GRT=$GRT_SPLIT_PCT,WBTC=$WBTC_SPLIT_PCT,CLAWD=$CLAWD_SPLIT_PCT,RED=$RED_SPLIT_PCT,YARR=$YARR_SPLIT_PCT")
+
+  fb_grt_usd=$(pct_of "$fallback_usd" "$(split_pct "$split" GRT)")
+  fb_wbtc_usd=$(pct_of "$fallback_usd" "$(split_pct "$split" WBTC)")
+  fb_clawd_usd=$(pct_of "$fallback_usd" "$(split_pct "$split" CLAWD)")
+  fb_red_usd=$(pct_of "$fallback_usd" "$(split_pct "$split" RED)")
+  fb_yarr_usd=$(pct_of "$fallback_usd" "$(split_pct "$split" YARR)")
   log "Split: \$$fallback_usd → GRT: \$$fb_grt_usd | WBTC: \$$fb_wbtc_usd | CLAWD: \$$fb_clawd_usd | RED: \$$fb_red_usd | YARR: \$$fb_yarr_usd"
 
-  # All punkwallet swaps go directly through uniswap-swap.py (private key from 1claw vault)
-  fb_grt_result=$(uniswap_swap "GRT" "$fb_grt_usd")
-  fb_grt_response=$(echo "$fb_grt_result" | jq -r '.response // ""' 2>/dev/null || echo "")
+  # All punkwallet legs go through one allocate call (private key from 1claw vault);
+  # the GRT leg on Arbitrum runs alongside the Base legs. RED and YARR are Clanker
+  # tokens, bought directly on their Uniswap v4 pools.
+  local alloc_result
+  alloc_result=$(uniswap_allocate "$fallback_usd" "$split")
+
+  fb_grt_response=$(leg_response "$alloc_result" "GRT")
   log "WETH→GRT: $fb_grt_response"
-  fb_grt_tokens=$(echo "$fb_grt_response" | grep -oiE '[0-9]+(\.[0-9]+)?\s*GRT' | head -1 | grep -oE '[0-9]+(\.[0-9]+)?' || echo "\$$fb_grt_usd worth")
+  fb_grt_tokens=$(leg_amount "$alloc_result" "GRT" "$fb_grt_usd")
 
-  fb_wbtc_result=$(uniswap_swap "WBTC" "$fb_wbtc_usd")
-  fb_wbtc_response=$(echo "$fb_wbtc_result" | jq -r '.response // ""' 2>/dev/null || echo "")
+  fb_wbtc_response=$(leg_response "$alloc_result" "WBTC")
   log "WETH→WBTC: $fb_wbtc_response"
-  fb_wbtc_tokens=$(echo "$fb_wbtc_response" | grep -oiE '[0-9]+(\.[0-9]+)?\s*WBTC' | head -1 | grep -oE '[0-9]+(\.[0-9]+)?' || echo "\$$fb_wbtc_usd worth")
+  fb_wbtc_tokens=$(leg_amount "$alloc_result" "WBTC" "$fb_wbtc_usd")
 
-  fb_clawd_result=$(uniswap_swap "CLAWD" "$fb_clawd_usd")
-  fb_clawd_response=$(echo "$fb_clawd_result" | jq -r '.response // ""' 2>/dev/null || echo "")
+  fb_clawd_response=$(leg_response "$alloc_result" "CLAWD")
   log "WETH→CLAWD: $fb_clawd_response"
-  fb_clawd_tokens=$(echo "$fb_clawd_response" | grep -oiE '[0-9,]+(\.[0-9]+)?\s*CLAWD' | head -1 | grep -oE '[0-9,]+(\.[0-9]+)?' | tr -d ',' || echo "\$$fb_clawd_usd worth")
+  fb_clawd_tokens=$(leg_amount "$alloc_result" "CLAWD" "$fb_clawd_usd")
 
-  # RED and YARR are Clanker tokens — route through bankr, not Uniswap v3
-  fb_red_result=$(bankr_run "Buy exactly \$$fb_red_usd worth of RED ($RED_TOKEN) on Base using WETH. Execute via Clanker pool without asking for confirmation.")
-  fb_red_response=$(echo "$fb_red_result" | jq -r '.response // ""' 2>/dev/null || echo "$fb_red_result")
+  fb_red_response=$(leg_response "$alloc_result" "RED")
   log "WETH→RED: $fb_red_response"
-  fb_red_tokens=$(echo "$fb_red_response" | grep -oiE '[0-9,]+(\.[0-9]+)?\s*RED' | head -1 | grep -oE '[0-9,]+(\.[0-9]+)?' | tr -d ',' || echo "\$$fb_red_usd worth")
+  fb_red_tokens=$(leg_amount "$alloc_result" "RED" "$fb_red_usd")
 
-  fb_yarr_result=$(bankr_run "Buy exactly \$$fb_yarr_usd worth of YARR ($YARR_TOKEN_BASE) on Base using WETH. YARR is a Clanker token. Execute without asking for confirmation.")
-  fb_yarr_response=$(echo "$fb_yarr_result" | jq -r '.response // ""' 2>/dev/null || echo "$fb_yarr_result")
+  fb_yarr_response=$(leg_response "$alloc_result" "YARR")
   log "WETH→YARR: $fb_yarr_response"
-  fb_yarr_tokens=$(echo "$fb_yarr_response" | grep -oiE '[0-9]+(\.[0-9]+)?\s*YARR' | head -1 | grep -oE '[0-9]+(\.[0-9]+)?' || echo "\$$fb_yarr_usd worth")
+  fb_yarr_tokens=$(leg_amount "$alloc_result" "YARR" "$fb_yarr_usd")
 
   update_tracker "WETH 5% swap (\$$fallback_usd): ${fb_grt_tokens} GRT | ${fb_wbtc_tokens} WBTC | ${fb_clawd_tokens} CLAWD | ${fb_red_tokens} RED | ${fb_yarr_tokens} YARR"
   log "WETH swap complete — GRT: ${fb_grt_tokens} | WBTC: ${fb_wbtc_tokens} | CLAWD: ${fb_clawd_tokens} | RED: ${fb_red_tokens} | YARR: ${fb_yarr_tokens}"
@@ -336,10 +426,41 @@ update_tracker() {
   fi
 }
 
-# ── Fetch ETH price once (used for USD→WETH conversions throughout) ───────────
-ETH_PRICE=$(curl -s "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd" \
-  | jq -r '.ethereum.usd' 2>/dev/null || echo "2000")
-log "ETH price: \$$ETH_PRICE"
+# ── ETH price from the Base WETH/USDC pool (cached a minute for the swaps below) ─
+ETH_PRICE=$(swap_cli price --token ETH 2>>"$LOGFILE" | jq -r '.data.ETH.usd // empty' 2>/dev/null \
+  | awk '{printf "%.2f", $1}' || true)
+log "ETH price: \$${ETH_PRICE:-unavailable}"
+
+# ── Step 0: Finish swaps queued behind Across bridges from earlier runs ───────
+if [ "$DRY_RUN" = "true" ]; then
+  log "[DRY RUN] Would run swaps queued behind landed Across bridges"
+else
+  BRIDGES_RESULT=$(swap_cli bridges 2>>"$LOGFILE" || true)
+  log "Bridges: $(echo "$BRIDGES_RESULT" | jq -r '.response // "check failed"' 2>/dev/null)"
+fi
+
+# ── Step 0b: Anything to do? Fee-locker and wallet events since the last run ──
+# One log query when idle. claim is null without feeOwner in config.json or when the
+# scan failed — both fall through to the full bankr check.
+if [ "$FORCE" = "false" ] && [ "$DRY_RUN" = "false" ]; then
+  EVENTS_RESULT=$(swap_cli events 2>>"$LOGFILE" || true)
+  log "Events: $(echo "$EVENTS_RESULT" | jq -r '.response // "scan failed"' 2>/dev/null)"
+  EV_CLAIM=$(echo "$EVENTS_RESULT" | jq -r '.data.claim' 2>/dev/null || echo "null")
+  EV_ALLOCATE=$(echo "$EVENTS_RESULT" | jq -r '.data.allocate' 2>/dev/null || echo "null")
+  if [ "$EV_CLAIM" = "false" ] && [ "$EV_ALLOCATE" = "false" ]; then
+    log_section "DONE (idle — no fee or WETH threshold crossed)"
+    exit 0
+  fi
+  if [ "$EV_CLAIM" = "false" ] && [ "$EV_ALLOCATE" = "true" ]; then
+    log "Fees below \$$MIN_THRESHOLD but WETH arrived — sweeping RED and running WETH 5% allocation swap"
+    sweep_red
+    weth_allocation_swap
+    update_tracker "WETH arrived, fees below threshold — RED swept + WETH 5% allocation swap run"
+    write_run_summary "no-fees" "0" "-" "-" "-" "-" "-" "5% of WETH" "-"
+    log_section "DONE (allocation only)"
+    exit 0
+  fi
+fi
 
 # ── Step 1: Check current fee balance ─────────────────────────────────────────
 log_section "Step 1: Check Clanker fee balance"
@@ -536,7 +657,7 @@ BURN_RESPONSE="Accumulating RED — burn threshold not reached"
 if [ "$DRY_RUN" = "true" ]; then
   log "[DRY RUN] Would check RED burn threshold — skipping"
 else
-  THRESHOLD_CHECK=$(python3 "$SWAP_SCRIPT" check-burn 2>/dev/null || echo '{"data":{"eligible":false}}')
+  THRESHOLD_CHECK=$(swap_cli check-burn 2>/dev/null || echo '{"data":{"eligible":false}}')
   BURN_ELIGIBLE=$(echo "$THRESHOLD_CHECK" | jq -r '.data.eligible // false' 2>/dev/null || echo "false")
   BURN_PCT=$(echo "$THRESHOLD_CHECK" | jq -r '.data.pct // 0' 2>/dev/null || echo "0")
   log "RED burn eligibility: $BURN_ELIGIBLE (holding ${BURN_PCT}% of supply)"
@@ -3,24 +3,60 @@
 uniswap-swap.py — Swap or transfer tokens via Uniswap v3 using punkwallet from 1claw vault.
 
 Commands:
-  swap      --token-in WETH|USDC --token-out RED|GRT|WBTC --amount X
+  swap      --token-in WETH|USDC --token-out RED|GRT|WBTC|0xCLANKER_TOKEN --amount X|--amount-usd X [--run-id ID]
+  allocate  --weth X|--amount-usd X [--split RED=20,GRT=20,...] [--rebalance] [--batch] [--run-id ID]   (one report per leg; chains run concurrently)
+  plan-rebalance --weth X|--amount-usd X [--split ...] [--tolerance-pct P] [--address 0x...]   (fewest buys to reach the split)
   transfer  --token RED|GRT|WBTC --to 0xADDRESS [--amount all|X]
-  balance   --token RED|GRT|WBTC|WETH|USDC|ALL
-  check-burn-threshold   (returns whether RED balance > 10% of total supply)
+  balance   --token RED|GRT|WBTC|WETH|USDC|ALL [--address 0x...] [--watch N]
+  check-burn [--address 0x...] [--watch N]   (whether RED balance > 5% of total supply)
+  price     [--token ETH|ALL|RED|...] [--twap SECONDS]   (USD prices from Uniswap pools)
+  events    [--cursor NAME] [--address 0x...] [--follow N]   (fee-locker / wallet logs since the last scan)
+  verify-math [--amount X] [--record FILE]   (off-chain v3 engine vs QuoterV2 at the same block)
+  bridges   (run swaps queued behind Across bridges that have landed on Arbitrum)
+  report    [--token X] [--days N] [--limit N]   (history and cost basis from the journal)
+  serve     [--socket PATH]   (long-lived daemon, JSON lines over a Unix socket)
+  pool      [--workers N] --wallets W1,W2,... COMMAND [ARGS]  |  --jobs FILE   (many wallets, one process)
 
 Output: JSON to stdout  {"status":"completed","response":"...","tx":"0x..."}
 Logs:   stderr only
+
+Daemon protocol: one JSON object per line, one JSON reply per line.
+  {"argv": ["swap", "--token-out", "GRT", "--amount", "0.01"]}
+  {"command": "balance", "token": "ALL"}
 """
 
 import argparse
+import contextvars
+import functools
+import importlib
 import json
 import os
 import sys
+import threading
 import time
-import urllib.request
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from eth_account import Account
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+
+
+class _Lazy:
+    """Stand-in for a heavy import, resolved on first attribute access or call — so
+    --help and paths that never touch a chain don't pay for loading web3.
+    (requests, eth_account and the web3 extras are imported inside the functions that use them.)"""
+
+    def __init__(self, module, name):
+        self._module, self._name, self._obj = module, name, None
+
+    def _load(self):
+        if self._obj is None:
+            self._obj = getattr(importlib.import_module(self._module), self._name)
+        return self._obj
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+Web3 = _Lazy("web3", "Web3")
 
 # ── 1claw config (loaded from environment or ~/.openclaw/redbotster.env) ──────
 def _load_env_file():
@@ -35,17 +71,46 @@ def _load_env_file():
 
 _load_env_file()
 
-VAULT_ID  = os.environ["ONECLAW_VAULT_ID"]
-AGENT_ID  = os.environ["ONECLAW_AGENT_ID"]
-API_KEY   = os.environ["ONECLAW_API_KEY"]
-API_BASE  = "https://api.1claw.xyz/v1"
+API_BASE  = os.environ.get("ONECLAW_API_BASE", "https://api.1claw.xyz/v1")
+
+ONECLAW_TIMEOUT    = float(os.environ.get("ONECLAW_TIMEOUT", "10"))   # seconds per vault request
+ONECLAW_RETRIES    = int(os.environ.get("ONECLAW_RETRIES", "2"))      # extra attempts on network/5xx errors
+ONECLAW_TOKEN_TTL  = 900   # seconds, when the token response carries no expires_in
+ONECLAW_TOKEN_FILE = os.path.expanduser("~/.openclaw/redbotster.token")  # agent token only — never the key
+WALLET_SECRET      = "punkwallet/private-key"   # vault secret signing for commands run without a wallet
+POOL_WORKERS       = 4                          # `pool`: wallets worked on at once
+
+STATE_CACHE_FILE = os.path.expanduser("~/.openclaw/redbotster.state.json")  # allowances, token metadata, pools
+STATE_TTL = {            # seconds before a cached entry is re-read on-chain
+    "allowance": 6 * 3600,
+    "no_pool":   24 * 3600,   # a pair with no pool on a tier may get one later
+    "tiers":     24 * 3600,   # fee tiers that quoted last time
+    "price":     60,          # pool prices, so back-to-back runs share one read
+    "gas":       7 * 86400,   # learned gas limits, renewed by every receipt that uses one
+}
+
+# Runs, legs, txs and fills (SQLite) — resume after a crash, `report`
+JOURNAL_FILE = os.environ.get("REDBOTSTER_JOURNAL", os.path.expanduser("~/.openclaw/redbotster.journal.sqlite"))
+
+# Metrics sink: JSONL (one line per command), or a Prometheus textfile if the path ends in .prom
+METRICS_FILE = os.environ.get("REDBOTSTER_METRICS")
+
+CONFIG_FILE    = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+DEFAULT_SOCKET = os.environ.get("REDBOTSTER_SOCKET", os.path.expanduser("~/.openclaw/redbotster.sock"))
 
 # ── Chain config ───────────────────────────────────────────────────────────────
 CHAINS = {
     "base": {
         "chain_id": 8453,
-        "rpc": "https://base-rpc.publicnode.com",
+        "rpcs": ["https://base-rpc.publicnode.com", "https://mainnet.base.org", "https://base.llamarpc.com"],
         "router": "0x2626664c2603336E57B271c5C0b26F421741e481",  # SwapRouter02
+        "quoter": "0x3d4e44Eb1374240CE5F1B871ab261CD16335B76a",  # QuoterV2
+        "factory": "0x33128a8fC17869897dcE68Ed026d694621f6FDfD", # UniswapV3Factory
+        "block_time": 2,
+        "gas_reserve": 3 * 10**15, # wei of native ETH kept for gas when wrapping
+        "min_tip": 10**6,          # wei — floor under the fee-history tip
+        "confirmations": 1,        # receipt depth before a tx counts as confirmed
+        "gas_cache": True,         # reuse gas limits from past receipts
         "usdc":   "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
         "weth":   "0x4200000000000000000000000000000000000006",
         "usdc_decimals": 6,
@@ -53,8 +118,15 @@ CHAINS = {
     },
     "ethereum": {
         "chain_id": 1,
-        "rpc": "https://ethereum.publicnode.com",
+        "rpcs": ["https://ethereum.publicnode.com", "https://eth.llamarpc.com", "https://cloudflare-eth.com"],
         "router": "0x68b3465833fb72A70ecDF485E0e4C7bD8665Fc45",  # SwapRouter02
+        "quoter": "0x61fFE014bA17989E743c5F6cB21bF9697530B21e",  # QuoterV2
+        "factory": "0x1F98431c8aD98523631AE4a59f267346ea31F984", # UniswapV3Factory
+        "block_time": 12,
+        "gas_reserve": 3 * 10**15,
+        "min_tip": 5 * 10**7,
+        "confirmations": 2,
+        "gas_cache": True,
         "usdc":   "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
         "weth":   "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
         "usdc_decimals": 6,
@@ -62,8 +134,15 @@ CHAINS = {
     },
     "arbitrum": {
         "chain_id": 42161,
-        "rpc": "https://arbitrum.publicnode.com",
+        "rpcs": ["https://arbitrum.publicnode.com", "https://arb1.arbitrum.io/rpc", "https://arbitrum.llamarpc.com"],
         "router": "0x68b3465833fb72A70ecDF485E0e4C7bD8665Fc45",  # SwapRouter02
+        "quoter": "0x61fFE014bA17989E743c5F6cB21bF9697530B21e",  # QuoterV2
+        "factory": "0x1F98431c8aD98523631AE4a59f267346ea31F984", # UniswapV3Factory
+        "block_time": 0.25,
+        "gas_reserve": 5 * 10**14,
+        "min_tip": 0,
+        "confirmations": 1,
+        "gas_cache": False,        # gas limit carries a varying L1 component — always estimate
         "usdc":   "0xaf88d065e77c8cC2239327C5EDb3A432268e5831",
         "weth":   "0x82aF49447D8a07e3bd95BD0d56f35241523fBab1",
         "usdc_decimals": 6,
@@ -71,15 +150,38 @@ CHAINS = {
     },
 }
 
+# Endpoint overrides: REDBOTSTER_RPC_BASE="https://a,https://b" (same for ETHEREUM / ARBITRUM)
+for _name, _cfg in CHAINS.items():
+    _override = os.environ.get(f"REDBOTSTER_RPC_{_name.upper()}")
+    if _override:
+        _cfg["rpcs"] = [u.strip() for u in _override.split(",") if u.strip()]
+
+RPC_TIMEOUT        = 10     # seconds per attempt — failover covers the rest
+RPC_HEDGE_MIN      = 0.25   # seconds before a slow read is duplicated to the next endpoint
+RPC_BREAKER_FAILS  = 3      # consecutive transport failures that open an endpoint's breaker
+RPC_BREAKER_COOL   = 30     # seconds an open endpoint sits out
+# Idempotent reads that may be hedged (sent to a second endpoint when slow)
+RPC_HEDGED_METHODS = {
+    "eth_call", "eth_getBalance", "eth_blockNumber", "eth_chainId", "eth_getTransactionCount",
+    "eth_getTransactionReceipt", "eth_getTransactionByHash", "eth_getBlockByNumber",
+    "eth_estimateGas", "eth_gasPrice", "eth_feeHistory", "eth_maxPriorityFeePerGas",
+    "eth_getLogs", "eth_getCode", "web3_clientVersion",
+}
+
 # ── Token registry ─────────────────────────────────────────────────────────────
 TOKENS = {
-    "RED":   {"chain": "base",     "address": "0x2e662015a501f066e043d64d04f77ffe551a4b07", "decimals": 18},
+    "RED":   {"chain": "base",     "address": "0x2e662015a501f066e043d64d04f77ffe551a4b07", "decimals": 18,
+              "clanker": {"hook": "0xb429d62f8f3bffb98cdb9569533ea23bf0ba28cc"}},
     "GRT":   {"chain": "arbitrum", "address": "0x9623063377AD1B27544C965cCd7342f7EA7e88C7", "decimals": 18},
     "WBTC":  {"chain": "base",     "address": "0x0555E30da8f98308EdB960aa94C0Db47230d2B9c", "decimals": 8},
-    "YARR":  {"chain": "base",     "address": "0x309792e8950405f803c0e3f2c9083bdff4466ba3", "decimals": 18},
+    "YARR":  {"chain": "base",     "address": "0x309792e8950405f803c0e3f2c9083bdff4466ba3", "decimals": 18, "clanker": {}},
     "CLAWD": {"chain": "base",     "address": "0x9f86dB9fc6f7c9408e8Fda3Ff8ce4e78ac7a6b07", "decimals": 18},
 }
 
+# "clanker": Base token that trades on its Clanker v4 pool rather than Uniswap v3. "hook"
+# pins the pool's hook; without it the hook is looked up on the Clanker factory. Any
+# Base token address passed as --token-out is treated the same way.
+
 # tokenIn options (per chain) — these are the spending tokens
 INPUTS = {
     "base": {
@@ -96,27 +198,65 @@ INPUTS = {
     },
 }
 
+FEE_TIERS           = [100, 500, 3000, 10000]   # Uniswap v3 pool fees (hundredths of a bip)
+DEFAULT_SLIPPAGE_BPS = 100                     # min output = best quote − 1%
+SWAP_GAS_OVERHEAD   = 100_000                  # router transfers/callback on top of QuoterV2's pool gas
+
+# Gas limits for txs pipelined behind an unmined prerequisite (can't be estimated yet).
+PIPELINED_GAS = {
+    "clanker_buy": 500_000,
+    "across_deposit": 200_000,
+}
+
+# Typical gasUsed per trade — what plan-rebalance charges a leg, not a gas limit.
+PLAN_GAS = {
+    "swap": 180_000,
+    "clanker_buy": 250_000,
+    "across_deposit": 120_000,
+}
+REBALANCE_TOLERANCE_PCT = 2   # a token within ± this many points of its target weight is in band
+BATCH_MAX_COST_PCT      = 3   # allocate --batch: buy a token once gas + bridge ≤ this % of the batch
+BATCH_MAX_DELAY_HOURS   = 24  # ... or once its oldest amount has waited this long
+
+# Fees: EIP-1559 params from eth_feeHistory, refreshed once per block per chain.
+FEE_HISTORY_BLOCKS = 5
+FEE_PERCENTILES    = (25, 50, 75)   # reward percentiles fetched; 50 for new txs, 75 for replacements
+GAS_LIMIT_MARGIN   = 1.3            # cached limit = max gasUsed seen × margin + pad
+GAS_LIMIT_PAD      = 25_000         # covers cold storage slots the cached run didn't touch
+EXACT_INPUT_SINGLE = "0x04e45aaf"     # SwapRouter02 exactInputSingle selector
+UR_EXECUTE         = "0x3593564c"     # Universal Router execute(bytes,bytes[],uint256) selector
+RBF_BLOCKS         = 3              # block times without a receipt before a tx is re-sent with higher fees…
+RBF_MIN_WAIT       = 15             # …but never sooner than this many seconds (0.25 s Arbitrum blocks)
+RBF_BUMP           = 1.25           # fee multiplier per replacement (nodes require ≥ 1.1)
+RBF_MAX            = 3              # replacements per tx before we just wait
+
 BURN_ADDRESS       = "0x000000000000000000000000000000000000dEaD"
 RED_BURN_THRESHOLD = 0.05   # only burn if wallet holds > 5% of total supply
 
-# ── Clanker pool config (RED trades on a custom Clanker AMM, not Uniswap v3) ──
-# RED uses the Clanker pool router at 0x21e99B… which routes through Uniswap v4 internally.
-# Pool-specific params decoded from on-chain buy transactions for RED.
-CLANKER_ROUTER = "0x21e99B325d53FE3d574ac948B9CB1519DA03E518"
-CLANKER_POOL_PARAMS = {
-    "RED": {
-        "word2":  "0x7f77bad9eb06373fe3aee84f85a9d701ff820eeb",
-        "word3":  "0x571bb664cd515b533c2fe68a23367551f6fc559d",
-        "word5":  0x0dac,  # 3500
-        "word6":  0x7d0,   # 2000
-        "word14": "0x6ff5693b99212da76ad316178a184ab56d299b43",  # Universal Router
-        "word15": "0x0d5e0f971ed27fbff6c2837bf31316121532048d",  # hook
-        "word16": 0x800000,
-        "word17": 0xc8,
-        "word18": "0xb429d62f8f3bffb98cdb9569533ea23bf0ba28cc",
-        "word19": 0x100,
-    }
+# ── Clanker tokens (Uniswap v4 pools behind a Clanker hook) ────────────────────
+# Clanker v4 launches each token into a v4 pool paired with WETH (fee = dynamic, set by
+# the hook). Buys go through the Universal Router with native ETH: WRAP_ETH into the
+# router, then one V4_SWAP (exact-in single pool, settled from the router, taken to us).
+V4_BASE = {
+    "universal_router": "0x6fF5693b99212Da76ad316178A184AB56D299b43",
+    "quoter":           "0x0d5e0F971ED27FBfF6c2837bf31316121532048D",  # V4Quoter
+    "state_view":       "0xA3c0c9b65baD0b08107Aa264b0f3dB444b867A71",  # StateView (pool reads)
 }
+CLANKER_FACTORIES   = ["0xE85A59c628F7d27878ACeB4bf3b35733630083a9"]  # Clanker v4 (tokenDeploymentInfo)
+CLANKER_TICK_SPACINGS = (200, 60)    # tried in order when finding a token's pool
+V4_DYNAMIC_FEE      = 0x800000
+NATIVE_ETH          = "0x0000000000000000000000000000000000000000"
+UR_ADDRESS_THIS     = "0x0000000000000000000000000000000000000002"  # Universal Router: "the router itself"
+UR_PERMIT2_TRANSFER_FROM, UR_PERMIT2_PERMIT = 0x02, 0x0a              # Universal Router commands
+UR_WRAP_ETH, UR_UNWRAP_WETH, UR_V4_SWAP = 0x0b, 0x0c, 0x10
+V4_SWAP_EXACT_IN_SINGLE, V4_SETTLE, V4_TAKE_ALL = 0x06, 0x0b, 0x0f     # V4Router actions
+V4_OPEN_DELTA       = 0              # SETTLE amount: whatever the swap left owed
+
+# Permit2 — the Universal Router spends our WETH through it. WETH is approved to Permit2
+# once; the router's Permit2 allowance is signed off-chain and carried in the swap tx.
+PERMIT2             = "0x000000000022D473030F116dDEE9F6B43aC78BA3"
+PERMIT2_EXPIRY      = 30 * 86400     # seconds a signed router allowance lasts
+PERMIT2_SIG_TTL     = 1800           # seconds a permit signature stays valid (and renewal margin)
 
 # ── ABIs ───────────────────────────────────────────────────────────────────────
 ERC20_ABI = [
@@ -128,6 +268,8 @@ ERC20_ABI = [
     {"name": "symbol",      "type": "function", "inputs": [], "outputs": [{"type": "string"}], "stateMutability": "view"},
     {"name": "transfer",    "type": "function", "inputs": [{"name": "to", "type": "address"}, {"name": "amount", "type": "uint256"}], "outputs": [{"type": "bool"}], "stateMutability": "nonpayable"},
 ]
+APPROVAL_TOPIC = "0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925"  # Approval(address,address,uint256)
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"  # Transfer(address,address,uint256)
 
 ROUTER_ABI = [
     {
@@ -147,9 +289,126 @@ ROUTER_ABI = [
     }
 ]
 
+# Multicall3 — same address on every chain we use
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "name": "aggregate3",
+        "type": "function",
+        "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+            {"name": "target",       "type": "address"},
+            {"name": "allowFailure", "type": "bool"},
+            {"name": "callData",     "type": "bytes"},
+        ]}],
+        "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+            {"name": "success",    "type": "bool"},
+            {"name": "returnData", "type": "bytes"},
+        ]}],
+        "stateMutability": "payable",
+    },
+    {"name": "getEthBalance", "type": "function", "inputs": [{"name": "addr", "type": "address"}], "outputs": [{"name": "balance", "type": "uint256"}], "stateMutability": "view"},
+    {"name": "getBlockNumber", "type": "function", "inputs": [], "outputs": [{"name": "blockNumber", "type": "uint256"}], "stateMutability": "view"},
+]
+
+QUOTER_V2_ABI = [
+    {
+        "name": "quoteExactInputSingle",
+        "type": "function",
+        "inputs": [{"name": "params", "type": "tuple", "components": [
+            {"name": "tokenIn",           "type": "address"},
+            {"name": "tokenOut",          "type": "address"},
+            {"name": "amountIn",          "type": "uint256"},
+            {"name": "fee",               "type": "uint24"},
+            {"name": "sqrtPriceLimitX96", "type": "uint160"},
+        ]}],
+        "outputs": [
+            {"name": "amountOut",               "type": "uint256"},
+            {"name": "sqrtPriceX96After",       "type": "uint160"},
+            {"name": "initializedTicksCrossed", "type": "uint32"},
+            {"name": "gasEstimate",             "type": "uint256"},
+        ],
+        "stateMutability": "nonpayable",
+    }
+]
+
+V3_FACTORY_ABI = [
+    {"name": "getPool", "type": "function", "inputs": [{"name": "tokenA", "type": "address"}, {"name": "tokenB", "type": "address"}, {"name": "fee", "type": "uint24"}], "outputs": [{"name": "pool", "type": "address"}], "stateMutability": "view"},
+]
+
+V3_POOL_ABI = [
+    {"name": "slot0", "type": "function", "inputs": [], "stateMutability": "view", "outputs": [
+        {"name": "sqrtPriceX96", "type": "uint160"}, {"name": "tick", "type": "int24"},
+        {"name": "observationIndex", "type": "uint16"}, {"name": "observationCardinality", "type": "uint16"},
+        {"name": "observationCardinalityNext", "type": "uint16"}, {"name": "feeProtocol", "type": "uint8"},
+        {"name": "unlocked", "type": "bool"},
+    ]},
+    {"name": "liquidity",  "type": "function", "inputs": [], "outputs": [{"type": "uint128"}], "stateMutability": "view"},
+    {"name": "observe", "type": "function", "inputs": [{"name": "secondsAgos", "type": "uint32[]"}], "stateMutability": "view", "outputs": [
+        {"name": "tickCumulatives", "type": "int56[]"}, {"name": "secondsPerLiquidityCumulativeX128s", "type": "uint160[]"},
+    ]},
+    {"name": "tickBitmap", "type": "function", "inputs": [{"name": "wordPosition", "type": "int16"}], "outputs": [{"type": "uint256"}], "stateMutability": "view"},
+    {"name": "ticks", "type": "function", "inputs": [{"name": "tick", "type": "int24"}], "stateMutability": "view", "outputs": [
+        {"name": "liquidityGross", "type": "uint128"}, {"name": "liquidityNet", "type": "int128"},
+        {"name": "feeGrowthOutside0X128", "type": "uint256"}, {"name": "feeGrowthOutside1X128", "type": "uint256"},
+        {"name": "tickCumulativeOutside", "type": "int56"}, {"name": "secondsPerLiquidityOutsideX128", "type": "uint160"},
+        {"name": "secondsOutside", "type": "uint32"}, {"name": "initialized", "type": "bool"},
+    ]},
+]
+
+V4_POOL_KEY = {"name": "poolKey", "type": "tuple", "components": [
+    {"name": "currency0",   "type": "address"},
+    {"name": "currency1",   "type": "address"},
+    {"name": "fee",         "type": "uint24"},
+    {"name": "tickSpacing", "type": "int24"},
+    {"name": "hooks",       "type": "address"},
+]}
+
+V4_QUOTER_ABI = [
+    {
+        "name": "quoteExactInputSingle",
+        "type": "function",
+        "inputs": [{"name": "params", "type": "tuple", "components": [
+            V4_POOL_KEY,
+            {"name": "zeroForOne",  "type": "bool"},
+            {"name": "exactAmount", "type": "uint128"},
+            {"name": "hookData",    "type": "bytes"},
+        ]}],
+        "outputs": [{"name": "amountOut", "type": "uint256"}, {"name": "gasEstimate", "type": "uint256"}],
+        "stateMutability": "nonpayable",
+    }
+]
+
+V4_STATE_VIEW_ABI = [
+    {"name": "getSlot0", "type": "function", "inputs": [{"name": "poolId", "type": "bytes32"}], "stateMutability": "view", "outputs": [
+        {"name": "sqrtPriceX96", "type": "uint160"}, {"name": "tick", "type": "int24"},
+        {"name": "protocolFee", "type": "uint24"}, {"name": "lpFee", "type": "uint24"},
+    ]},
+    {"name": "getLiquidity", "type": "function", "inputs": [{"name": "poolId", "type": "bytes32"}], "outputs": [{"name": "liquidity", "type": "uint128"}], "stateMutability": "view"},
+]
+
+PERMIT2_ABI = [
+    {"name": "allowance", "type": "function", "inputs": [{"name": "user", "type": "address"}, {"name": "token", "type": "address"}, {"name": "spender", "type": "address"}], "outputs": [{"name": "amount", "type": "uint160"}, {"name": "expiration", "type": "uint48"}, {"name": "nonce", "type": "uint48"}], "stateMutability": "view"},
+]
+
+UNIVERSAL_ROUTER_ABI = [
+    {"name": "execute", "type": "function", "inputs": [{"name": "commands", "type": "bytes"}, {"name": "inputs", "type": "bytes[]"}, {"name": "deadline", "type": "uint256"}], "outputs": [], "stateMutability": "payable"},
+]
+
+CLANKER_FACTORY_ABI = [
+    {"name": "tokenDeploymentInfo", "type": "function", "inputs": [{"name": "token", "type": "address"}], "stateMutability": "view", "outputs": [
+        {"name": "info", "type": "tuple", "components": [
+            {"name": "token", "type": "address"}, {"name": "hook", "type": "address"},
+            {"name": "locker", "type": "address"}, {"name": "extensions", "type": "address[]"},
+        ]},
+    ]},
+]
+
 # ── Across Protocol bridge (Base → Arbitrum) ──────────────────────────────────
-ACROSS_API          = "https://app.across.to/api"
+ACROSS_API          = os.environ.get("REDBOTSTER_ACROSS_API", "https://app.across.to/api")
 ACROSS_SPOKE_BASE   = "0x09aea4b2242abC8bb4BB78D537A67a245A7bEC64"  # SpokePool on Base
+ACROSS_SPOKE_ARBITRUM = "0xe35e9842fceaCA96570B734083f4a58e8F7C5f2A"  # SpokePool on Arbitrum (fills land here)
+BRIDGE_FILL_TIMEOUT = 360   # seconds a swap waits for its fill before leaving it queued for the next run
+BRIDGE_POLL         = 5     # seconds between fill checks
 ACROSS_BRIDGE_ABI   = [
     {
         "name": "depositV3",
@@ -173,58 +432,1366 @@ ACROSS_BRIDGE_ABI   = [
     }
 ]
 
+# ── Event index (Clanker fee locker + wallet transfers) ───────────────────────
+CLANKER_FEE_LOCKER = "0xF3622742b1E446D92e45E22923Ef11C2fcD55D68"  # Clanker v4 ClankerFeeLocker on Base
+STORE_TOKENS_TOPIC = "0xadf5da7301d0edbace5767201c524369b56f4040e2eafc873897493fc466e35d"  # StoreTokens(address,address,address,uint256,uint256)
+CLAIM_TOKENS_TOPIC = "0xf98eaa9c1f790e5c18b1f227bd5bade62600f9f3e3587c7644b90c50b9bf13c5"  # ClaimTokens(address,address,uint256)
+INDEX_CHAIN        = "base"
+INDEX_MAX_RANGE    = 2000   # blocks per eth_getLogs — public RPCs reject wider ranges
+INDEX_MAX_GAP      = 20_000 # blocks a cursor may lag before it is re-seeded from balances instead of scanned
+ALLOCATE_PCT       = 5      # share of wallet WETH an allocation run spends (fee-claim-and-buy.sh)
+CLANKER_FEE_LOCKER_ABI = [
+    {"name": "availableFees", "type": "function", "inputs": [{"name": "feeOwner", "type": "address"}, {"name": "token", "type": "address"}], "outputs": [{"type": "uint256"}], "stateMutability": "view"},
+]
+
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
+class CommandFailed(Exception):
+    """Raised by fail(); turned into a {"status":"failed"} reply by the CLI or daemon."""
+
+
 def log(msg):
-    print(f"[uniswap-swap] {msg}", file=sys.stderr)
+    thread = threading.current_thread()
+    tag = "" if thread is threading.main_thread() else f":{thread.name}"
+    print(f"[uniswap-swap{tag}] {msg}", file=sys.stderr)
 
-def out(status, response, tx=None, data=None):
+def result(status, response, tx=None, data=None):
     d = {"status": status, "response": response}
     if tx:   d["tx"] = tx
     if data: d["data"] = data
-    print(json.dumps(d))
+    return d
+
+def out(status, response, tx=None, data=None):
+    print(json.dumps(result(status, response, tx, data)), flush=True)
 
 def fail(msg):
-    out("failed", msg)
-    sys.exit(1)
+    raise CommandFailed(msg)
+
+
+class Metrics:
+    """Per-command phase spans and RPC counters, returned as data.timings and written to
+    METRICS_FILE. Shared by every thread working on the command (chain lanes, watchers)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.phases  = {}
+            self.rpcs    = {}
+
+    def phase(self, name, seconds):
+        with self._lock:
+            p = self.phases.setdefault(name, {"count": 0, "ms": 0.0})
+            p["count"] += 1
+            p["ms"] += seconds * 1000
+
+    def rpc(self, chain, method, seconds, ok=True, items=1):
+        with self._lock:
+            r = self.rpcs.setdefault(chain, {}).setdefault(method, {"count": 0, "ms": 0.0, "errors": 0})
+            r["count"] += 1
+            r["ms"] += seconds * 1000
+            r["errors"] += 0 if ok else 1
+            if method == "batch":
+                r["items"] = r.get("items", 0) + items
+
+    def snapshot(self):
+        with self._lock:
+            def rounded(d):
+                return {k: {**v, "ms": round(v["ms"], 1)} for k, v in d.items()}
+            return {
+                "total_ms": round((time.monotonic() - self.started) * 1000, 1),
+                "phases": rounded(self.phases),
+                "rpc": {chain: rounded(methods) for chain, methods in self.rpcs.items()},
+            }
+
+METRICS = Metrics()
+
+class span:
+    """`with span("vault"):` or `@span("vault")` — time one phase of the current command
+    into METRICS."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        METRICS.phase(self.name, time.monotonic() - self.t0)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with span(self.name):
+                return fn(*args, **kwargs)
+        return timed
+
+def start_command(args, argv):
+    """Reset per-command metrics and open the journal run for commands that send txs."""
+    METRICS.reset()
+    if args.command in JOURNALED_COMMANDS:
+        JOURNAL.start_run(args.command, argv, getattr(args, "run_id", None))
+
+def finish_command(command, reply):
+    """Attach data.timings to a reply, append it to the metrics sink (if configured) and
+    close the journal run."""
+    JOURNAL.end_run(reply)
+    timings = METRICS.snapshot()
+    reply.setdefault("data", {})["timings"] = timings
+    if METRICS_FILE:
+        try:
+            write_metrics(command, reply["status"], timings)
+        except OSError as e:
+            log(f"Could not write metrics to {METRICS_FILE} ({e})")
+    return reply
+
+def write_metrics(command, status, timings):
+    """JSONL (one line per command) or, for a *.prom path, a Prometheus textfile-collector
+    file holding the latest run of each command."""
+    if not METRICS_FILE.endswith(".prom"):
+        with open(METRICS_FILE, "a") as f:
+            f.write(json.dumps({"ts": int(time.time()), "command": command, "status": status,
+                                "timings": timings}) + "\n")
+        return
+    label = f'command="{command}"'
+    lines = [
+        f'redbotster_command_seconds{{{label},status="{status}"}} {timings["total_ms"] / 1000:.4f}',
+        f'redbotster_command_timestamp_seconds{{{label}}} {int(time.time())}',
+    ]
+    for phase, p in timings["phases"].items():
+        lines.append(f'redbotster_phase_seconds{{{label},phase="{phase}"}} {p["ms"] / 1000:.4f}')
+        lines.append(f'redbotster_phase_count{{{label},phase="{phase}"}} {p["count"]}')
+    for chain, methods in timings["rpc"].items():
+        for method, r in methods.items():
+            rl = f'{label},chain="{chain}",method="{method}"'
+            lines.append(f'redbotster_rpc_seconds{{{rl}}} {r["ms"] / 1000:.4f}')
+            lines.append(f'redbotster_rpc_calls{{{rl}}} {r["count"]}')
+            lines.append(f'redbotster_rpc_errors{{{rl}}} {r["errors"]}')
+    try:
+        with open(METRICS_FILE) as f:
+            kept = [l.rstrip("\n") for l in f if not l.startswith("#") and label not in l]
+    except OSError:
+        kept = []
+    header = []
+    for name, help_ in (("command_seconds", "Wall time of the last run"),
+                        ("command_timestamp_seconds", "When the last run finished"),
+                        ("phase_seconds", "Time spent in a phase during the last run"),
+                        ("phase_count", "Times a phase ran during the last run"),
+                        ("rpc_seconds", "Time spent in JSON-RPC calls during the last run"),
+                        ("rpc_calls", "JSON-RPC calls during the last run"),
+                        ("rpc_errors", "Failed JSON-RPC calls during the last run")):
+        header += [f"# HELP redbotster_{name} {help_}", f"# TYPE redbotster_{name} gauge"]
+    tmp = f"{METRICS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(header + sorted(kept + lines)) + "\n")
+    os.replace(tmp, METRICS_FILE)
+
+def load_config():
+    """Project config.json (same file the shell orchestrator reads); {} if missing."""
+    try:
+        with open(CONFIG_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def vault_request(req):
+    """urlopen with ONECLAW_TIMEOUT and ONECLAW_RETRIES (backoff on network errors and 5xx)."""
+    import urllib.error
+    import urllib.request
+    for attempt in range(ONECLAW_RETRIES + 1):
+        try:
+            return json.loads(urllib.request.urlopen(req, timeout=ONECLAW_TIMEOUT).read())
+        except urllib.error.HTTPError as e:
+            if e.code < 500 or attempt == ONECLAW_RETRIES:
+                raise
+            log(f"1claw {e.code} — retrying ({attempt + 1}/{ONECLAW_RETRIES})")
+        except (urllib.error.URLError, TimeoutError) as e:
+            if attempt == ONECLAW_RETRIES:
+                raise
+            log(f"1claw unreachable ({e}) — retrying ({attempt + 1}/{ONECLAW_RETRIES})")
+        time.sleep(0.5 * 2 ** attempt)
+
+_AGENT_TOKEN = {}
+
+def oneclaw_env(name):
+    """A required 1claw setting — checked when the vault is first used, not at import."""
+    value = os.environ.get(name)
+    if not value:
+        fail(f"{name} is not set (environment or ~/.openclaw/redbotster.env)")
+    return value
+
+def oneclaw_token(refresh=False):
+    """1claw agent access token, reused until shortly before it expires.
+
+    Cached in memory and in ONECLAW_TOKEN_FILE (0600) so one-shot runs share it too.
+    """
+    import urllib.request
+    now = time.time()
+    if not refresh and not _AGENT_TOKEN:
+        try:
+            with open(ONECLAW_TOKEN_FILE) as f:
+                _AGENT_TOKEN.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    if not refresh and _AGENT_TOKEN.get("expires_at", 0) - 60 > now:
+        return _AGENT_TOKEN["access_token"]
 
-def oneclaw_token():
     req = urllib.request.Request(
         f"{API_BASE}/auth/agent-token",
-        data=json.dumps({"agent_id": AGENT_ID, "api_key": API_KEY}).encode(),
+        data=json.dumps({"agent_id": oneclaw_env("ONECLAW_AGENT_ID"),
+                         "api_key": oneclaw_env("ONECLAW_API_KEY")}).encode(),
         headers={"Content-Type": "application/json"},
         method="POST",
     )
-    return json.loads(urllib.request.urlopen(req).read())["access_token"]
-
-def get_private_key():
-    token = oneclaw_token()
-    url = f"{API_BASE}/vaults/{VAULT_ID}/secrets/punkwallet/private-key"
-    req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
-    return json.loads(urllib.request.urlopen(req).read())["value"]
-
+    resp = vault_request(req)
+    _AGENT_TOKEN.clear()
+    _AGENT_TOKEN.update({
+        "access_token": resp["access_token"],
+        "expires_at": now + int(resp.get("expires_in") or ONECLAW_TOKEN_TTL),
+    })
+    try:
+        fd = os.open(ONECLAW_TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(_AGENT_TOKEN, f)
+    except OSError as e:
+        log(f"Could not persist 1claw token ({e}) — in-memory only")
+    return _AGENT_TOKEN["access_token"]
+
+@span("vault")
+def get_private_key(secret=WALLET_SECRET):
+    """Private key stored at `secret` — a path in ONECLAW_VAULT_ID, or "VAULT_ID:path"."""
+    import urllib.error
+    import urllib.request
+    vault, _, path = secret.rpartition(":")
+    url = f"{API_BASE}/vaults/{vault or oneclaw_env('ONECLAW_VAULT_ID')}/secrets/{path}"
+    for refresh in (False, True):
+        req = urllib.request.Request(url, headers={"Authorization": f"Bearer {oneclaw_token(refresh)}"})
+        try:
+            return vault_request(req)["value"]
+        except urllib.error.HTTPError as e:
+            if e.code != 401 or refresh:
+                raise
+            log("1claw token rejected — refreshing")
+
+# Warm state — reused across commands when running under `serve` or `pool`.
+_CONNECTIONS = {}
+_CONTRACTS   = {}
+_ACCOUNTS    = {}   # vault secret → Account
+_STATE_LOCK  = threading.Lock()
+
+# Wallet the current command acts for: a vault secret, a 0x address (read-only), or None
+# for punkwallet. Set per job by `pool`; threads a command starts inherit it.
+_WALLET = contextvars.ContextVar("wallet", default=None)
+
+def get_account():
+    """Decrypted account of the current wallet, fetched from 1claw once per process.
+
+    The key lives only in this process's memory (never on disk), so daemon, batch and
+    pool modes pay the vault round trip once per wallet.
+    """
+    wallet = _WALLET.get()
+    if wallet and wallet.startswith("0x"):
+        fail(f"Wallet {wallet} is an address — read-only, it can't sign")
+    secret = wallet or WALLET_SECRET
+    with _STATE_LOCK:
+        entry = _ACCOUNTS.setdefault(secret, {"lock": threading.Lock()})
+    with entry["lock"]:   # other wallets unlock in parallel
+        if "account" not in entry:
+            from eth_account import Account
+            log(f"Fetching private key {secret} from 1claw vault...")
+            entry["account"] = Account.from_key(get_private_key(secret))
+            log(f"Wallet: {entry['account'].address}")
+        return entry["account"]
+
+def wallet_address():
+    """Address of the current wallet when a `pool` job set one (unlocking a vault
+    wallet's key), else None."""
+    wallet = _WALLET.get()
+    if not wallet:
+        return None
+    return Web3.to_checksum_address(wallet) if wallet.startswith("0x") else get_account().address
+
+# ── Chain-state cache ─────────────────────────────────────────────────────────
+
+class ChainStateCache:
+    """Slow-changing chain state persisted in STATE_CACHE_FILE so one-shot runs skip reads
+    the previous run already did. Entries are keyed (kind, chain_id, contract, ...) and
+    carry the wall-clock time and, when known, the block they were observed at: get()
+    honours a TTL and put() never overwrites a value seen at a later block.
+
+    Several processes share the file (the daemon, cron one-shots, pools): reads reload it
+    when it changed on disk, and every write re-reads it under an flock and changes only
+    its own keys, so no process writes back a stale copy over another's entries.
+    """
+
+    def __init__(self, path):
+        self.path  = path
+        self._data = None
+        self._seen = None   # (mtime_ns, size) of the file _data was read from
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind, *parts):
+        return ":".join([kind] + [str(p).lower() for p in parts])
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _entries(self):
+        seen = self._stat()
+        if self._data is None or seen != self._seen:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {} if self._data is None else self._data
+            self._seen = seen
+        return self._data
+
+    def _mutate(self, change):
+        """Apply change(entries) to the file's current contents under an exclusive flock;
+        the file is rewritten only when change() returns true."""
+        import fcntl
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                lock = open(f"{self.path}.lock", "a")
+            except OSError as e:
+                log(f"Could not lock chain-state cache ({e}) — in-memory only")
+                change(self._entries())
+                return
+            with lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._seen = None   # whatever we hold, re-read the file under the lock
+                if change(self._entries()):
+                    self._save()
+
+    def get(self, kind, *parts, ttl=None):
+        with self._lock:
+            entry = self._entries().get(self._key(kind, *parts))
+        if entry is None or (ttl is not None and time.time() - entry["t"] > ttl):
+            return None
+        return entry["v"]
+
+    def put(self, kind, *parts, value, block=None):
+        key = self._key(kind, *parts)
+
+        def change(entries):
+            old = entries.get(key)
+            if old and block is not None and (old.get("block") or 0) > block:
+                return False
+            entries[key] = {"v": value, "t": time.time(), "block": block}
+            return True
+        self._mutate(change)
+
+    def put_max(self, kind, *parts, value):
+        """put() that keeps the larger of value and the stored one (and renews it either way)."""
+        key = self._key(kind, *parts)
+
+        def change(entries):
+            old = entries.get(key)
+            entries[key] = {"v": max(value, old["v"]) if old else value, "t": time.time(), "block": None}
+            return True
+        self._mutate(change)
+
+    def drop(self, kind, *parts):
+        key = self._key(kind, *parts)
+        self._mutate(lambda entries: entries.pop(key, None) is not None)
+
+    def values(self, kind, *parts):
+        """Every live value under (kind, *parts)."""
+        prefix = self._key(kind, *parts) + ":"
+        with self._lock:
+            return [e["v"] for k, e in self._entries().items() if k.startswith(prefix)]
+
+    def drop_allowances(self, chain_id, owner, spender):
+        """Forget every cached allowance owner → spender on a chain (any token)."""
+        prefix = self._key("allowance", chain_id) + ":"
+        suffix = ":" + self._key("", owner, spender)[1:]
+
+        def change(entries):
+            stale = [k for k in entries if k.startswith(prefix) and k.endswith(suffix)]
+            for k in stale:
+                del entries[k]
+            return bool(stale)
+        self._mutate(change)
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._data, f)
+            os.replace(tmp, self.path)
+            self._seen = self._stat()
+        except OSError as e:
+            log(f"Could not persist chain-state cache ({e}) — in-memory only")
+
+    def observe_receipt(self, chain_id, receipt):
+        """Fold our own tx's ERC20 Approval logs into the allowance entries."""
+        block = receipt["blockNumber"]
+        for entry in receipt.get("logs", []):
+            topics = entry.get("topics", [])
+            if len(topics) == 3 and topics[0] == APPROVAL_TOPIC:
+                owner, spender = ("0x" + t[-40:] for t in topics[1:])
+                value = int(entry["data"], 16) if entry["data"] not in ("0x", "") else 0
+                self.put("allowance", chain_id, entry["address"], owner, spender,
+                         value=str(value), block=block)
+
+STATE = ChainStateCache(STATE_CACHE_FILE)
+
+def cached_allowance(chain_id, token, owner, spender):
+    """Last known allowance if it is still fresh, else None (read it on-chain)."""
+    v = STATE.get("allowance", chain_id, token, owner, spender, ttl=STATE_TTL["allowance"])
+    return int(v) if v is not None else None
+
+def token_meta(w3, chain_id, token):
+    """{"symbol", "decimals"} for an ERC20 — read once, then served from the cache."""
+    meta = STATE.get("meta", chain_id, token)
+    if meta is None:
+        c = contract(w3, token, ERC20_ABI)
+        symbol, decimals = multicall(w3, [(c, "symbol", []), (c, "decimals", [])])
+        if symbol is None or decimals is None:
+            fail(f"{token} on chain {chain_id} is not an ERC20")
+        meta = {"symbol": symbol, "decimals": decimals}
+        STATE.put("meta", chain_id, token, value=meta)
+    return meta
+
+# ── Journal ────────────────────────────────────────────────────────────────────
+
+class Journal:
+    """SQLite record of runs, swap legs, txs and fills in JOURNAL_FILE.
+
+    Rows are written as things happen — a tx is on disk before we wait for it — so a
+    crash still leaves which txs went out. A leg opened with a key (run id + command +
+    token) is found again on a rerun, which then skips or resumes it instead of sending
+    new txs. Fills are the decoded ERC20 Transfer logs paying our wallet the leg's
+    output token, so `report` never re-parses logs or reply text. Batches are allocation
+    amounts waiting until one leg for their token is worth its gas. Bridges are Across
+    deposits in flight; closing one is atomic, so only one process runs its queued swap.
+
+    The open run is per context, so `pool` jobs for different wallets journal side by
+    side; their legs (and leg keys) and batches are scoped to the job's wallet.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id          INTEGER PRIMARY KEY,
+        command     TEXT NOT NULL,
+        argv        TEXT NOT NULL,
+        run_key     TEXT,
+        status      TEXT NOT NULL DEFAULT 'running',
+        response    TEXT,
+        started_at  INTEGER NOT NULL,
+        finished_at INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS legs (
+        id          INTEGER PRIMARY KEY,
+        run_id      INTEGER REFERENCES runs(id),
+        leg_key     TEXT UNIQUE,
+        chain       TEXT NOT NULL,
+        token_in    TEXT NOT NULL,
+        token_out   TEXT NOT NULL,
+        out_address TEXT NOT NULL,
+        qty_in      REAL NOT NULL,             -- token units (not wei)
+        qty_out     REAL NOT NULL DEFAULT 0,   -- sum of fills
+        out_decimals INTEGER NOT NULL,
+        status      TEXT NOT NULL,             -- planned | in_flight | queued | completed | failed
+        tx_hash     TEXT,
+        reply       TEXT,
+        created_at  INTEGER NOT NULL,
+        updated_at  INTEGER NOT NULL,
+        wallet      TEXT                       -- pool wallet; NULL for punkwallet
+    );
+    CREATE INDEX IF NOT EXISTS legs_token_time ON legs (token_out, created_at);
+    CREATE INDEX IF NOT EXISTS legs_status     ON legs (status);
+    CREATE TABLE IF NOT EXISTS txs (
+        hash        TEXT PRIMARY KEY,
+        leg_id      INTEGER REFERENCES legs(id),
+        run_id      INTEGER REFERENCES runs(id),
+        chain_id    INTEGER NOT NULL,
+        sender      TEXT NOT NULL,
+        nonce       INTEGER NOT NULL,
+        tx          TEXT NOT NULL,             -- unsigned tx JSON, enough to re-track or replace it
+        status      TEXT NOT NULL,             -- sent | mined | reverted | replaced
+        block       INTEGER,
+        gas_used    INTEGER,
+        fee_wei     TEXT,
+        sent_at     INTEGER NOT NULL,
+        mined_at    INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS txs_leg   ON txs (leg_id, status);
+    CREATE INDEX IF NOT EXISTS txs_nonce ON txs (chain_id, sender, nonce);
+    CREATE TABLE IF NOT EXISTS fills (
+        tx_hash     TEXT NOT NULL,
+        log_index   INTEGER NOT NULL,
+        leg_id      INTEGER REFERENCES legs(id),
+        token       TEXT NOT NULL,
+        amount      TEXT NOT NULL,             -- raw units
+        block       INTEGER NOT NULL,
+        PRIMARY KEY (tx_hash, log_index)
+    );
+    CREATE INDEX IF NOT EXISTS fills_leg ON fills (leg_id);
+    CREATE TABLE IF NOT EXISTS batches (
+        id          INTEGER PRIMARY KEY,
+        batch_key   TEXT UNIQUE,               -- run id + token: a rerun doesn't queue twice
+        run_id      INTEGER REFERENCES runs(id),
+        token       TEXT NOT NULL,
+        chain       TEXT NOT NULL,
+        amount_weth REAL NOT NULL,
+        queued_at   INTEGER NOT NULL,
+        leg_key     TEXT,                      -- set when a flush takes it
+        done_at     INTEGER,
+        wallet      TEXT                       -- pool wallet; NULL for punkwallet
+    );
+    CREATE INDEX IF NOT EXISTS batches_open ON batches (token, done_at);
+    CREATE TABLE IF NOT EXISTS bridges (
+        deposit_tx  TEXT PRIMARY KEY,
+        recipient   TEXT NOT NULL,
+        record      TEXT NOT NULL,             -- bridge_weth_to_arbitrum() record, with the queued swap
+        opened_at   INTEGER NOT NULL,
+        closed_at   INTEGER                    -- filled (swap handed out) or refunded
+    );
+    CREATE INDEX IF NOT EXISTS bridges_open ON bridges (recipient, closed_at);
+    """
+
+    def __init__(self, path):
+        self.path   = path
+        self._db    = None
+        self._lock  = threading.RLock()
+        self._local = threading.local()   # .leg — leg id the current thread's txs belong to
+        self._run   = contextvars.ContextVar("journal_run", default=None)
+
+    @property
+    def run_id(self):
+        return self._run.get()
+
+    @staticmethod
+    def _scoped(key):
+        wallet = _WALLET.get()
+        return f"{wallet}:{key}" if key and wallet else key
+
+    def _conn(self):
+        if self._db is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            os.close(fd)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(self.SCHEMA)
+            for table in ("legs", "batches"):
+                if "wallet" not in {r[1] for r in self._db.execute(f"PRAGMA table_info({table})")}:
+                    self._db.execute(f"ALTER TABLE {table} ADD COLUMN wallet TEXT")
+        return self._db
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return [dict(r) for r in self._conn().execute(sql, params)]
+
+    def _write(self, sql, params=()):
+        """Run one statement; a journal that can't be written is logged, never fatal —
+        by then the tx it describes may already be on-chain."""
+        import sqlite3
+        try:
+            with self._lock:
+                return self._conn().execute(sql, params).lastrowid
+        except (sqlite3.Error, OSError) as e:
+            log(f"Journal write failed ({e}): {sql.split()[0]} …")
+            return None
+
+    # runs
+    def start_run(self, command, argv, run_key=None):
+        self._run.set(self._write("INSERT INTO runs (command, argv, run_key, started_at) VALUES (?, ?, ?, ?)",
+                                  (command, json.dumps(argv), self._scoped(run_key), int(time.time()))))
+
+    def end_run(self, reply):
+        if self.run_id:
+            self._write("UPDATE runs SET status = ?, response = ?, finished_at = ? WHERE id = ?",
+                        (reply["status"], reply["response"], int(time.time()), self.run_id))
+        self._run.set(None)
+
+    # legs
+    def open_leg(self, leg_key, chain, token_in, token_out, out_address, qty_in, out_decimals):
+        """The leg row for leg_key, created (status planned) unless this run key has it."""
+        leg_key = self._scoped(leg_key)
+        if leg_key:
+            rows = self.query("SELECT * FROM legs WHERE leg_key = ?", (leg_key,))
+            if rows:
+                return rows[0]
+        now = int(time.time())
+        leg_id = self._write(
+            "INSERT INTO legs (run_id, leg_key, chain, token_in, token_out, out_address, qty_in, out_decimals,"
+            " status, created_at, updated_at, wallet) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'planned', ?, ?, ?)",
+            (self.run_id, leg_key, chain, token_in, token_out, out_address.lower(), qty_in, out_decimals, now, now,
+             _WALLET.get()))
+        return {"id": leg_id, "leg_key": leg_key, "status": "planned", "chain": chain, "token_out": token_out}
+
+    def leg(self, leg_id):
+        rows = self.query("SELECT * FROM legs WHERE id = ?", (leg_id,))
+        return rows[0] if rows else None
+
+    def close_leg(self, leg_id, status, reply):
+        self._write("UPDATE legs SET status = ?, tx_hash = COALESCE(?, tx_hash), reply = ?, updated_at = ? WHERE id = ?",
+                    (status, reply.get("tx"), json.dumps(reply), int(time.time()), leg_id))
+
+    def current_leg(self):
+        return getattr(self._local, "leg", None)
+
+    def set_leg(self, leg_id):
+        self._local.leg = leg_id
+
+    # txs
+    def tx_sent(self, pending, sender):
+        tx = pending["tx"]
+        self._write(
+            "INSERT OR REPLACE INTO txs (hash, leg_id, run_id, chain_id, sender, nonce, tx, status, sent_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, 'sent', ?)",
+            (pending["hash"], pending.get("leg"), self.run_id, tx["chainId"], sender.lower(), tx["nonce"],
+             json.dumps(tx, default=lambda v: Web3.to_hex(v)), int(time.time())))
+        if pending.get("leg"):
+            self._write("UPDATE legs SET status = 'in_flight', updated_at = ? WHERE id = ? AND status = 'planned'",
+                        (int(time.time()), pending["leg"]))
+
+    def tx_settled(self, pending, receipt, sender):
+        """Mark the mined hash (and its replaced siblings), then record the fills it paid us."""
+        tx_hash, now = receipt["transactionHash"], int(time.time())
+        fee = receipt["gasUsed"] * receipt.get("effectiveGasPrice", 0)
+        self._write("UPDATE txs SET status = ?, block = ?, gas_used = ?, fee_wei = ?, mined_at = ? WHERE hash = ?",
+                    ("mined" if receipt["status"] == 1 else "reverted", receipt["blockNumber"],
+                     receipt["gasUsed"], str(fee), now, tx_hash))
+        others = [h for h in pending["hashes"] if h != tx_hash]
+        if others:
+            self._write(f"UPDATE txs SET status = 'replaced' WHERE hash IN ({','.join('?' * len(others))})", others)
+        leg_id = pending.get("leg")
+        if not leg_id or receipt["status"] != 1:
+            return
+        leg = self.leg(leg_id)
+        for entry in receipt.get("logs", []):
+            topics = entry.get("topics", [])
+            if (len(topics) == 3 and topics[0] == TRANSFER_TOPIC and entry["address"].lower() == leg["out_address"]
+                    and int(topics[2], 16) == int(sender, 16)):
+                amount = int(entry["data"], 16)
+                self._write("INSERT OR IGNORE INTO fills (tx_hash, log_index, leg_id, token, amount, block)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (tx_hash, int(entry.get("logIndex", "0x0"), 16), leg_id, leg["token_out"],
+                             str(amount), receipt["blockNumber"]))
+                self._write("UPDATE legs SET qty_out = qty_out + ?, updated_at = ? WHERE id = ?",
+                            (amount / 10 ** leg["out_decimals"], now, leg_id))
+
+    def unsettled(self, leg_id):
+        """Txs of a leg still waiting for a receipt, grouped per (chain, nonce) as pending handles."""
+        by_nonce = {}
+        for r in self.query("SELECT * FROM txs WHERE leg_id = ? AND status = 'sent' ORDER BY sent_at", (leg_id,)):
+            p = by_nonce.setdefault((r["chain_id"], r["nonce"]), {"hashes": [], "nonce": r["nonce"], "since": None,
+                                                                  "bumps": 0, "leg": leg_id})
+            p["hashes"].append(r["hash"])
+            p.update(hash=r["hash"], tx=json.loads(r["tx"]))
+        return [by_nonce[n] for n in sorted(by_nonce)]
+
+    # batches
+    def batch_add(self, batch_key, token, chain, amount_weth):
+        self._write("INSERT OR IGNORE INTO batches (batch_key, run_id, token, chain, amount_weth, queued_at, wallet)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self._scoped(batch_key), self.run_id, token, chain, amount_weth, int(time.time()), _WALLET.get()))
+
+    def open_batches(self):
+        """{token: {"chain", "amount_weth", "since", "leg_key"}} not yet bought. A flush that
+        was started (leg_key set) is reported alone, so a retry spends the same amount."""
+        rows = self.query("SELECT * FROM batches WHERE done_at IS NULL AND wallet IS ? ORDER BY id", (_WALLET.get(),))
+        started = {}
+        for r in rows:
+            if r["leg_key"]:
+                started.setdefault(r["token"], r["leg_key"])
+        batches = {}
+        for r in rows:
+            if r["leg_key"] != started.get(r["token"]):
+                continue
+            b = batches.setdefault(r["token"], {"chain": r["chain"], "amount_weth": 0.0,
+                                                "since": r["queued_at"], "leg_key": r["leg_key"]})
+            b["amount_weth"] += r["amount_weth"]
+        return batches
+
+    def batch_take(self, token, leg_key):
+        self._write("UPDATE batches SET leg_key = ? WHERE token = ? AND wallet IS ? AND done_at IS NULL"
+                    " AND leg_key IS NULL", (leg_key, token, _WALLET.get()))
+
+    def batch_done(self, leg_key):
+        self._write("UPDATE batches SET done_at = ? WHERE leg_key = ? AND wallet IS ?",
+                    (int(time.time()), leg_key, _WALLET.get()))
+
+    def batch_release(self, leg_key):
+        """Put a failed flush's amounts back in the queue, to be re-sized with newer ones —
+        unless one of its txs is still in flight, then it stays pinned to the leg."""
+        self._write("UPDATE batches SET leg_key = NULL WHERE leg_key = ? AND wallet IS ? AND done_at IS NULL"
+                    " AND NOT EXISTS (SELECT 1 FROM txs t JOIN legs l ON t.leg_id = l.id"
+                    " WHERE l.leg_key = ? AND t.status = 'sent')",
+                    (leg_key, _WALLET.get(), self._scoped(leg_key)))
+
+    def allocated_since(self, since):
+        """Whether an allocate run has bought or batched anything for this wallet since `since`."""
+        return bool(self.query(
+            "SELECT 1 FROM legs l JOIN runs r ON l.run_id = r.id WHERE r.command = 'allocate' AND l.wallet IS ?"
+            " AND l.status IN ('completed', 'queued') AND l.created_at >= ?"
+            " UNION ALL SELECT 1 FROM batches WHERE wallet IS ? AND queued_at >= ? LIMIT 1",
+            (_WALLET.get(), since, _WALLET.get(), since)))
+
+    # bridges
+    def bridge_open(self, record):
+        self._write("INSERT OR IGNORE INTO bridges (deposit_tx, recipient, record, opened_at) VALUES (?, ?, ?, ?)",
+                    (record["deposit_tx"], record["recipient"].lower(), json.dumps(record), int(time.time())))
+
+    def bridges(self, recipient=None):
+        """Open bridge records, oldest first — every recipient's unless one is given."""
+        rows = self.query("SELECT record FROM bridges WHERE closed_at IS NULL"
+                          + (" AND recipient = ?" if recipient else "") + " ORDER BY opened_at",
+                          (recipient.lower(),) if recipient else ())
+        return [json.loads(r["record"]) for r in rows]
+
+    def bridge(self, deposit_tx):
+        """{"record", "closed_at"} for a deposit tx, open or closed; None if never recorded."""
+        rows = self.query("SELECT record, closed_at FROM bridges WHERE deposit_tx = ?", (deposit_tx,))
+        return dict(rows[0], record=json.loads(rows[0]["record"])) if rows else None
+
+    def bridge_close(self, deposit_tx):
+        """Close an open bridge; True only for the one caller that closed it."""
+        import sqlite3
+        try:
+            with self._lock:
+                return self._conn().execute("UPDATE bridges SET closed_at = ? WHERE deposit_tx = ? AND closed_at IS NULL",
+                                            (int(time.time()), deposit_tx)).rowcount == 1
+        except (sqlite3.Error, OSError) as e:
+            log(f"Journal write failed ({e}): UPDATE bridges …")
+            return False
+
+    def queued_weth(self):
+        """WETH waiting in this wallet's open batches — already spoken for."""
+        rows = self.query("SELECT COALESCE(SUM(amount_weth), 0) AS weth FROM batches"
+                          " WHERE done_at IS NULL AND wallet IS ?", (_WALLET.get(),))
+        return rows[0]["weth"]
+
+JOURNAL = Journal(JOURNAL_FILE)
+
+# ── RPC pool ───────────────────────────────────────────────────────────────────
+
+class RpcEndpoint:
+    """One URL with its own keep-alive session, latency EWMA and circuit breaker."""
+
+    def __init__(self, url):
+        import requests
+        self.url        = url
+        self.session    = requests.Session()
+        self.latency    = None   # EWMA seconds; None until first success
+        self.failures   = 0      # consecutive transport failures
+        self.open_until = 0.0    # breaker open (endpoint skipped) until this time
+        self.calls      = 0
+        self.errors     = 0
+
+    def post(self, body):
+        self.calls += 1
+        t0 = time.monotonic()
+        try:
+            resp = self.session.post(self.url, data=body, timeout=RPC_TIMEOUT,
+                                     headers={"Content-Type": "application/json"})
+            resp.raise_for_status()
+        except Exception:
+            self.errors  += 1
+            self.failures += 1
+            if self.failures >= RPC_BREAKER_FAILS:
+                self.open_until = time.monotonic() + RPC_BREAKER_COOL
+                log(f"RPC {self.url} failing — breaker open for {RPC_BREAKER_COOL}s")
+            raise
+        dt = time.monotonic() - t0
+        self.latency  = dt if self.latency is None else 0.8 * self.latency + 0.2 * dt
+        self.failures = 0
+        return resp.content
+
+    def stats(self):
+        return {"url": self.url, "latency_ms": round((self.latency or 0) * 1000, 1),
+                "calls": self.calls, "errors": self.errors,
+                "open": self.open_until > time.monotonic()}
+
+
+class PooledProvider:
+    """web3 provider over several endpoints for one chain.
+
+    Picks the fastest healthy endpoint, duplicates slow idempotent reads to the runner-up
+    (first answer wins), fails writes over in latency order and skips endpoints whose
+    breaker is open. rpc_pool() mixes it into web3's JSONBaseProvider on first use.
+    """
+
+    _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rpc-hedge")
+
+    def __init__(self, chain, urls):
+        super().__init__()
+        self.chain     = chain
+        self.endpoints = [RpcEndpoint(u) for u in urls]
+
+    def ranked(self):
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.open_until <= now] or list(self.endpoints)
+        # untried endpoints sort just after measured-fast ones so they get a chance
+        return sorted(healthy, key=lambda e: e.latency if e.latency is not None else RPC_HEDGE_MIN)
+
+    def _failover(self, body, endpoints):
+        last = None
+        for ep in endpoints:
+            try:
+                return ep.post(body)
+            except Exception as e:
+                last = e
+        raise last
+
+    def _hedged(self, body, endpoints):
+        if len(endpoints) < 2:
+            return self._failover(body, endpoints)
+        primary, backup = endpoints[0], endpoints[1]
+        delay = max(RPC_HEDGE_MIN, 3 * (primary.latency or 0))
+        futures = [self._hedge_pool.submit(primary.post, body)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            futures.append(self._hedge_pool.submit(backup.post, body))
+        last = None
+        for fut in as_completed(futures):
+            try:
+                return fut.result()
+            except Exception as e:
+                last = e
+        # Only the endpoints actually tried are skipped — a fast primary failure leaves the backup
+        rest = endpoints[len(futures):]
+        if not rest:
+            raise last
+        return self._failover(body, rest)
+
+    def make_request(self, method, params):
+        if method == "eth_chainId":
+            # web3 asks before every contract call; it's fixed per chain, so answer locally
+            return {"jsonrpc": "2.0", "id": 0, "result": hex(CHAINS[self.chain]["chain_id"])}
+        body = self.encode_rpc_request(method, params)
+        endpoints = self.ranked()
+        t0, response = time.monotonic(), None
+        try:
+            if method in RPC_HEDGED_METHODS:
+                raw = self._hedged(body, endpoints)
+            else:
+                raw = self._failover(body, endpoints)
+            response = self.decode_rpc_response(raw)
+            return response
+        finally:
+            METRICS.rpc(self.chain, method, time.monotonic() - t0,
+                        ok=isinstance(response, dict) and "error" not in response)
+
+    def make_batch_request(self, requests_):
+        body = self.encode_batch_rpc_request(requests_)
+        t0, response = time.monotonic(), None
+        try:
+            response = self.decode_rpc_response(self._failover(body, self.ranked()))
+        finally:
+            METRICS.rpc(self.chain, "batch", time.monotonic() - t0,
+                        ok=isinstance(response, list), items=len(requests_))
+        if not isinstance(response, list):
+            return response
+        return sorted(response, key=lambda r: r.get("id", 0))
+
+    def stats(self):
+        return [e.stats() for e in self.endpoints]
+
+_RPC_POOLS     = {}
+_PROVIDER_TYPE = None
+
+def rpc_pool(chain_name):
+    """Shared PooledProvider per chain — every connection to a chain reuses its sessions."""
+    global _PROVIDER_TYPE
+    if chain_name not in _RPC_POOLS:
+        if _PROVIDER_TYPE is None:
+            from web3.providers import JSONBaseProvider
+            _PROVIDER_TYPE = type("PooledProvider", (PooledProvider, JSONBaseProvider), {})
+        _RPC_POOLS[chain_name] = _PROVIDER_TYPE(chain_name, CHAINS[chain_name]["rpcs"])
+    return _RPC_POOLS[chain_name]
+
+@span("connect")
 def connect(chain_name):
-    cfg = CHAINS[chain_name]
-    w3 = Web3(Web3.HTTPProvider(cfg["rpc"], request_kwargs={"timeout": 30}))
-    if cfg.get("poa"):
-        w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-    if not w3.is_connected():
-        fail(f"Cannot connect to {chain_name} RPC")
-    return w3, cfg
-
-def bridge_weth_to_arbitrum(account, amount_wei):
-    """Bridge WETH from Base to Arbitrum via Across Protocol. Blocks until funds arrive (≤3 min)."""
-    weth_base = CHAINS["base"]["weth"]
-    weth_arb  = CHAINS["arbitrum"]["weth"]
+    with _STATE_LOCK:
+        if chain_name in _CONNECTIONS:
+            return _CONNECTIONS[chain_name]
+        cfg = CHAINS[chain_name]
+        w3 = Web3(rpc_pool(chain_name))
+        if cfg.get("poa"):
+            from web3.middleware import ExtraDataToPOAMiddleware
+            w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        # Probed once per process; afterwards endpoint health is tracked by the breakers
+        if not w3.is_connected():
+            fail(f"Cannot connect to {chain_name} RPC (tried {', '.join(cfg['rpcs'])})")
+        _CONNECTIONS[chain_name] = (w3, cfg)
+        return w3, cfg
+
+def contract(w3, address, abi):
+    """Contract object cached per (connection, address, abi)."""
+    key = (id(w3), address.lower(), id(abi))
+    if key not in _CONTRACTS:
+        _CONTRACTS[key] = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+    return _CONTRACTS[key]
+
+# ── Batched reads ──────────────────────────────────────────────────────────────
+
+def _abi_types(params):
+    return [
+        "(" + ",".join(_abi_types(p["components"])) + ")" + p["type"][len("tuple"):]
+        if p["type"].startswith("tuple") else p["type"]
+        for p in params
+    ]
+
+def _fn_abi(c, fn):
+    return next(e for e in c.abi if e.get("type") == "function" and e.get("name") == fn)
+
+def _decode_output(w3, c, fn, data):
+    values = w3.codec.decode(_abi_types(_fn_abi(c, fn)["outputs"]), data)
+    return values[0] if len(values) == 1 else tuple(values)
+
+def multicall(w3, calls, block="latest"):
+    """Run read calls [(contract, fn_name, args), ...] in one Multicall3.aggregate3 eth_call.
+
+    Returns decoded values in order; a sub-call that reverts yields None. If Multicall3
+    itself fails, falls back to a single JSON-RPC batch, then to individual calls.
+    """
+    if not calls:
+        return []
+    mc = contract(w3, MULTICALL3, MULTICALL3_ABI)
+    payload = [(c.address, True, c.encode_abi(fn, list(args))) for c, fn, args in calls]
+    try:
+        raw = mc.functions.aggregate3(payload).call(block_identifier=block)
+    except Exception as e:
+        log(f"Multicall3 failed ({e}) — falling back to JSON-RPC batch")
+        return _batch_calls(calls, block)
+    return [
+        _decode_output(w3, c, fn, data) if ok and data else None
+        for (c, fn, _), (ok, data) in zip(calls, raw)
+    ]
+
+def _batch_calls(calls, block="latest"):
+    w3 = calls[0][0].w3
+    try:
+        if block != "latest":
+            raise ValueError("batch requests can't pin a block")
+        with w3.batch_requests() as batch:
+            for c, fn, args in calls:
+                batch.add(getattr(c.functions, fn)(*args))
+            return list(batch.execute())
+    except Exception as e:
+        log(f"JSON-RPC batch failed ({e}) — reading one call at a time")
+    values = []
+    for c, fn, args in calls:
+        try:
+            values.append(getattr(c.functions, fn)(*args).call(block_identifier=block))
+        except Exception:
+            values.append(None)
+    return values
+
+def eth_balance_call(w3, address):
+    """Native ETH balance as a multicall entry (Multicall3.getEthBalance)."""
+    return (contract(w3, MULTICALL3, MULTICALL3_ABI), "getEthBalance", [Web3.to_checksum_address(address)])
+
+# ── Quoting ────────────────────────────────────────────────────────────────────
+
+_QUOTES = {}   # (chain, tokenIn, tokenOut, amountIn) → (monotonic time, quote)
+
+@span("quote")
+def quote_best(w3, chain, token_in, token_out, amount_in, slippage_bps=DEFAULT_SLIPPAGE_BPS):
+    """Quote every fee tier through QuoterV2 in one multicall and return the best, e.g.
+    {"fee": 3000, "amount_out": ..., "min_out": ..., "gas_estimate": ..., "block": ..., "tiers": {...}}.
+
+    Returns None when no tier has a pool. Quotes are reused for about one block; only
+    the tiers that quoted last time are asked again (STATE_TTL["tiers"]), falling back
+    to every tier when none of those quote.
+    """
+    cfg = CHAINS[chain]
+    key = (chain, token_in.lower(), token_out.lower(), amount_in)
+    hit = _QUOTES.get(key)
+    if hit and time.monotonic() - hit[0] < cfg["block_time"]:
+        quote = dict(hit[1])
+    else:
+        quoter = contract(w3, cfg["quoter"], QUOTER_V2_ABI)
+        mc     = contract(w3, MULTICALL3, MULTICALL3_ABI)
+        tin, tout = Web3.to_checksum_address(token_in), Web3.to_checksum_address(token_out)
+        known = STATE.get("tiers", cfg["chain_id"], tin, tout, ttl=STATE_TTL["tiers"])
+        for fees in ([known, FEE_TIERS] if known else [FEE_TIERS]):
+            calls = [(mc, "getBlockNumber", [])] + [
+                (quoter, "quoteExactInputSingle", [(tin, tout, amount_in, fee, 0)]) for fee in fees
+            ]
+            block, *values = multicall(w3, calls)
+            tiers = {fee: v for fee, v in zip(fees, values) if v and v[0] > 0}
+            if tiers:
+                break
+        if not tiers:
+            return None
+        STATE.put("tiers", cfg["chain_id"], tin, tout, value=sorted(tiers), block=block)
+        fee = max(tiers, key=lambda f: tiers[f][0])
+        quote = {
+            "fee": fee,
+            "amount_out": tiers[fee][0],
+            "gas_estimate": tiers[fee][3],
+            "block": block,
+            "tiers": {str(f): str(v[0]) for f, v in tiers.items()},
+        }
+        _QUOTES[key] = (time.monotonic(), quote)
+        quote = dict(quote)
+    quote["slippage_bps"] = slippage_bps
+    quote["min_out"] = quote["amount_out"] * (10_000 - slippage_bps) // 10_000
+    return quote
+
+# ── Uniswap v3 math (off-chain) ────────────────────────────────────────────────
+# Integer ports of v3-core TickMath / SqrtPriceMath / SwapMath and the swap loop, so
+# exact-input outputs match QuoterV2 to the wei without a round trip.
+
+MIN_TICK       = -887272
+MAX_TICK       = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+Q96            = 1 << 96
+MAX_UINT256    = (1 << 256) - 1
+TICK_SPACINGS  = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+_TICK_RATIOS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+def mul_div(a, b, d):
+    return a * b // d
+
+def mul_div_up(a, b, d):
+    return -(-a * b // d)
+
+def div_up(a, d):
+    return -(-a // d)
+
+def sqrt_ratio_at_tick(tick):
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"tick {tick} out of range")
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 1 << 128
+    for bit, mult in _TICK_RATIOS:
+        if abs_tick & bit:
+            ratio = (ratio * mult) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+def tick_at_sqrt_ratio(sqrt_price_x96):
+    if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+        raise ValueError("sqrt price out of range")
+    ratio = sqrt_price_x96 << 32
+    msb = ratio.bit_length() - 1
+    r = ratio >> (msb - 127) if msb >= 128 else ratio << (127 - msb)
+    log_2 = (msb - 128) << 64
+    for shift in range(63, 49, -1):
+        r = (r * r) >> 127
+        f = r >> 128
+        log_2 |= f << shift
+        r >>= f
+    log_sqrt10001 = log_2 * 255738958999603826347141
+    tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+    tick_hi  = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+    if tick_low == tick_hi:
+        return tick_low
+    return tick_hi if sqrt_ratio_at_tick(tick_hi) <= sqrt_price_x96 else tick_low
+
+def amount0_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    num1, num2 = liquidity << 96, sqrt_b - sqrt_a
+    if round_up:
+        return div_up(mul_div_up(num1, num2, sqrt_b), sqrt_a)
+    return mul_div(num1, num2, sqrt_b) // sqrt_a
+
+def amount1_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return mul_div_up(liquidity, sqrt_b - sqrt_a, Q96)
+    return mul_div(liquidity, sqrt_b - sqrt_a, Q96)
+
+def next_sqrt_price_from_input(sqrt_p, liquidity, amount_in, zero_for_one):
+    if amount_in == 0:
+        return sqrt_p
+    if zero_for_one:
+        # getNextSqrtPriceFromAmount0RoundingUp(add=true), incl. its overflow fallback
+        num1 = liquidity << 96
+        product = amount_in * sqrt_p
+        if product <= MAX_UINT256 and num1 + product <= MAX_UINT256:
+            return mul_div_up(num1, sqrt_p, num1 + product)
+        return div_up(num1, num1 // sqrt_p + amount_in)
+    return sqrt_p + (amount_in << 96) // liquidity
+
+def compute_swap_step(sqrt_current, sqrt_target, liquidity, amount_remaining, fee_pips):
+    """SwapMath.computeSwapStep for exact input → (sqrt_next, amount_in, amount_out, fee_amount)."""
+    zero_for_one = sqrt_current >= sqrt_target
+    remaining_less_fee = mul_div(amount_remaining, 1_000_000 - fee_pips, 1_000_000)
+    if zero_for_one:
+        amount_in = amount0_delta(sqrt_target, sqrt_current, liquidity, True)
+    else:
+        amount_in = amount1_delta(sqrt_current, sqrt_target, liquidity, True)
+    if remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = next_sqrt_price_from_input(sqrt_current, liquidity, remaining_less_fee, zero_for_one)
+    reached = sqrt_next == sqrt_target
+    if zero_for_one:
+        if not reached:
+            amount_in = amount0_delta(sqrt_next, sqrt_current, liquidity, True)
+        amount_out = amount1_delta(sqrt_next, sqrt_current, liquidity, False)
+    else:
+        if not reached:
+            amount_in = amount1_delta(sqrt_current, sqrt_next, liquidity, True)
+        amount_out = amount0_delta(sqrt_current, sqrt_next, liquidity, False)
+    if not reached:
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_up(amount_in, fee_pips, 1_000_000 - fee_pips)
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+
+class PoolRangeExceeded(Exception):
+    """The simulated swap walked past the tick-bitmap words loaded for the pool."""
+
+
+class PoolState:
+    """Snapshot of one v3 pool (slot0, liquidity, bitmap words, initialized ticks) at a block."""
+
+    def __init__(self, address, token0, token1, fee, sqrt_price_x96, tick, liquidity, bitmap, ticks, block):
+        self.address        = address
+        self.token0         = token0.lower()
+        self.token1         = token1.lower()
+        self.fee            = fee
+        self.tick_spacing   = TICK_SPACINGS[fee]
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick           = tick
+        self.liquidity      = liquidity
+        self.bitmap         = bitmap   # word position → uint256 word (every loaded word, zeros too)
+        self.ticks          = ticks    # initialized tick → liquidityNet
+        self.block          = block
+
+    def _next_initialized_tick(self, tick, lte):
+        """TickBitmap.nextInitializedTickWithinOneWord."""
+        spacing = self.tick_spacing
+        compressed = tick // spacing
+        if lte:
+            word_pos, bit_pos = compressed >> 8, compressed & 0xff
+            if word_pos not in self.bitmap:
+                raise PoolRangeExceeded(word_pos)
+            masked = self.bitmap[word_pos] & ((1 << bit_pos) - 1 + (1 << bit_pos))
+            if masked:
+                return (compressed - (bit_pos - (masked.bit_length() - 1))) * spacing, True
+            return (compressed - bit_pos) * spacing, False
+        compressed += 1
+        word_pos, bit_pos = compressed >> 8, compressed & 0xff
+        if word_pos not in self.bitmap:
+            raise PoolRangeExceeded(word_pos)
+        masked = self.bitmap[word_pos] & ~((1 << bit_pos) - 1)
+        if masked:
+            lsb = (masked & -masked).bit_length() - 1
+            return (compressed + (lsb - bit_pos)) * spacing, True
+        return (compressed + (255 - bit_pos)) * spacing, False
+
+    def quote_exact_input(self, token_in, amount_in):
+        """Amount of the other token out for `amount_in` of token_in (QuoterV2 semantics,
+        no price limit). Returns (amount_out, sqrt_price_after, ticks_crossed)."""
+        zero_for_one = token_in.lower() == self.token0
+        limit = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+        remaining, out = amount_in, 0
+        sqrt_p, tick, liquidity, crossed = self.sqrt_price_x96, self.tick, self.liquidity, 0
+        while remaining != 0 and sqrt_p != limit:
+            start = sqrt_p
+            tick_next, initialized = self._next_initialized_tick(tick, zero_for_one)
+            tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+            sqrt_next_tick = sqrt_ratio_at_tick(tick_next)
+            past_limit = sqrt_next_tick < limit if zero_for_one else sqrt_next_tick > limit
+            target = limit if past_limit else sqrt_next_tick
+            sqrt_p, step_in, step_out, fee_amount = compute_swap_step(sqrt_p, target, liquidity, remaining, self.fee)
+            remaining -= step_in + fee_amount
+            out += step_out
+            if sqrt_p == sqrt_next_tick:
+                if initialized:
+                    net = self.ticks.get(tick_next, 0)
+                    liquidity += -net if zero_for_one else net
+                    crossed += 1
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif sqrt_p != start:
+                tick = tick_at_sqrt_ratio(sqrt_p)
+        return out, sqrt_p, crossed
+
+    def spot_out(self, token_in, amount_in):
+        """Output at the current mid price, before fee and price impact."""
+        if token_in.lower() == self.token0:
+            return amount_in * self.sqrt_price_x96 ** 2 // (Q96 * Q96)
+        return amount_in * Q96 * Q96 // self.sqrt_price_x96 ** 2
+
+    def price_impact_bps(self, token_in, amount_in):
+        spot = self.spot_out(token_in, amount_in)
+        if spot == 0:
+            return None
+        out, _, _ = self.quote_exact_input(token_in, amount_in)
+        return round((1 - out / spot) * 10_000, 2)
+
+
+# ── Pool-state cache ───────────────────────────────────────────────────────────
+
+POOL_WORDS = 3            # bitmap words loaded either side of the current tick's word
+_POOL_STATES    = {}      # (chain, pool) → (monotonic time, PoolState), reused for about one block
+
+def pool_address(w3, chain, token_a, token_b, fees=FEE_TIERS):
+    """{fee: pool address} for the pairs that have a v3 pool — one multicall for unknown tiers."""
+    t0, t1 = sorted([token_a.lower(), token_b.lower()])
+    cid = CHAINS[chain]["chain_id"]
+    pools, missing = {}, []
+    for f in fees:
+        addr = STATE.get("pool", cid, t0, t1, f)   # pools are immutable — no TTL
+        if addr:
+            pools[f] = addr
+        elif not STATE.get("no_pool", cid, t0, t1, f, ttl=STATE_TTL["no_pool"]):
+            missing.append(f)
+    if missing:
+        factory = contract(w3, CHAINS[chain]["factory"], V3_FACTORY_ABI)
+        a, b = Web3.to_checksum_address(t0), Web3.to_checksum_address(t1)
+        found = multicall(w3, [(factory, "getPool", [a, b, f]) for f in missing])
+        for f, addr in zip(missing, found):
+            if addr and int(addr, 16) != 0:
+                pools[f] = Web3.to_checksum_address(addr)
+                STATE.put("pool", cid, t0, t1, f, value=pools[f])
+            elif addr is not None:
+                STATE.put("no_pool", cid, t0, t1, f, value=True)
+    return dict(sorted(pools.items()))
+
+def load_pool(w3, chain, pool, fee, token_a, token_b, words=POOL_WORDS):
+    """PoolState for `pool`, cached for about one block. Three multicalls when cold:
+    slot0 + liquidity + block, the bitmap words around the current tick, then the
+    initialized ticks found in those words — the last two pinned to the first's block."""
+    key = (chain, pool)
+    hit = _POOL_STATES.get(key)
+    if hit and time.monotonic() - hit[0] < CHAINS[chain]["block_time"] and len(hit[1].bitmap) >= 2 * words + 1:
+        return hit[1]
+    pool_c = contract(w3, pool, V3_POOL_ABI)
+    mc     = contract(w3, MULTICALL3, MULTICALL3_ABI)
+    slot0, liquidity, block = multicall(w3, [(pool_c, "slot0", []), (pool_c, "liquidity", []), (mc, "getBlockNumber", [])])
+    sqrt_price, tick = slot0[0], slot0[1]
+
+    spacing = TICK_SPACINGS[fee]
+    center  = (tick // spacing) >> 8
+    positions = list(range(center - words, center + words + 1))
+    bitmap = dict(zip(positions, (w or 0 for w in multicall(w3, [(pool_c, "tickBitmap", [p]) for p in positions], block))))
+
+    initialized = [
+        ((pos << 8) + bit) * spacing
+        for pos, word in bitmap.items() for bit in range(256) if word >> bit & 1
+    ]
+    infos = multicall(w3, [(pool_c, "ticks", [t]) for t in initialized], block)
+    ticks = {t: info[1] for t, info in zip(initialized, infos) if info}
+
+    t0, t1 = sorted([token_a.lower(), token_b.lower()])
+    state = PoolState(pool, t0, t1, fee, sqrt_price, tick, liquidity, bitmap, ticks, block)
+    _POOL_STATES[key] = (time.monotonic(), state)
+    return state
+
+def local_quote(w3, chain, token_in, token_out, amount_in):
+    """Best exact-input quote across fee tiers from cached pool state, no QuoterV2 call.
+    Same shape as quote_best() minus gas; None if no pool. Falls back to a wider
+    bitmap load if the swap walks past the loaded words."""
+    tiers = {}
+    for fee, pool in pool_address(w3, chain, token_in, token_out).items():
+        state = load_pool(w3, chain, pool, fee, token_in, token_out)
+        try:
+            amount_out, _, _ = state.quote_exact_input(token_in, amount_in)
+        except PoolRangeExceeded:
+            state = load_pool(w3, chain, pool, fee, token_in, token_out, words=POOL_WORDS * 4)
+            try:
+                amount_out, _, _ = state.quote_exact_input(token_in, amount_in)
+            except PoolRangeExceeded:
+                continue
+        if amount_out > 0:
+            tiers[fee] = (amount_out, state)
+    if not tiers:
+        return None
+    fee = max(tiers, key=lambda f: tiers[f][0])
+    amount_out, state = tiers[fee]
+    return {
+        "fee": fee,
+        "amount_out": amount_out,
+        "block": state.block,
+        "price_impact_bps": state.price_impact_bps(token_in, amount_in),
+        "tiers": {str(f): str(v[0]) for f, v in tiers.items()},
+    }
 
-    # Get quote from Across
+@span("across_quote")
+def across_quote(recipient, amount_wei):
+    """Across suggested-fees for WETH Base→Arbitrum."""
+    import urllib.request
     log(f"Fetching Across bridge quote for {amount_wei/1e18:.6f} WETH Base→Arbitrum...")
     url = (f"{ACROSS_API}/suggested-fees"
-           f"?inputToken={weth_base}&outputToken={weth_arb}"
+           f"?inputToken={CHAINS['base']['weth']}&outputToken={CHAINS['arbitrum']['weth']}"
            f"&originChainId=8453&destinationChainId=42161"
-           f"&amount={amount_wei}&recipient={account.address}")
+           f"&amount={amount_wei}&recipient={recipient}")
     req = urllib.request.Request(url, headers={"User-Agent": "RedBotster/1.0", "Accept": "application/json"})
-    resp = json.loads(urllib.request.urlopen(req, timeout=15).read())
+    return json.loads(urllib.request.urlopen(req, timeout=15).read())
+
+def arbitrum_funds(address):
+    """(head block, ETH + WETH balance) on Arbitrum in one multicall — Across fills WETH
+    to an EOA as native ETH, so both count."""
+    w3, cfg = connect("arbitrum")
+    owner = Web3.to_checksum_address(address)
+    mc    = contract(w3, MULTICALL3, MULTICALL3_ABI)
+    block, eth, weth = (v or 0 for v in multicall(w3, [
+        (mc, "getBlockNumber", []),
+        eth_balance_call(w3, owner),
+        (contract(w3, cfg["weth"], ERC20_ABI), "balanceOf", [owner]),
+    ]))
+    return block, eth + weth
+
+def bridge_weth_to_arbitrum(account, amount_wei, swap=None):
+    """Bridge WETH from Base to Arbitrum via Across and record it as a pending bridge.
+
+    The Across quote and the Arbitrum balance snapshot are fetched while the Base
+    approval is checked, and the deposit is pipelined behind the approval. `swap` is
+    the swap_leg arguments waiting on the funds. Returns the bridge record.
+    """
+    weth_base = CHAINS["base"]["weth"]
+    weth_arb  = CHAINS["arbitrum"]["weth"]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        quote_f = pool.submit(across_quote, account.address, amount_wei)
+        funds_f = pool.submit(arbitrum_funds, account.address)
+        w3_base, cfg_base = connect("base")
+        approval = ensure_approval(
+            w3_base, account, weth_base, ACROSS_SPOKE_BASE, amount_wei, cfg_base, wait=False,
+            current=cached_allowance(cfg_base["chain_id"], weth_base, account.address, ACROSS_SPOKE_BASE))
+        resp = quote_f.result()
+        arb_block, arb_funds = funds_f.result()
 
     total_fee    = int(resp["totalRelayFee"]["total"])
     output_amt   = amount_wei - total_fee
@@ -234,12 +1801,8 @@ def bridge_weth_to_arbitrum(account, amount_wei):
     excl_relayer  = resp.get("exclusiveRelayer", "0x0000000000000000000000000000000000000000")
     log(f"Bridge fee: {total_fee/1e18:.6f} WETH → receive ~{output_amt/1e18:.6f} WETH on Arbitrum")
 
-    w3_base, cfg_base = connect("base")
-    ensure_approval(w3_base, account, weth_base, ACROSS_SPOKE_BASE, amount_wei, cfg_base)
-
-    spoke = w3_base.eth.contract(address=Web3.to_checksum_address(ACROSS_SPOKE_BASE), abi=ACROSS_BRIDGE_ABI)
-    gas_price = w3_base.eth.gas_price
-    tx = spoke.functions.depositV3(
+    spoke = contract(w3_base, ACROSS_SPOKE_BASE, ACROSS_BRIDGE_ABI)
+    tx = build_call_tx(cfg_base, account, spoke.functions.depositV3(
         account.address,
         account.address,
         Web3.to_checksum_address(weth_base),
@@ -252,117 +1815,1212 @@ def bridge_weth_to_arbitrum(account, amount_wei):
         fill_deadline,
         excl_deadline,
         b"",
-    ).build_transaction({
-        "chainId": 8453,
+    ), gas=PIPELINED_GAS["across_deposit"] if approval else None)
+    pendings = ([approval] if approval else []) + [submit_tx(w3_base, account, tx)]
+    receipt  = wait_receipts(w3_base, account, pendings)[-1]
+
+    deposit_id = across_deposit_id(receipt["logs"])
+    record = {
+        "deposit_tx": receipt["transactionHash"],
+        "deposit_id": deposit_id,
+        "amount": str(amount_wei),
+        "output": str(output_amt),
+        "recipient": account.address,
+        "arb_block": arb_block,
+        "funds_before": str(arb_funds),
+        "fill_deadline": fill_deadline,
+        "swap": swap,
+    }
+    JOURNAL.bridge_open(record)
+    log(f"Bridge deposit TX on Base: {record['deposit_tx']} (deposit {deposit_id}) — waiting for the Arbitrum fill")
+    return record
+
+def across_deposit_id(logs):
+    """depositId from a Base deposit receipt's logs (None if it has none)."""
+    # FundsDeposited / V3FundsDeposited: topics = [sig, destinationChainId, depositId, depositor]
+    return next((int(lg["topics"][2], 16) for lg in logs
+                 if lg["address"].lower() == ACROSS_SPOKE_BASE.lower()
+                 and len(lg["topics"]) >= 3 and int(lg["topics"][1], 16) == 42161), None)
+
+def recover_bridge(deposit, swap):
+    """Bridge record for a deposit an earlier run sent but crashed before recording,
+    rebuilt from the journaled depositV3 calldata and the receipt's V3FundsDeposited log.
+    `deposit` is its txs row; `swap` the swap_leg arguments waiting on the funds."""
+    w3, _ = connect("base")
+    spoke   = contract(w3, ACROSS_SPOKE_BASE, ACROSS_BRIDGE_ABI)
+    _, args = spoke.decode_function_input(json.loads(deposit["tx"])["data"])
+    receipt = w3.provider.make_request("eth_getTransactionReceipt", [deposit["hash"]]).get("result") or {}
+    head, funds = arbitrum_funds(args["recipient"])
+    # Back to the Arbitrum head when the deposit went out (plus a minute), so the fill log is in range
+    elapsed = time.time() - deposit["sent_at"] + 60
+    record = {
+        "deposit_tx": deposit["hash"],
+        "deposit_id": across_deposit_id(receipt.get("logs", [])),
+        "amount": str(args["inputAmount"]),
+        "output": str(args["outputAmount"]),
+        "recipient": args["recipient"],
+        "arb_block": max(head - int(elapsed / CHAINS["arbitrum"]["block_time"]), 0),
+        "funds_before": str(funds),   # the pre-deposit balance is gone; the fill log decides
+        "fill_deadline": args["fillDeadline"],
+        "swap": swap,
+    }
+    JOURNAL.bridge_open(record)
+    log(f"Rebuilt the bridge record for Across deposit {deposit['hash']} (deposit {record['deposit_id']})")
+    return record
+
+def bridge_filled(record):
+    """True once the Across fill for `record` has landed on Arbitrum: a fill log for its
+    depositId on the Arbitrum SpokePool, or the wallet's Arbitrum ETH+WETH having risen
+    by the bridged output (covers log-range limits on long-pending records)."""
+    w3, _ = connect("arbitrum")
+    if record.get("deposit_id") is not None:
+        try:
+            # FilledRelay / FilledV3Relay: topics = [sig, originChainId, depositId, relayer]
+            logs = w3.eth.get_logs({
+                "address": Web3.to_checksum_address(ACROSS_SPOKE_ARBITRUM),
+                "fromBlock": record["arb_block"],
+                "toBlock": "latest",
+                "topics": [None, "0x" + (8453).to_bytes(32, "big").hex(),
+                           "0x" + record["deposit_id"].to_bytes(32, "big").hex()],
+            })
+            if logs:
+                return True
+        except Exception as e:
+            log(f"Across fill log lookup failed ({e}) — checking balance instead")
+    _, funds = arbitrum_funds(record["recipient"])
+    return funds >= int(record["funds_before"]) + int(record["output"])
+
+def bridge_records(recipient=None):
+    """Open bridge records from the journal. Records an older version left in the
+    chain-state cache are moved over first."""
+    for record in STATE.values("bridge", 42161):
+        JOURNAL.bridge_open(record)
+        STATE.drop("bridge", 42161, record["deposit_tx"])
+    return JOURNAL.bridges(recipient)
+
+def open_bridges(recipient):
+    """Pending Across bridges to Arbitrum for `recipient`; filled or expired ones are
+    cleared on the way."""
+    records = []
+    for record in bridge_records(recipient):
+        if bridge_filled(record):
+            log(f"Across deposit {record['deposit_tx']} has landed on Arbitrum")
+        elif time.time() > record["fill_deadline"]:
+            log(f"Across deposit {record['deposit_tx']} passed its fill deadline — refunded on Base")
+        else:
+            records.append(record)
+            continue
+        JOURNAL.bridge_close(record["deposit_tx"])
+    return records
+
+def bridged_amount(record, amount):
+    """Swap amount (decimal WETH string) once a bridge lands: what Across delivered after
+    its fee, less Arbitrum's gas reserve, capped at the amount asked for."""
+    arrived = int(record["output"]) - CHAINS["arbitrum"]["gas_reserve"]
+    if arrived <= 0:
+        fail(f"Bridged {int(record['output'])/1e18:.6f} ETH doesn't cover the Arbitrum gas reserve")
+    return f"{min(int(float(amount) * 1e18), arrived) / 1e18:.18f}"
+
+@span("bridge_fill")
+def await_bridge_fill(record, timeout=BRIDGE_FILL_TIMEOUT):
+    """Poll until the bridge fills (True, record cleared) or the wait times out (False,
+    record stays queued for the next run)."""
+    deadline = min(time.time() + timeout, record["fill_deadline"])
+    while time.time() < deadline:
+        if bridge_filled(record):
+            JOURNAL.bridge_close(record["deposit_tx"])
+            log(f"Across fill landed for {record['deposit_tx']}")
+            return True
+        time.sleep(BRIDGE_POLL)
+    return False
+
+
+# ── Fees & gas limits ─────────────────────────────────────────────────────────
+
+class FeeEngine:
+    """EIP-1559 fee params per chain from one eth_feeHistory call, reused for a block.
+
+    maxPriorityFeePerGas is a reward percentile over the last few blocks (floored at the
+    chain's min_tip); maxFeePerGas leaves room for two full-block base-fee increases.
+    """
+
+    def __init__(self):
+        self._hist = {}
+        self._lock = threading.Lock()
+
+    def _history(self, w3, cfg):
+        key = cfg["chain_id"]
+        with self._lock:
+            hit = self._hist.get(key)
+            if hit and time.monotonic() - hit[0] < cfg["block_time"]:
+                return hit[1]
+        hist = w3.eth.fee_history(FEE_HISTORY_BLOCKS, "latest", list(FEE_PERCENTILES))
+        rewards = [r for r in hist.get("reward") or [] if r]
+        tips = {}
+        for i, pct in enumerate(FEE_PERCENTILES):
+            col = sorted(r[i] for r in rewards) or [0]
+            tips[pct] = col[len(col) // 2]
+        entry = {"base": hist["baseFeePerGas"][-1], "tips": tips}
+        with self._lock:
+            self._hist[key] = (time.monotonic(), entry)
+        return entry
+
+    def params(self, w3, cfg, percentile=50):
+        """{"maxFeePerGas", "maxPriorityFeePerGas"} for a tx mined in the next few blocks."""
+        h   = self._history(w3, cfg)
+        tip = max(h["tips"][percentile], cfg["min_tip"])
+        return {"maxFeePerGas": 2 * h["base"] + tip, "maxPriorityFeePerGas": tip}
+
+    def expected(self, w3, cfg):
+        """Price per gas a tx should actually pay next block (base fee + tip) — for costing
+        plans, not for the fee cap."""
+        h = self._history(w3, cfg)
+        return h["base"] + max(h["tips"][50], cfg["min_tip"])
+
+    def bump(self, w3, cfg, tx):
+        """Fee params for replacing `tx`: at least RBF_BUMP × its fees, or the current
+        75th-percentile params if the market has moved further."""
+        fresh = self.params(w3, cfg, percentile=75)
+        return {k: max(int(tx[k] * RBF_BUMP) + 1, fresh[k]) for k in fresh}
+
+FEES = FeeEngine()
+
+def swap_route(data):
+    """The part of a router swap's calldata that sets its gas: exactInputSingle's token
+    pair and fee, or execute's commands (permit, wrap, unwrap) and v4 pool and direction.
+    None for any other call."""
+    if data[:10] == EXACT_INPUT_SINGLE:
+        return data[10:10 + 3 * 64].lower()
+    if data[:10] != UR_EXECUTE:
+        return None
+    from eth_abi import decode
+    commands, inputs, _ = decode(["bytes", "bytes[]", "uint256"], bytes.fromhex(data[10:]))
+    route = [commands.hex()]
+    for command, inp in zip(commands, inputs):
+        if command == UR_V4_SWAP:
+            _, params = decode(["bytes", "bytes[]"], inp)
+            (pool_key, zero_for_one, *_), = decode(
+                ["((address,address,uint24,int24,address),bool,uint128,uint128,bytes)"], params[0])
+            route.append(",".join(map(str, pool_key)) + f",{zero_for_one}")
+    return ":".join(route)
+
+class GasLimitCache:
+    """Gas limits per (chain_id, to, selector, pays ETH, swap route) learned from successful
+    receipts, so repeat calls skip eth_estimateGas. Router swaps are told apart by pool
+    and route (swap_route()) — a limit learned on a light route would starve a heavier
+    one. The highest gasUsed per key is kept in the chain-state cache (STATE_TTL["gas"]),
+    so one-shot cron runs reuse what earlier runs learned. Chains with gas_cache=False
+    always estimate."""
+
+    @staticmethod
+    def key(tx):
+        data = tx.get("data") or "0x"
+        return (tx["chainId"], (tx.get("to") or "").lower(), data[:10], bool(tx.get("value")), swap_route(data))
+
+    def get(self, tx):
+        used = STATE.get("gas", *self.key(tx), ttl=STATE_TTL["gas"])
+        return int(used * GAS_LIMIT_MARGIN) + GAS_LIMIT_PAD if used else None
+
+    def record(self, tx, gas_used):
+        STATE.put_max("gas", *self.key(tx), value=gas_used)
+
+    def forget(self, tx):
+        STATE.drop("gas", *self.key(tx))
+
+GAS_LIMITS = GasLimitCache()
+
+def chain_cfg(chain_id):
+    return next(c for c in CHAINS.values() if c["chain_id"] == chain_id)
+
+def build_call_tx(cfg, account, fn, value=0, gas=None):
+    """Unsigned tx dict for a contract call. Fees and (unless given) gas are filled in by
+    submit_tx — unlike build_transaction(), nothing is estimated here."""
+    tx = {
+        "chainId": cfg["chain_id"],
         "from": account.address,
-        "value": 0,
-        "maxFeePerGas": gas_price * 2,
-        "maxPriorityFeePerGas": gas_price,
-    })
-    bridge_tx = send_tx(w3_base, account, tx)
-    log(f"Bridge deposit TX on Base: {bridge_tx} — funds will arrive on Arbitrum asynchronously.")
-
-
-def send_tx(w3, account, tx):
-    tx["nonce"] = w3.eth.get_transaction_count(account.address)
-    tx["gas"]   = w3.eth.estimate_gas({**tx, "from": account.address})
+        "to": fn.address,
+        "value": value,
+        "data": fn._encode_transaction_data(),
+    }
+    if gas:
+        tx["gas"] = gas
+    return tx
+
+
+# ── Nonces & submission ────────────────────────────────────────────────────────
+
+class NonceManager:
+    """Hands out nonces locally per (chain_id, address) so several signed txs can be in flight.
+
+    Seeded from the node's `pending` count on first use and after anything that can
+    desync it (revert, dropped tx, rejected broadcast).
+    """
+
+    def __init__(self):
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, w3, chain_id, address):
+        with self._lock:
+            key = (chain_id, address)
+            if key not in self._next:
+                self._next[key] = w3.eth.get_transaction_count(address, "pending")
+            nonce = self._next[key]
+            self._next[key] = nonce + 1
+            return nonce
+
+    def release(self, chain_id, address, nonce):
+        """Give back a nonce that was never broadcast, if nothing was handed out after it."""
+        with self._lock:
+            if self._next.get((chain_id, address)) == nonce + 1:
+                self._next[(chain_id, address)] = nonce
+
+    def resync(self, w3, chain_id, address):
+        with self._lock:
+            self._next[(chain_id, address)] = w3.eth.get_transaction_count(address, "pending")
+            return self._next[(chain_id, address)]
+
+NONCES = NonceManager()
+
+@span("submit")
+def submit_tx(w3, account, tx):
+    """Fill fees and gas (cached limit, else estimate), assign a local nonce, sign and broadcast.
+
+    Returns a pending handle for wait_tx(); does not wait for the receipt.
+    """
+    chain_id = tx["chainId"]
+    cfg = chain_cfg(chain_id)
+    if "maxFeePerGas" not in tx:
+        with span("fees"):
+            tx.update(FEES.params(w3, cfg))
+    if "gas" not in tx:
+        gas = cfg["gas_cache"] and GAS_LIMITS.get(tx)
+        if not gas:
+            with span("estimate_gas"):
+                gas = w3.eth.estimate_gas({**tx, "from": account.address})
+        tx["gas"] = gas
+    tx["nonce"] = NONCES.allocate(w3, chain_id, account.address)
     signed = account.sign_transaction(tx)
-    tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-    log(f"TX sent: {tx_hash.hex()} — waiting...")
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+    try:
+        tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
+    except Exception:
+        NONCES.release(chain_id, account.address, tx["nonce"])
+        NONCES.resync(w3, chain_id, account.address)
+        raise
+    log(f"TX sent: {w3.to_hex(tx_hash)} (nonce {tx['nonce']})")
+    pending = {"hash": w3.to_hex(tx_hash), "hashes": [w3.to_hex(tx_hash)], "nonce": tx["nonce"],
+               "tx": tx, "since": None, "bumps": 0, "leg": JOURNAL.current_leg()}
+    JOURNAL.tx_sent(pending, account.address)
+    return pending
+
+def replace_tx(w3, account, pending):
+    """Re-sign a stuck tx at the same nonce with bumped fees. Either version may be mined,
+    so every hash stays in pending["hashes"]."""
+    cfg = chain_cfg(pending["tx"]["chainId"])
+    tx  = {**pending["tx"], **FEES.bump(w3, cfg, pending["tx"])}
+    try:
+        tx_hash = w3.to_hex(w3.eth.send_raw_transaction(account.sign_transaction(tx).raw_transaction))
+    except Exception as e:
+        # "nonce too low" means one of our versions was just mined — the next poll finds it
+        log(f"Replacement for {pending['hash']} not accepted: {e}")
+        pending["bumps"] = RBF_MAX
+        return
+    log(f"TX {pending['hash']} stuck — replaced by {tx_hash} "
+        f"(maxFee {tx['maxFeePerGas']}, tip {tx['maxPriorityFeePerGas']})")
+    pending.update(tx=tx, hash=tx_hash, bumps=pending["bumps"] + 1)
+    pending["hashes"].append(tx_hash)
+    JOURNAL.tx_sent(pending, account.address)
+
+class ConfirmationTracker:
+    """One watcher thread per chain that follows the head and confirms every pending tx
+    on that chain with a single batched request per poll (eth_blockNumber + one
+    eth_getTransactionReceipt per hash), so polling cost doesn't grow with txs in flight.
+
+    A tx resolves once its receipt is `confirmations` blocks deep. Receipts are re-read
+    every poll until then, so a tx reorged out goes back to waiting. Stuck txs are
+    replaced with higher fees once unmined for rbf_after() seconds, dropped ones get their
+    nonce filled on timeout.
+    """
+
+    def __init__(self):
+        self._watches = {}   # chain_id → list of entries being tracked
+        self._lock = threading.Lock()
+
+    def track(self, w3, account, pending, timeout=120):
+        """Future resolving to the tx's receipt (or raising CommandFailed on timeout)."""
+        chain_id = pending["tx"]["chainId"]
+        entry = {"account": account, "pending": pending, "future": Future(),
+                 "deadline": time.monotonic() + timeout, "timeout": timeout}
+        with self._lock:
+            entries = self._watches.get(chain_id)
+            if entries is None:
+                entries = self._watches[chain_id] = []
+                threading.Thread(target=self._run, args=(w3, chain_id), daemon=True,
+                                 name=f"confirm-{chain_id}").start()
+            entries.append(entry)
+        return entry["future"]
+
+    def _run(self, w3, chain_id):
+        cfg  = chain_cfg(chain_id)
+        last = None
+        while True:
+            with self._lock:
+                entries = list(self._watches[chain_id])
+                if not entries:
+                    del self._watches[chain_id]
+                    return
+            try:
+                last = self._poll(w3, cfg, entries, last)
+            except Exception as e:
+                log(f"Confirmation poll failed: {e}")
+            for entry in entries:
+                if not entry["future"].done() and time.monotonic() > entry["deadline"]:
+                    pending = entry["pending"]
+                    try:
+                        fill_nonce_gap(w3, entry["account"], pending)
+                    except Exception as e:
+                        log(f"Nonce gap check failed: {e}")
+                    entry["future"].set_exception(
+                        CommandFailed(f"TX not mined within {entry['timeout']}s: {pending['hash']}"))
+            with self._lock:
+                self._watches[chain_id] = [e for e in self._watches[chain_id] if not e["future"].done()]
+            time.sleep(max(cfg["block_time"] / 2, 0.25))
+
+    def _poll(self, w3, cfg, entries, last):
+        hashes = [h for e in entries for h in e["pending"]["hashes"]]
+        replies = w3.provider.make_batch_request(
+            [("eth_blockNumber", [])] + [("eth_getTransactionReceipt", [h]) for h in hashes])
+        if not isinstance(replies, list):
+            raise ValueError(replies.get("error", replies))
+        head = int(replies[0]["result"], 16)
+        # Same head: nothing changed for txs already polled, but one tracked since the last
+        # poll (another lane or wallet) may have been mined in this very block
+        if head == last and all(e.get("polled") for e in entries):
+            return last
+        receipts = {h: r.get("result") for h, r in zip(hashes, replies[1:])}
+        for entry in entries:
+            entry["polled"] = True
+            pending = entry["pending"]
+            raw = next((receipts[h] for h in pending["hashes"] if receipts.get(h)), None)
+            if raw is None:
+                now = time.monotonic()
+                if pending["since"] is None:
+                    pending["since"] = now
+                elif now - pending["since"] >= rbf_after(cfg) and pending["bumps"] < RBF_MAX:
+                    replace_tx(w3, entry["account"], pending)
+                    pending["since"] = now
+                continue
+            mined = int(raw["blockNumber"], 16)
+            if head - mined + 1 >= cfg["confirmations"]:
+                entry["future"].set_result({
+                    "transactionHash": raw["transactionHash"],
+                    "blockNumber": mined,
+                    "blockHash": raw["blockHash"],
+                    "status": int(raw["status"], 16),
+                    "gasUsed": int(raw["gasUsed"], 16),
+                    "effectiveGasPrice": int(raw.get("effectiveGasPrice") or "0x0", 16),
+                    "logs": raw.get("logs", []),
+                })
+        return head
+
+TRACKER = ConfirmationTracker()
+
+def rbf_after(cfg):
+    """Seconds a tx may sit unmined on this chain before it is re-sent with higher fees."""
+    return max(RBF_BLOCKS * cfg["block_time"], RBF_MIN_WAIT)
+
+@span("receipts")
+def wait_tx(w3, account, pending, timeout=120):
+    """Block until a submitted tx is confirmed (see ConfirmationTracker); fail on revert."""
+    return _settle(w3, account, pending, TRACKER.track(w3, account, pending, timeout).result())
+
+def wait_all(w3, account, pendings, timeout=120):
+    """Wait for several in-flight txs, tracked together; returns their hashes in order."""
+    return [r["transactionHash"] for r in wait_receipts(w3, account, pendings, timeout)]
+
+@span("receipts")
+def wait_receipts(w3, account, pendings, timeout=120):
+    """wait_all(), returning the receipts. Every tx is awaited before the first failure
+    is raised."""
+    futures = [TRACKER.track(w3, account, p, timeout) for p in pendings]
+    wait(futures)
+    receipts = [f.result() for f in futures]
+    for p, r in zip(pendings, receipts):
+        _settle(w3, account, p, r)
+    return receipts
+
+def _settle(w3, account, pending, receipt):
+    chain_id = pending["tx"]["chainId"]
+    tx_hash  = receipt["transactionHash"]
+    JOURNAL.tx_settled(pending, receipt, account.address)
     if receipt["status"] != 1:
-        fail(f"TX reverted: {tx_hash.hex()}")
-    log(f"TX confirmed in block {receipt['blockNumber']}")
-    return tx_hash.hex()
+        NONCES.resync(w3, chain_id, account.address)
+        if receipt["gasUsed"] >= pending["tx"]["gas"]:
+            GAS_LIMITS.forget(pending["tx"])   # ran out of gas — don't reuse that limit
+        # a cached allowance may be why it reverted — re-read next time
+        STATE.drop_allowances(chain_id, account.address, pending["tx"]["to"])
+        fail(f"TX reverted: {tx_hash}")
+    if chain_cfg(chain_id)["gas_cache"]:
+        GAS_LIMITS.record(pending["tx"], receipt["gasUsed"])
+    STATE.observe_receipt(chain_id, receipt)
+    log(f"TX confirmed in block {receipt['blockNumber']}: {tx_hash}")
+    return tx_hash
+
+def fill_nonce_gap(w3, account, pending):
+    """If a tx was dropped from the mempool, occupy its nonce with a 0-value self-transfer
+    so later nonces from this lane can still be mined."""
+    from web3.exceptions import TransactionNotFound
+    chain_id = pending["tx"]["chainId"]
+    for h in pending["hashes"]:
+        try:
+            w3.eth.get_transaction(h)
+            log(f"TX {h} still pending in mempool — leaving it")
+            return
+        except TransactionNotFound:
+            pass
+    if w3.eth.get_transaction_count(account.address, "latest") > pending["nonce"]:
+        NONCES.resync(w3, chain_id, account.address)
+        return  # nonce already consumed by something else
+    log(f"TX {pending['hash']} dropped — filling nonce {pending['nonce']} with a self-transfer")
+    filler = {
+        "chainId": chain_id,
+        "from": account.address,
+        "to": account.address,
+        "value": 0,
+        "gas": 21000,
+        "nonce": pending["nonce"],
+        **FEES.bump(w3, chain_cfg(chain_id), pending["tx"]),
+    }
+    try:
+        w3.eth.send_raw_transaction(account.sign_transaction(filler).raw_transaction)
+    except Exception as e:
+        log(f"Nonce gap filler failed: {e}")
+    NONCES.resync(w3, chain_id, account.address)
 
-def ensure_approval(w3, account, token_addr, spender, amount, cfg):
-    token = w3.eth.contract(address=Web3.to_checksum_address(token_addr), abi=ERC20_ABI)
-    current = token.functions.allowance(account.address, Web3.to_checksum_address(spender)).call()
+def send_tx(w3, account, tx):
+    return wait_tx(w3, account, submit_tx(w3, account, tx))
+
+@span("approval")
+def ensure_approval(w3, account, token_addr, spender, amount, cfg, wait=True, current=None):
+    """Approve spender for max if allowance is short. With wait=False returns the pending
+    approval handle (or None) so the caller can pipeline the next tx behind it.
+    Pass `current` when the allowance was already read in a batch."""
+    token = contract(w3, token_addr, ERC20_ABI)
+    if current is None:
+        current = token.functions.allowance(account.address, Web3.to_checksum_address(spender)).call()
     if current >= amount:
         log("Allowance sufficient")
-        return
+        return None
     log(f"Approving router for {amount}...")
-    gas_price = w3.eth.gas_price
-    tx = token.functions.approve(
-        Web3.to_checksum_address(spender), 2**256 - 1
-    ).build_transaction({
-        "chainId": cfg["chain_id"],
-        "from": account.address,
-        "maxFeePerGas": gas_price * 2,
-        "maxPriorityFeePerGas": gas_price,
-    })
-    send_tx(w3, account, tx)
-
-def clanker_buy_red(w3, account, eth_amount_wei):
-    """Buy RED using the Clanker pool router with native ETH."""
-    import time as _time
-    p = CLANKER_POOL_PARAMS["RED"]
-
-    def pad(addr):
-        return bytes(12) + bytes.fromhex(addr.lower()[2:])
-
-    def u256(v):
-        return v.to_bytes(32, "big")
-
-    deadline = int(_time.time()) + 3600
-    calldata_params = (
-        u256(0) +                                 # [0] amountOutMin = 0
-        u256(0x140) +                             # [1] offset
-        pad(p["word2"]) +                         # [2]
-        pad(p["word3"]) +                         # [3] RED pool
-        pad(account.address) +                    # [4] recipient
-        u256(p["word5"]) +                        # [5]
-        u256(p["word6"]) +                        # [6]
-        u256(0) +                                 # [7]
-        u256(0) +                                 # [8]
-        u256(deadline) +                          # [9] deadline
-        u256(1) +                                 # [10] array length
-        u256(32) +                                # [11]
-        pad("0x4200000000000000000000000000000000000006") +  # [12] WETH
-        pad(TOKENS["RED"]["address"]) +           # [13] RED
-        pad(p["word14"]) +                        # [14] Universal Router
-        pad(p["word15"]) +                        # [15] hook
-        u256(p["word16"]) +                       # [16]
-        u256(p["word17"]) +                       # [17]
-        pad(p["word18"]) +                        # [18] RED pool
-        u256(p["word19"]) +                       # [19]
-        u256(0)                                   # [20]
-    )
-    calldata = bytes.fromhex("0f27c5c1") + calldata_params
-
-    gas_price = w3.eth.gas_price
-    tx = {
-        "chainId": 8453,
-        "to": Web3.to_checksum_address(CLANKER_ROUTER),
-        "from": account.address,
-        "value": eth_amount_wei,
-        "data": "0x" + calldata.hex(),
-        "maxFeePerGas": gas_price * 2,
-        "maxPriorityFeePerGas": gas_price,
+    tx = build_call_tx(cfg, account, token.functions.approve(Web3.to_checksum_address(spender), 2**256 - 1))
+    pending = submit_tx(w3, account, tx)
+    if wait:
+        wait_tx(w3, account, pending)
+        return None
+    return pending
+
+def v4_pool_id(pool):
+    """PoolId = keccak256(abi.encode(PoolKey))."""
+    from eth_abi import encode
+    return Web3.to_hex(Web3.keccak(encode(["address", "address", "uint24", "int24", "address"], v4_key(pool))))
+
+def v4_key(pool):
+    return (pool["currency0"], pool["currency1"], pool["fee"], pool["tick_spacing"], pool["hooks"])
+
+def clanker_pool(w3, token):
+    """Uniswap v4 pool of a Clanker token on Base: {"currency0", "currency1", "fee",
+    "tick_spacing", "hooks", "id"}.
+
+    The hook comes from TOKENS or the Clanker factory; the paired currency and tick
+    spacing are those of the candidate pool holding the most liquidity (one multicall).
+    Pool keys never change, so the result is cached without a TTL.
+    """
+    token = Web3.to_checksum_address(token)
+    pool  = STATE.get("clanker_pool", 8453, token)
+    if pool:
+        return pool
+    hook = next((t["clanker"].get("hook") for t in TOKENS.values()
+                 if "clanker" in t and t["address"].lower() == token.lower()), None)
+    if not hook:
+        infos = multicall(w3, [(contract(w3, f, CLANKER_FACTORY_ABI), "tokenDeploymentInfo", [token])
+                               for f in CLANKER_FACTORIES])
+        hook = next((info[1] for info in infos if info and int(info[1], 16)), None)
+        if not hook:
+            fail(f"{token} has no Clanker v4 deployment — not a Clanker token, or launched before v4")
+    candidates = []
+    for paired in (INPUTS["base"]["WETH"][0], NATIVE_ETH):
+        c0, c1 = sorted([token, Web3.to_checksum_address(paired)], key=str.lower)
+        for spacing in CLANKER_TICK_SPACINGS:
+            key = {"currency0": c0, "currency1": c1, "fee": V4_DYNAMIC_FEE,
+                   "tick_spacing": spacing, "hooks": Web3.to_checksum_address(hook)}
+            key["id"] = v4_pool_id(key)
+            candidates.append(key)
+    state_view = contract(w3, V4_BASE["state_view"], V4_STATE_VIEW_ABI)
+    liquidity  = multicall(w3, [(state_view, "getLiquidity", [bytes.fromhex(k["id"][2:])]) for k in candidates])
+    depth, pool = max(zip((l or 0 for l in liquidity), candidates), key=lambda lc: lc[0])
+    if not depth:
+        fail(f"No v4 pool with liquidity for {token} behind hook {hook}")
+    STATE.put("clanker_pool", 8453, token, value=pool)
+    log(f"Clanker pool for {token}: {pool['id']} (tick spacing {pool['tick_spacing']})")
+    return pool
+
+@span("quote")
+def clanker_quote(w3, pool, token_out, amount_in, slippage_bps=DEFAULT_SLIPPAGE_BPS):
+    """V4Quoter quote for buying token_out with amount_in of the pool's other currency,
+    shaped like quote_best()'s. The hook's fee is included."""
+    zero_for_one = token_out.lower() == pool["currency1"].lower()
+    quoter = contract(w3, V4_BASE["quoter"], V4_QUOTER_ABI)
+    mc     = contract(w3, MULTICALL3, MULTICALL3_ABI)
+    block, quoted = multicall(w3, [
+        (mc, "getBlockNumber", []),
+        (quoter, "quoteExactInputSingle", [(v4_key(pool), zero_for_one, amount_in, b"")]),
+    ])
+    if not quoted or not quoted[0]:
+        return None
+    return {
+        "pool": pool["id"],
+        "amount_out": quoted[0],
+        "gas_estimate": quoted[1],
+        "block": block,
+        "slippage_bps": slippage_bps,
+        "min_out": quoted[0] * (10_000 - slippage_bps) // 10_000,
     }
-    tx["gas"] = w3.eth.estimate_gas({**tx, "from": account.address})
-    return send_tx(w3, account, tx)
+
+def permit2_permit(account, cfg, token, spender, nonce):
+    """Universal Router PERMIT2_PERMIT input granting `spender` an unlimited Permit2
+    allowance on `token` for PERMIT2_EXPIRY, signed off-chain (EIP-712) — no tx."""
+    from eth_abi import encode
+    now = int(time.time())
+    details = {"token": Web3.to_checksum_address(token), "amount": 2**160 - 1,
+               "expiration": now + PERMIT2_EXPIRY, "nonce": nonce}
+    message = {"details": details, "spender": Web3.to_checksum_address(spender), "sigDeadline": now + PERMIT2_SIG_TTL}
+    signed = account.sign_typed_data(
+        domain_data={"name": "Permit2", "chainId": cfg["chain_id"], "verifyingContract": PERMIT2},
+        message_types={
+            "PermitSingle": [{"name": "details", "type": "PermitDetails"}, {"name": "spender", "type": "address"},
+                             {"name": "sigDeadline", "type": "uint256"}],
+            "PermitDetails": [{"name": "token", "type": "address"}, {"name": "amount", "type": "uint160"},
+                              {"name": "expiration", "type": "uint48"}, {"name": "nonce", "type": "uint48"}],
+        },
+        message_data=message,
+    )
+    return encode(["((address,uint160,uint48,uint48),address,uint256)", "bytes"], [
+        (tuple(details.values()), message["spender"], message["sigDeadline"]), bytes(signed.signature)])
+
+def v4_buy(pool, token_out, amount_in, min_out, pay_eth=True, permit=None):
+    """Universal Router (commands, inputs) spending amount_in of native ETH (pay_eth) or
+    of our WETH on token_out, in one V4_SWAP: SWAP_EXACT_IN_SINGLE, SETTLE the input,
+    TAKE_ALL of the output to the sender — reverting below min_out.
+
+    The input is moved to whatever the pool pairs with: ETH is wrapped in the router
+    (WRAP_ETH) for a WETH pool; WETH is pulled through Permit2 (PERMIT2_PERMIT first
+    when `permit` is given) and settled straight from us, or unwrapped in the router
+    for a native-ETH pool.
+    """
+    from eth_abi import encode
+    pay = pool["currency0"] if token_out.lower() == pool["currency1"].lower() else pool["currency1"]
+    commands, inputs = b"", []
+    if permit:
+        commands += bytes([UR_PERMIT2_PERMIT])
+        inputs.append(permit)
+    payer_is_user = False
+    if pay_eth and int(pay, 16):
+        commands += bytes([UR_WRAP_ETH])
+        inputs.append(encode(["address", "uint256"], [UR_ADDRESS_THIS, amount_in]))
+    elif not pay_eth and not int(pay, 16):
+        commands += bytes([UR_PERMIT2_TRANSFER_FROM, UR_UNWRAP_WETH])
+        inputs.append(encode(["address", "address", "uint160"], [INPUTS["base"]["WETH"][0], UR_ADDRESS_THIS, amount_in]))
+        inputs.append(encode(["address", "uint256"], [UR_ADDRESS_THIS, amount_in]))
+    elif not pay_eth:
+        payer_is_user = True
+    actions = bytes([V4_SWAP_EXACT_IN_SINGLE, V4_SETTLE, V4_TAKE_ALL])
+    params = [
+        encode(["((address,address,uint24,int24,address),bool,uint128,uint128,bytes)"],
+               [(v4_key(pool), pay == pool["currency0"], amount_in, min_out, b"")]),
+        encode(["address", "uint256", "bool"], [pay, V4_OPEN_DELTA, payer_is_user]),
+        encode(["address", "uint256"], [Web3.to_checksum_address(token_out), min_out]),
+    ]
+    commands += bytes([UR_V4_SWAP])
+    inputs.append(encode(["bytes", "bytes[]"], [actions, params]))
+    return commands, inputs
+
+def clanker_buy(w3, account, cfg, token, amount_in, quote, pay_eth=True, permit=None, gas=None):
+    """Submit a buy of a Clanker token at quote["min_out"] (see v4_buy); returns the
+    pending tx.
+
+    Pass `gas` when the buy is pipelined behind an approval that hasn't landed yet —
+    estimation would fail against current state.
+    """
+    pool = clanker_pool(w3, token)
+    commands, inputs = v4_buy(pool, token, amount_in, quote["min_out"], pay_eth, permit)
+    router = contract(w3, V4_BASE["universal_router"], UNIVERSAL_ROUTER_ABI)
+    fn = router.functions.execute(commands, inputs, int(time.time()) + 3600)
+    return submit_tx(w3, account, build_call_tx(cfg, account, fn, value=amount_in if pay_eth else 0, gas=gas))
 
 
 def red_burn_eligible(w3, wallet_addr):
     """Returns (balance, total_supply, pct, eligible) for RED."""
-    red_addr = Web3.to_checksum_address(TOKENS["RED"]["address"])
-    red_c = w3.eth.contract(address=red_addr, abi=ERC20_ABI)
-    balance = red_c.functions.balanceOf(Web3.to_checksum_address(wallet_addr)).call()
-    total   = red_c.functions.totalSupply().call()
+    red_c = contract(w3, TOKENS["RED"]["address"], ERC20_ABI)
+    balance, total = multicall(w3, [
+        (red_c, "balanceOf", [Web3.to_checksum_address(wallet_addr)]),
+        (red_c, "totalSupply", []),
+    ])
+    balance, total = balance or 0, total or 0
     pct = balance / total if total > 0 else 0
     return balance, total, pct, pct >= RED_BURN_THRESHOLD
 
-# ── Commands ───────────────────────────────────────────────────────────────────
+# ── Prices (from Uniswap pools — no price API) ─────────────────────────────────
 
-def cmd_swap(args):
-    symbol_out = args.token_out.upper()
-    symbol_in  = args.token_in.upper() if args.token_in else "WETH"
+_PRICES = {}   # (chain, token, twap) → (monotonic time, price), reused for about one block
+
+def pool_price(sqrt_price_x96, token_is_0, dec_token, dec_other):
+    """Whole units of the pool's other currency per whole `token`, from sqrtPriceX96."""
+    raw = (sqrt_price_x96 / Q96) ** 2   # token1 per token0, raw units
+    return (raw if token_is_0 else 1 / raw) * 10 ** (dec_token - dec_other)
+
+def price_sources(w3, chain, token, quote, tok, twap):
+    """[(pool, token_is_0, calls)] that can price `token` in `quote`: every v3 tier, or
+    the token's Clanker v4 pool (paired with ETH, read through StateView)."""
+    if "clanker" in tok:
+        try:
+            pool = clanker_pool(w3, token)
+        except CommandFailed as e:
+            log(f"{e} — can't price it")
+            return []
+        pid  = bytes.fromhex(pool["id"][2:])
+        sv   = contract(w3, V4_BASE["state_view"], V4_STATE_VIEW_ABI)
+        return [(pool["id"], token.lower() == pool["currency0"].lower(),
+                 [(sv, "getSlot0", [pid]), (sv, "getLiquidity", [pid])])]
+    sources = []
+    for addr in pool_address(w3, chain, token, quote).values():
+        c = contract(w3, addr, V3_POOL_ABI)
+        calls = [(c, "slot0", []), (c, "liquidity", [])] + ([(c, "observe", [[twap, 0]])] if twap else [])
+        sources.append((addr, token.lower() < quote.lower(), calls))
+    return sources
+
+def chain_prices(chain, tokens, twap=0):
+    """Prices on one chain: {"ETH": {"usd", ...}, symbol: {"eth", "usd", ...}} for
+    `tokens` ({symbol: TOKENS-style entry}); a token with no pool maps to None.
+
+    ETH/USD is the deepest WETH/USDC pool, a token's ETH price its deepest pool against
+    WETH — all read in one multicall. twap > 0 uses the tick averaged over that many
+    seconds (observe()) instead of slot0; v4 pools and pools without enough history stay
+    spot ("twap": 0). Prices are reused for about one block in-process and for
+    STATE_TTL["price"] across runs.
+    """
+    cfg  = CHAINS[chain]
+    now  = time.monotonic()
+    want = {"ETH": (cfg["weth"], 18, cfg["usdc"], cfg["usdc_decimals"], {})}
+    want.update({sym: (tok["address"], tok["decimals"], cfg["weth"], 18, tok) for sym, tok in tokens.items()})
+    prices, todo = {}, {}
+    for sym, (token, *_rest) in want.items():
+        key = (chain, token.lower(), twap)
+        hit = _PRICES.get(key)
+        if hit and now - hit[0] < cfg["block_time"]:
+            prices[sym] = hit[1]
+            continue
+        cached = STATE.get("price", cfg["chain_id"], token, twap, ttl=STATE_TTL["price"])
+        if cached:
+            prices[sym] = cached
+            _PRICES[key] = (now, cached)
+        else:
+            todo[sym] = want[sym]
+    if not todo:
+        return prices
+
+    w3, _ = connect(chain)
+    mc    = contract(w3, MULTICALL3, MULTICALL3_ABI)
+    plans = {sym: price_sources(w3, chain, token, quote, tok, twap)
+             for sym, (token, _, quote, _, tok) in todo.items()}
+    calls = [(mc, "getBlockNumber", [])] + [c for srcs in plans.values() for *_, cs in srcs for c in cs]
+    block, *values = multicall(w3, calls)
+
+    raw, i = {}, 0
+    for sym, sources in plans.items():
+        token, dec, _, quote_dec, _ = todo[sym]
+        best = None
+        for pool, token_is_0, cs in sources:
+            slot0, liquidity, obs = values[i], values[i + 1], values[i + 2] if len(cs) > 2 else None
+            i += len(cs)
+            if not slot0 or not liquidity or (best and liquidity <= best[0]):
+                continue
+            sqrt_price, used = slot0[0], 0
+            if obs:
+                sqrt_price, used = sqrt_ratio_at_tick((obs[0][1] - obs[0][0]) // twap), twap
+            best = (liquidity, pool, pool_price(sqrt_price, token_is_0, dec, quote_dec), used)
+        raw[sym] = best and {"pool": best[1], "block": block, "twap": best[3], "price": best[2]}
+
+    usd_per_eth = prices["ETH"]["usd"] if "ETH" in prices else raw["ETH"] and raw["ETH"]["price"]
+    for sym, r in raw.items():
+        if r is None:
+            log(f"No pool prices {sym} on {chain}")
+            prices[sym] = None
+            continue
+        p = r.pop("price")
+        r.update({"usd": p} if sym == "ETH" else {"eth": p, "usd": p * usd_per_eth if usd_per_eth else None})
+        prices[sym] = r
+        _PRICES[(chain, todo[sym][0].lower(), twap)] = (now, r)
+        STATE.put("price", cfg["chain_id"], todo[sym][0], twap, value=r, block=block)
+    return prices
+
+def token_prices(symbols, twap=0):
+    """{symbol: price} for TOKENS symbols or Clanker token addresses, plus "ETH" (priced on
+    Base). One chain_prices() per chain, chains read concurrently."""
+    by_chain = {"base": {}}
+    for sym in symbols:
+        name, tok = resolve_token_out(sym)
+        by_chain.setdefault(tok["chain"], {})[name] = tok
+    with ThreadPoolExecutor(max_workers=len(by_chain)) as pool:
+        found = dict(zip(by_chain, pool.map(lambda c: chain_prices(c, by_chain[c], twap), by_chain)))
+    prices = {"ETH": found["base"]["ETH"]}
+    for chain, tokens in by_chain.items():
+        prices.update({sym: found[chain][sym] for sym in tokens})
+    return prices
+
+def eth_usd(chain="base"):
+    """ETH/USD from the chain's WETH/USDC pool — fails rather than guess."""
+    price = chain_prices(chain, {})["ETH"]
+    if not price:
+        fail(f"No WETH/USDC pool prices ETH on {chain}")
+    return price["usd"]
+
+def usd_amount(symbol_in, chain, usd):
+    """Decimal string of `symbol_in` worth `usd` at the on-chain price (USDC is $1)."""
+    if usd <= 0:
+        fail("--amount-usd must be positive")
+    if symbol_in == "USDC":
+        return f"{usd:.6f}"
+    price = eth_usd(chain)
+    log(f"${usd:g} = {usd / price:.8f} {symbol_in} at ETH ${price:,.2f} ({chain} pool)")
+    return f"{usd / price:.12f}"
+
+# ── Event index ────────────────────────────────────────────────────────────────
+
+def topic_address(addr):
+    return "0x" + addr.lower()[2:].rjust(64, "0")
+
+def fetch_logs(w3, filters, start, end):
+    """Logs matching any of `filters` in blocks [start, end], oldest first. Each
+    INDEX_MAX_RANGE-block range is one batched request carrying every filter."""
+    logs = []
+    for lo in range(start, end + 1, INDEX_MAX_RANGE):
+        hi = min(end, lo + INDEX_MAX_RANGE - 1)
+        with w3.batch_requests() as batch:
+            for f in filters:
+                batch.add(w3.eth.get_logs({**f, "fromBlock": lo, "toBlock": hi}))
+            for found in batch.execute():
+                logs.extend(found)
+    return sorted(logs, key=lambda lg: (lg["blockNumber"], lg["logIndex"]))
+
+def fees_usd(fees):
+    """{symbol: {"amount", "usd"}} and their USD total for fee-locker balances {token: raw}."""
+    cfg  = CHAINS[INDEX_CHAIN]
+    weth = cfg["weth"].lower()
+    rows = {t: ("WETH", {"address": weth, "decimals": 18}) if t == weth else resolve_token_out(t)
+            for t, amount in fees.items() if int(amount)}
+    prices = chain_prices(INDEX_CHAIN, {sym: tok for t, (sym, tok) in rows.items() if t != weth})
+    out, total = {}, 0.0
+    for t, (sym, tok) in rows.items():
+        amount = int(fees[t]) / 10 ** tok["decimals"]
+        price  = prices["ETH"] if t == weth else prices.get(sym)
+        usd    = amount * price["usd"] if price and price["usd"] else None
+        out[sym] = {"amount": amount, "usd": usd}
+        total += usd or 0
+    return out, total
+
+def scan_events(wallet, cursor="main"):
+    """Move `cursor` up to the head of INDEX_CHAIN and say whether the new blocks call for
+    a fee claim or a WETH allocation (fee-claim-and-buy.sh's two thresholds).
+
+    Follows StoreTokens / ClaimTokens on the Clanker fee locker for config.json `feeOwner`
+    (StoreTokens carries the running unclaimed balance, so nothing needs reading) and
+    WETH / RED Transfers into the punkwallet. An idle range costs eth_blockNumber and one
+    batched eth_getLogs; prices and balances are read only when something arrived. A new
+    cursor, or one more than INDEX_MAX_GAP blocks behind, is seeded from current balances.
+    Cursors are kept per wallet. `allocate` holds until an allocate run has acted on it.
+    """
+    conf      = load_config()
+    fee_owner = conf.get("feeOwner")
+    w3, cfg   = connect(INDEX_CHAIN)
+    weth, red = cfg["weth"].lower(), TOKENS["RED"]["address"].lower()
+    state = STATE.get("index", cfg["chain_id"], cursor, wallet.lower()) or {}
+    head  = w3.eth.block_number - (cfg["confirmations"] - 1)
+    start = state.get("block", 0) + 1
+    report = {"cursor": cursor, "chain": INDEX_CHAIN, "from_block": start, "to_block": head,
+              "fee_events": 0, "weth_in": 0.0, "red_in": 0.0}
+    if head < start:
+        report["from_block"] = head + 1
+        changed = {}
+    elif not state or head - start > INDEX_MAX_GAP or state.get("fee_owner") != fee_owner:
+        log(f"Event cursor '{cursor}' {'is new' if not state else 'starts over'} at block {head} — seeding from balances")
+        report.update(from_block=head + 1, seeded=True)
+        state = {"fee_owner": fee_owner, "fees": {}}
+        if fee_owner:
+            locker = contract(w3, CLANKER_FEE_LOCKER, CLANKER_FEE_LOCKER_ABI)
+            owner  = Web3.to_checksum_address(fee_owner)
+            found  = multicall(w3, [(locker, "availableFees", [owner, Web3.to_checksum_address(t)]) for t in (weth, red)],
+                               block=head)
+            state["fees"] = {t: str(v or 0) for t, v in zip((weth, red), found)}
+        changed = {"fees": bool(fee_owner), "weth": True}
+    else:
+        filters = [{"address": [Web3.to_checksum_address(weth), Web3.to_checksum_address(red)],
+                    "topics": [TRANSFER_TOPIC, None, topic_address(wallet)]}]
+        if fee_owner:
+            filters += [{"address": CLANKER_FEE_LOCKER, "topics": [STORE_TOKENS_TOPIC, None, topic_address(fee_owner)]},
+                        {"address": CLANKER_FEE_LOCKER, "topics": [CLAIM_TOKENS_TOPIC, topic_address(fee_owner)]}]
+        for lg in fetch_logs(w3, filters, start, head):
+            topic0 = Web3.to_hex(lg["topics"][0])
+            data   = Web3.to_hex(lg["data"])[2:]
+            if topic0 == TRANSFER_TOPIC:
+                token = lg["address"].lower()
+                key   = "weth_in" if token == weth else "red_in"
+                report[key] += int(data[:64], 16) / 1e18
+            elif topic0 == STORE_TOKENS_TOPIC:
+                token = "0x" + Web3.to_hex(lg["topics"][3])[-40:]
+                state["fees"][token] = str(int(data[:64], 16))   # balance after this store
+                report["fee_events"] += 1
+            elif topic0 == CLAIM_TOKENS_TOPIC:
+                state["fees"]["0x" + Web3.to_hex(lg["topics"][2])[-40:]] = "0"
+                report["fee_events"] += 1
+        changed = {"fees": report["fee_events"] > 0, "weth": report["weth_in"] > 0}
+
+    if changed.get("fees"):
+        state["fees_detail"], state["fees_usd"] = fees_usd(state["fees"])
+    report["fees"], report["fees_usd"] = state.get("fees_detail", {}), state.get("fees_usd", 0.0)
+    min_claim = float(conf.get("minThresholdUSD", 10))
+    report["claim"] = report["fees_usd"] >= min_claim if fee_owner else None
+    # An allocation WETH called for stays pending until an allocate run buys or batches
+    # something — a run that failed or stopped short doesn't consume the arrival
+    report["allocate"] = False
+    pending = state.pop("allocate_since", None)
+    if pending and os.path.exists(JOURNAL_FILE) and JOURNAL.allocated_since(pending):
+        pending = None
+    if changed.get("weth") or pending:
+        c = contract(w3, weth, ERC20_ABI)
+        (balance,) = multicall(w3, [(c, "balanceOf", [wallet])])
+        batched = JOURNAL.queued_weth() if os.path.exists(JOURNAL_FILE) else 0.0
+        report["weth_balance"] = (balance or 0) / 1e18
+        report["allocate_usd"] = max(0.0, report["weth_balance"] - batched) * ALLOCATE_PCT / 100 * eth_usd(INDEX_CHAIN)
+        report["allocate"] = report["allocate_usd"] >= float(conf.get("wethFallbackMin", 1))
+        if report["allocate"]:
+            state["allocate_since"] = pending or int(time.time())
+            report["allocate_pending"] = bool(pending)
+    report["changed"] = any(changed.values())
+    state["block"] = max(head, state.get("block", 0))
+    STATE.put("index", cfg["chain_id"], cursor, wallet.lower(), value=state, block=head)
+    return report
+
+# ── Rebalance planning ─────────────────────────────────────────────────────────
+
+def water_fill(gaps, budget):
+    """Buys, in the order of `gaps` (value − target each), that spend `budget` lifting the
+    furthest-below-target first: every token bought ends the same amount above target."""
+    order = sorted(range(len(gaps)), key=gaps.__getitem__)
+    level, total = 0.0, 0.0
+    for k, i in enumerate(order, 1):
+        total += gaps[i]
+        level = (budget + total) / k
+        if k == len(order) or level <= gaps[order[k]]:
+            break
+    return [max(0.0, level - g) for g in gaps]
+
+def trade_costs(address, symbols, leg_weth, eth_price):
+    """cost(symbol, amount_weth) → (USD, bridged?) for one buy: gas at the chain's current
+    fees and, for an Arbitrum buy the wallet can't fund there, Across's relay fee plus the
+    deposit's gas on Base. Across is quoted once, at the symbol's `leg_weth` size."""
+    chains = {TOKENS[s]["chain"] for s in symbols}
+    if "arbitrum" in chains:
+        chains.add("base")   # bridge deposits
+    gas_usd = {}
+    for chain in chains:
+        w3, cfg = connect(chain)
+        gas_usd[chain] = FEES.expected(w3, cfg) / 1e18 * eth_price
+    arb_spare, relay = None, {}
+
+    def cost(sym, amount_weth):
+        nonlocal arb_spare
+        tok = TOKENS[sym]
+        usd = PLAN_GAS["clanker_buy" if "clanker" in tok else "swap"] * gas_usd[tok["chain"]]
+        if tok["chain"] != "arbitrum":
+            return usd, False
+        if arb_spare is None:
+            arb_spare = (arbitrum_funds(address)[1] - CHAINS["arbitrum"]["gas_reserve"]) / 1e18
+        if amount_weth <= arb_spare:
+            return usd, False
+        if sym not in relay:
+            resp = across_quote(address, int(max(leg_weth[sym], amount_weth) * 1e18))
+            relay[sym] = int(resp["totalRelayFee"]["total"]) / 1e18 * eth_price
+        return usd + relay[sym] + PLAN_GAS["across_deposit"] * gas_usd["base"], True
+    return cost
+
+def plan_rebalance(address, split, weth, tolerance_pct=REBALANCE_TOLERANCE_PCT):
+    """Cheapest buys of the `split` tokens that spend `weth` and leave every token within
+    ± tolerance_pct points of its target weight — or, when no plan reaches the band, the
+    budget water-filled across all of them (closest to the targets).
+
+    Weights come from the wallet's balances (balance_snapshot) at pool prices. Each subset
+    of tokens is tried (2^n − 1, n ≤ 5 here) with the budget water-filled into its most
+    underweight members, and costed with trade_costs(). Tokens without a pool price can't
+    be weighed and keep their fixed share of the split. Buy-only: nothing is sold.
+    """
+    weth   = float(weth)
+    wanted = {s: pct for s, pct in split.items() if pct > 0}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        snap_f   = pool.submit(balance_snapshot, address, "ALL")
+        prices   = token_prices(list(wanted))
+        holdings = snap_f.result()["data"]
+    if not prices["ETH"]:
+        fail("No WETH/USDC pool prices ETH on base")
+    eth_price = prices["ETH"]["usd"]
+
+    fixed = [s for s in wanted if not (prices[s] and prices[s]["usd"])]
+    syms  = [s for s in wanted if s not in fixed]
+    for sym in fixed:
+        log(f"{sym} has no pool price — keeps its fixed {wanted[sym]:g}% share")
+    budget = weth * sum(wanted[s] for s in syms) / 100 * eth_price
+
+    # Parallel arrays over syms: value held, target weight, gap to target after the buy
+    value  = [holdings[s]["balance"] * prices[s]["usd"] for s in syms]
+    weight = [wanted[s] / sum(wanted[t] for t in syms) for s in syms]
+    total  = sum(value) + budget
+    gap    = [v - w * total for v, w in zip(value, weight)]
+    leg_weth = {s: weth * wanted[s] / 100 for s in wanted}
+    cost     = trade_costs(address, list(wanted), leg_weth, eth_price)
+
+    def evaluate(members):
+        buy = [0.0] * len(syms)
+        for i, x in zip(members, water_fill([gap[i] for i in members], budget) if members else []):
+            buy[i] = x
+        after = [(v + b) / total if total else 0.0 for v, b in zip(value, buy)]
+        dev   = max((abs(a - w) for a, w in zip(after, weight)), default=0.0)
+        costs = {i: cost(syms[i], buy[i] / eth_price) for i in members if buy[i] > 0}
+        return buy, after, dev, costs
+
+    # Cheapest subset that lands in band; a subset with an idle member is skipped, the
+    # smaller one spends the budget the same way
+    best, tol = None, tolerance_pct / 100
+    for mask in range(1 if budget > 0 else 0, 1 << len(syms)):
+        members = [i for i in range(len(syms)) if mask >> i & 1]
+        plan = evaluate(members)
+        if plan[2] > tol or len(plan[3]) < len(members):
+            continue
+        usd = sum(c for c, _ in plan[3].values())
+        if best is None or usd < best[0]:
+            best = (usd, plan)
+    # Out of reach: water-fill every token, which minimises the squared deviation
+    buy, after, dev, costs = best[1] if best else evaluate(list(range(len(syms))))
+
+    trades = []
+    for i, sym in enumerate(syms):
+        if buy[i] > 0:
+            usd, bridged = costs[i]
+            trades.append({"token": sym, "chain": TOKENS[sym]["chain"], "amount_weth": buy[i] / eth_price,
+                           "usd": buy[i], "cost_usd": usd, "bridge": bridged})
+    for sym in fixed:
+        usd, bridged = cost(sym, leg_weth[sym])
+        trades.append({"token": sym, "chain": TOKENS[sym]["chain"], "amount_weth": leg_weth[sym],
+                       "usd": None, "cost_usd": usd, "bridge": bridged, "unpriced": True})
+    tokens = {sym: {"value_usd": value[i], "weight": value[i] / sum(value) if sum(value) else 0.0,
+                    "target": weight[i], "weight_after": after[i] if after else None,
+                    "buy_usd": buy[i] if buy else 0.0}
+              for i, sym in enumerate(syms)}
+    # Percent of `weth` per leg, rounded down so allocate never spends more than planned
+    pcts = {t["token"]: int(round(t["amount_weth"] / weth * 100, 9) * 10**4) / 10**4 for t in trades}
+    return {
+        "address": address, "weth": weth, "eth_usd": eth_price, "tolerance_pct": tolerance_pct,
+        "tokens": tokens, "trades": trades,
+        "split": {s: p for s, p in pcts.items() if p > 0},
+        "in_band": dev <= tol,
+        "max_deviation_pct": dev * 100,
+        "txs": len(trades) + sum(1 for t in trades if t["bridge"]),
+        "cost_usd": sum(t["cost_usd"] for t in trades),
+    }
+
+# ── Batching (small allocation legs) ───────────────────────────────────────────
+
+def batch_legs(legs, run_id, address, max_cost_pct, max_delay):
+    """Add allocate's legs to their tokens' batches in the journal; returns (legs to run
+    now, deferred legs). A token's whole batch runs as one leg once buying it costs at most
+    max_cost_pct of its notional (trade_costs(): gas at current fees, plus Across for an
+    Arbitrum buy that needs a bridge) or its oldest amount has waited max_delay seconds.
+    A flush with txs still in flight is retried first, for the same amount; a failed one
+    goes back in the queue (allocate releases it). A flush never asks for more WETH than
+    the wallet has: what's queued beyond that is written off with the batch. Zero-amount
+    legs are not queued, and a batch that adds up to nothing is closed unpriced."""
+    for leg in legs:
+        if leg["amount_weth"] > 0:
+            JOURNAL.batch_add(f"{run_id}:batch:{leg['token']}" if run_id else None,
+                              leg["token"], leg["chain"], leg["amount_weth"])
+    batches = JOURNAL.open_batches()
+    for sym, b in list(batches.items()):
+        if b["amount_weth"] <= 0:
+            leg_key = b["leg_key"] or f"batch:{sym}:{int(time.time())}"
+            if not b["leg_key"]:
+                JOURNAL.batch_take(sym, leg_key)
+            JOURNAL.batch_done(leg_key)
+            log(f"Batch {sym}: nothing queued — closed")
+            del batches[sym]
+    if not batches:
+        return [], []
+    eth_price = eth_usd("base")
+    cost = trade_costs(address, list(batches), {s: b["amount_weth"] for s, b in batches.items()}, eth_price)
+    now, run, deferred = time.time(), [], []
+    for sym, b in batches.items():
+        usd, _ = cost(sym, b["amount_weth"])
+        share  = usd / (b["amount_weth"] * eth_price) * 100
+        due    = b["since"] + max_delay
+        leg    = {"token": sym, "chain": b["chain"], "amount_weth": b["amount_weth"], "cost_pct": round(share, 2)}
+        if b["leg_key"] or share <= max_cost_pct or now >= due:
+            leg["leg_key"] = b["leg_key"] or f"batch:{sym}:{int(now)}"
+            log(f"Batch {sym}: {b['amount_weth']:.8f} WETH at {share:.2f}% cost"
+                f"{' — max delay reached' if share > max_cost_pct and not b['leg_key'] else ''}")
+            run.append(leg)
+        else:
+            leg.update(result("deferred", f"{b['amount_weth']:.8f} WETH batched — buying now costs {share:.1f}% "
+                              f"(> {max_cost_pct:g}%); runs by {time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(due))}"))
+            deferred.append(leg)
+    fresh = [leg for leg in run if not batches[leg["token"]]["leg_key"]]
+    if fresh:
+        cap_flushes(fresh, address)
+    for leg in fresh:
+        if leg["amount_weth"] > 0:
+            JOURNAL.batch_take(leg["token"], leg["leg_key"])
+        else:
+            run.remove(leg)
+            leg.update(result("deferred", "No WETH left to flush the batch — waiting for more"))
+            deferred.append(leg)
+    return run, deferred
+
+def cap_flushes(legs, address):
+    """Shrink flushes (in place) to the WETH the wallet holds: Base WETH, plus spare funds
+    on Arbitrum for Arbitrum buys (the rest is bridged from Base)."""
+    w3, cfg = connect("base")
+    base = contract(w3, cfg["weth"], ERC20_ABI).functions.balanceOf(Web3.to_checksum_address(address)).call() / 1e18
+    arb  = 0.0
+    if any(leg["chain"] == "arbitrum" for leg in legs):
+        arb = max(0, arbitrum_funds(address)[1] - CHAINS["arbitrum"]["gas_reserve"]) / 1e18
+    for leg in legs:
+        want  = leg["amount_weth"]
+        local = min(want, arb) if leg["chain"] == "arbitrum" else 0.0
+        arb  -= local
+        leg["amount_weth"] = local + min(want - local, base)
+        base -= leg["amount_weth"] - local
+        if 0 < leg["amount_weth"] < want:
+            log(f"Batch {leg['token']}: {want:.8f} WETH queued but only {leg['amount_weth']:.8f} available"
+                f" — the rest is written off")
 
-    if symbol_out not in TOKENS:
-        fail(f"Unknown token-out: {symbol_out}. Supported: {', '.join(TOKENS)}")
+# ── Commands ───────────────────────────────────────────────────────────────────
 
-    tok     = TOKENS[symbol_out]
+def resolve_token_out(symbol_out):
+    """(symbol, TOKENS-style entry) for a TOKENS symbol or a Base token address — an
+    address not in TOKENS is taken to be a Clanker token."""
+    if not Web3.is_address(symbol_out):
+        symbol_out = symbol_out.upper()
+        if symbol_out not in TOKENS:
+            fail(f"Unknown token-out: {symbol_out}. Supported: {', '.join(TOKENS)} or a Clanker token address")
+        return symbol_out, TOKENS[symbol_out]
+    addr = Web3.to_checksum_address(symbol_out)
+    known = next(((s, t) for s, t in TOKENS.items() if t["address"].lower() == addr.lower()), None)
+    if known:
+        return known
+    w3, cfg = connect("base")
+    meta = token_meta(w3, cfg["chain_id"], addr)
+    return meta["symbol"], {"chain": "base", "address": addr, "decimals": meta["decimals"], "clanker": {}}
+
+def swap_leg(symbol_in, symbol_out, amount, slippage_bps=DEFAULT_SLIPPAGE_BPS, bridge=True, leg_key=None):
+    """_swap_leg(), journaled. A leg_key the journal already has is not sent twice: a
+    completed (or bridge-queued) leg returns its recorded reply, and one with txs in
+    flight waits for them before deciding whether anything is left to do."""
+    symbol, tok = resolve_token_out(symbol_out)
+    leg = JOURNAL.open_leg(leg_key, tok["chain"], (symbol_in or "WETH").upper(), symbol, tok["address"],
+                           float(amount), tok["decimals"])
+    if leg["status"] == "completed" or (leg["status"] == "queued" and bridge):
+        log(f"{symbol} leg {leg_key} already {leg['status']} — not sending it again")
+        reply = json.loads(leg["reply"])
+        reply.setdefault("data", {})["resumed"] = True
+        return reply
+    if leg["status"] == "in_flight":
+        reply = resume_leg(leg, swap={"token_in": (symbol_in or "WETH").upper(), "token_out": symbol,
+                                      "amount": amount, "slippage_bps": slippage_bps, "leg_key": leg_key})
+        if reply:
+            return reply
+    JOURNAL.set_leg(leg["id"])
+    try:
+        reply = _swap_leg(symbol_in, symbol_out, amount, slippage_bps, bridge, leg_key)
+    except CommandFailed as e:
+        JOURNAL.close_leg(leg["id"], "failed", result("failed", str(e)))
+        raise
+    finally:
+        JOURNAL.set_leg(None)
+    row = JOURNAL.leg(leg["id"]) if leg["id"] else None
+    if row and row["qty_out"]:
+        reply.setdefault("data", {})["amount_out"] = row["qty_out"]
+    JOURNAL.close_leg(leg["id"], "queued" if "bridge" in reply.get("data", {}) else reply["status"], reply)
+    return reply
+
+def resume_leg(leg, swap):
+    """Wait out the txs an earlier run sent for this leg. Returns the leg's reply when they
+    completed it or left it queued behind an Across bridge still in flight, None when it
+    has to run again (a tx reverted, never carried the swap, or its bridge has landed).
+    `swap` is the swap_leg arguments, for a bridge record the earlier run never wrote."""
+    pendings = JOURNAL.unsettled(leg["id"])
+    if pendings:
+        log(f"Resuming {leg['token_out']} leg: waiting for {len(pendings)} tx(s) sent by an earlier run")
+        # Each tx on its own chain — a GRT leg's bridge approve and deposit are on Base
+        by_chain = {}
+        for p in pendings:
+            by_chain.setdefault(p["tx"]["chainId"], []).append(p)
+        errors = []
+        for chain_id, group in by_chain.items():
+            w3, _ = connect(next(n for n, c in CHAINS.items() if c["chain_id"] == chain_id))
+            try:
+                wait_receipts(w3, get_account(), group)
+            except CommandFailed as e:
+                errors.append(e)
+        if errors:
+            e = errors[0]
+            if JOURNAL.unsettled(leg["id"]):
+                fail(f"{leg['token_out']} leg still has txs in flight from an earlier run ({e}) — not re-sending")
+            log(f"Earlier {leg['token_out']} attempt failed ({e}) — running the leg again")
+            return None
+    row = JOURNAL.leg(leg["id"])
+    if not row["qty_out"]:
+        return resume_bridge(row, swap)
+    mined = JOURNAL.query("SELECT hash FROM txs WHERE leg_id = ? AND status = 'mined' ORDER BY nonce DESC LIMIT 1",
+                          (row["id"],))
+    tx_hash = mined[0]["hash"] if mined else None
+    reply = result("completed", f"Resumed {row['token_out']} leg: received {row['qty_out']:.8g} {row['token_out']}. "
+                   f"TX: {tx_hash}", tx=tx_hash, data={"resumed": True, "amount_out": row["qty_out"]})
+    JOURNAL.close_leg(row["id"], "completed", reply)
+    return reply
+
+def resume_bridge(row, swap):
+    """The queued reply for a leg whose earlier run got an Across deposit mined — so it is
+    never bridged twice — or None when it has none or that bridge has already closed."""
+    spoke = ACROSS_SPOKE_BASE.lower()
+    deposit = next((t for t in JOURNAL.query("SELECT * FROM txs WHERE leg_id = ? AND chain_id = ? AND status = 'mined'"
+                                             " ORDER BY nonce DESC", (row["id"], CHAINS["base"]["chain_id"]))
+                    if (json.loads(t["tx"]).get("to") or "").lower() == spoke), None)
+    if deposit is None:
+        return None
+    known = JOURNAL.bridge(deposit["hash"])
+    if known and known["closed_at"]:
+        return None
+    record = known["record"] if known else recover_bridge(deposit, swap)
+    reply = result("completed",
+        f"Resumed {row['token_out']} leg: Across deposit {deposit['hash']} still in flight. "
+        f"{row['token_out']} swap is queued — `bridges` runs it once the funds arrive.",
+        tx=deposit["hash"], data={"bridge": record, "resumed": True})
+    JOURNAL.close_leg(row["id"], "queued", reply)
+    return reply
+
+def _swap_leg(symbol_in, symbol_out, amount, slippage_bps=DEFAULT_SLIPPAGE_BPS, bridge=True, leg_key=None):
+    """Swap `amount` (decimal string) of symbol_in into symbol_out; returns the reply dict.
+
+    On Arbitrum with no funds, WETH is bridged from Base first (unless bridge=False).
+    symbol_out may also be a Base token address, bought on its Clanker v4 pool."""
+    symbol_in       = symbol_in.upper() if symbol_in else "WETH"
+    symbol_out, tok = resolve_token_out(symbol_out)
     chain   = tok["chain"]
     w3, cfg = connect(chain)
 
@@ -373,126 +3031,350 @@ def cmd_swap(args):
     token_out_addr = tok["address"]
     router_addr    = cfg["router"]
 
-    log(f"Fetching private key from 1claw vault...")
-    pk      = get_private_key()
-    account = Account.from_key(pk)
-    log(f"Wallet: {account.address}")
-
-    amount_in = int(float(args.amount) * (10 ** token_in_decimals))
-    log(f"Swap: {args.amount} {symbol_in} → {symbol_out} on {chain}")
-
-    # Check tokenIn balance — auto-wrap native ETH → WETH if needed
-    tin_contract = w3.eth.contract(address=Web3.to_checksum_address(token_in_addr), abi=ERC20_ABI)
-    balance = tin_contract.functions.balanceOf(account.address).call()
+    account = get_account()
+
+    amount_in = int(float(amount) * (10 ** token_in_decimals))
+    log(f"Swap: {amount} {symbol_in} → {symbol_out} on {chain}")
+
+    # Txs submitted but not yet mined, in nonce order — later steps are pipelined behind them
+    in_flight = []
+
+    # Clanker tokens trade on their v4 pool through the Universal Router, which pulls
+    # WETH via Permit2; everything else goes through SwapRouter02
+    clanker = "clanker" in tok
+    if clanker and symbol_in != "WETH":
+        fail(f"{symbol_out} trades on a Clanker pool against WETH/ETH — use --token-in WETH")
+    spender = PERMIT2 if clanker else router_addr
+
+    # (tokenIn balance, native ETH, spender allowance[, Permit2 allowance]) in one round
+    # trip; the ERC20 allowance is skipped when the state cache already knows it covers
+    # this swap
+    tin_contract = contract(w3, token_in_addr, ERC20_ABI)
+    allowance = cached_allowance(cfg["chain_id"], token_in_addr, account.address, spender)
+    calls = [
+        (tin_contract, "balanceOf", [account.address]),
+        eth_balance_call(w3, account.address),
+    ]
+    if clanker:
+        calls.append((contract(w3, PERMIT2, PERMIT2_ABI), "allowance",
+                      [account.address, token_in_addr, Web3.to_checksum_address(V4_BASE["universal_router"])]))
+    if allowance is None or allowance < amount_in:
+        calls.append((tin_contract, "allowance", [account.address, Web3.to_checksum_address(spender)]))
+    balance, eth_bal, *read = multicall(w3, calls)
+    balance, eth_bal = balance or 0, eth_bal or 0
+    permit2 = read.pop(0) if clanker else None
+    if read:
+        allowance = read[0] or 0
+        STATE.put("allowance", cfg["chain_id"], token_in_addr, account.address, spender, value=str(allowance))
     log(f"{symbol_in} balance: {balance / 10**token_in_decimals:.6f}")
+
+    # Pay in WETH when it covers the swap; otherwise in native ETH sent with the swap
+    # itself (both routers wrap msg.value), so there is no wrap or approval tx
+    pay_eth = False
     if balance < amount_in and symbol_in == "WETH":
-        eth_bal = w3.eth.get_balance(account.address)
-        keep_gas = int(0.003 * 1e18)  # reserve for gas
-        log(f"WETH token balance insufficient — native ETH: {eth_bal/1e18:.6f}, need {args.amount} WETH")
+        keep_gas = cfg["gas_reserve"]
+        log(f"WETH token balance insufficient — native ETH: {eth_bal/1e18:.6f}, need {amount} WETH")
         if eth_bal - keep_gas >= amount_in:
-            log(f"Auto-wrapping {amount_in/1e18:.6f} ETH → WETH...")
-            WETH_DEPOSIT_ABI = [{"name": "deposit", "type": "function", "inputs": [], "outputs": [], "stateMutability": "payable"}]
-            weth_c = w3.eth.contract(address=Web3.to_checksum_address(token_in_addr), abi=WETH_DEPOSIT_ABI)
-            wrap_tx = weth_c.functions.deposit().build_transaction({
-                "chainId": cfg["chain_id"],
-                "from": account.address,
-                "value": amount_in,
-                "maxFeePerGas": w3.eth.gas_price * 2,
-                "maxPriorityFeePerGas": w3.eth.gas_price,
-            })
-            send_tx(w3, account, wrap_tx)
-            balance = tin_contract.functions.balanceOf(account.address).call()
-            log(f"Wrapped — WETH balance now: {balance / 10**token_in_decimals:.6f}")
-        elif chain == "arbitrum":
-            # Check if native ETH arrived from a previous bridge (Across delivers ETH on Arbitrum)
-            keep_gas = int(0.003 * 1e18)
-            if eth_bal - keep_gas >= amount_in:
-                log(f"Native ETH on Arbitrum ({eth_bal/1e18:.6f}) — wrapping to WETH before swap...")
-                WETH_DEPOSIT_ABI = [{"name": "deposit", "type": "function", "inputs": [], "outputs": [], "stateMutability": "payable"}]
-                weth_c = w3.eth.contract(address=Web3.to_checksum_address(token_in_addr), abi=WETH_DEPOSIT_ABI)
-                wrap_tx = weth_c.functions.deposit().build_transaction({
-                    "chainId": cfg["chain_id"],
-                    "from": account.address,
-                    "value": amount_in,
-                    "maxFeePerGas": w3.eth.gas_price * 2,
-                    "maxPriorityFeePerGas": w3.eth.gas_price,
-                })
-                send_tx(w3, account, wrap_tx)
-                balance = tin_contract.functions.balanceOf(account.address).call()
-                log(f"Wrapped — Arbitrum WETH balance: {balance / 10**token_in_decimals:.6f}")
+            # on Arbitrum this is usually a landed Across bridge
+            log(f"Paying with {amount_in/1e18:.6f} native ETH (wrapped by the router in the swap tx)")
+            pay_eth = True
+        elif chain == "arbitrum" and bridge:
+            # No funds on Arbitrum — bridge from Base (unless a bridge is already in flight),
+            # then run this swap as soon as the Across fill lands
+            pending = open_bridges(account.address)
+            if pending:
+                record = pending[0]
+                log(f"Across deposit {record['deposit_tx']} still in flight — waiting for its fill...")
             else:
-                # No existing funds on Arbitrum — fire bridge from Base and skip this run's GRT swap
-                log("No WETH/ETH on Arbitrum — bridging from Base (swap will execute next run)...")
-                bridge_weth_to_arbitrum(account, amount_in)
-                out("completed", f"Bridged {float(args.amount):.6f} WETH Base→Arbitrum via Across. GRT swap will execute next run when funds arrive.")
-                return
+                log("No WETH/ETH on Arbitrum — bridging from Base...")
+                record = bridge_weth_to_arbitrum(account, amount_in, swap={
+                    "token_in": symbol_in, "token_out": symbol_out,
+                    "amount": amount, "slippage_bps": slippage_bps, "leg_key": leg_key,
+                })
+            if await_bridge_fill(record):
+                return _swap_leg(symbol_in, symbol_out, bridged_amount(record, amount), slippage_bps, bridge=False)
+            return result("completed",
+                f"Bridged {int(record['amount'])/1e18:.6f} WETH Base→Arbitrum via Across; fill not landed yet. "
+                f"{symbol_out} swap is queued — `bridges` runs it once the funds arrive.",
+                tx=record["deposit_tx"], data={"bridge": record})
         else:
-            fail(f"Insufficient funds: {balance/10**token_in_decimals:.6f} WETH + {eth_bal/1e18:.6f} ETH (need {args.amount})")
-    if balance < amount_in:
-        fail(f"Insufficient {symbol_in}: have {balance / 10**token_in_decimals:.6f}, need {args.amount}")
-
-    # Approve router
-    ensure_approval(w3, account, token_in_addr, router_addr, amount_in, cfg)
-
-    # RED trades on the Clanker pool (not Uniswap v3) — requires native ETH
-    if symbol_out == "RED" and chain == "base":
-        log("RED uses Clanker pool — unwrapping WETH to ETH if needed, then buying...")
-        WETH_ABI_MIN = [
-            {"name": "withdraw", "type": "function", "inputs": [{"name": "wad", "type": "uint256"}], "outputs": [], "stateMutability": "nonpayable"},
-        ]
-        weth_c = w3.eth.contract(address=Web3.to_checksum_address(token_in_addr), abi=WETH_ABI_MIN)
-        if symbol_in == "WETH":
-            log(f"Unwrapping {float(args.amount):.6f} WETH → ETH...")
-            unwrap_tx = weth_c.functions.withdraw(amount_in).build_transaction({
-                "chainId": cfg["chain_id"], "from": account.address,
-                "maxFeePerGas": w3.eth.gas_price * 2, "maxPriorityFeePerGas": w3.eth.gas_price,
-            })
-            send_tx(w3, account, unwrap_tx)
-        eth_bal = w3.eth.get_balance(account.address)
-        keep_gas = int(0.001 * 1e18)
-        eth_to_spend = min(amount_in, eth_bal - keep_gas)
-        if eth_to_spend <= 0:
-            fail("Insufficient ETH after unwrap for Clanker buy")
-        log(f"Buying RED with {eth_to_spend/1e18:.6f} ETH via Clanker pool...")
-        tx_hash = clanker_buy_red(w3, account, eth_to_spend)
-        out("completed", f"Bought RED on base with {eth_to_spend/1e18:.6f} ETH via Clanker pool. TX: {tx_hash}", tx=tx_hash)
-        return
-
-    # All other tokens: Uniswap v3 exactInputSingle
-    router    = w3.eth.contract(address=Web3.to_checksum_address(router_addr), abi=ROUTER_ABI)
-    gas_price = w3.eth.gas_price
-    tx_hash   = None
+            fail(f"Insufficient funds: {balance/10**token_in_decimals:.6f} WETH + {eth_bal/1e18:.6f} ETH (need {amount})")
+    elif balance < amount_in:
+        fail(f"Insufficient {symbol_in}: have {balance / 10**token_in_decimals:.6f}, need {amount}")
+
+    # Plan: the one-time ERC20 approval (of the router, or of Permit2 for Clanker buys)
+    # rides in the same block as the swap; a Permit2 allowance is signed off-chain and
+    # carried by the swap tx
+    plan = {"pay": "ETH" if pay_eth else symbol_in, "txs": [], "permit2": False}
+    if not pay_eth:
+        approval = ensure_approval(w3, account, token_in_addr, spender, amount_in, cfg,
+                                   wait=False, current=allowance)
+        if approval:
+            in_flight.append(approval)
+            plan["txs"].append("approve")
+    plan["txs"].append("swap")
+    out_dec = tok["decimals"]
+
+    if clanker:
+        pool  = clanker_pool(w3, tok["address"])
+        quote = clanker_quote(w3, pool, tok["address"], amount_in, slippage_bps)
+        if not quote:
+            wait_all(w3, account, in_flight)
+            fail(f"Clanker pool {pool['id']} does not quote {plan['pay']} → {symbol_out}")
+        permit = None
+        if not pay_eth:
+            p2_amount, p2_expiration, p2_nonce = permit2 or (0, 0, 0)
+            if p2_amount < amount_in or p2_expiration < time.time() + PERMIT2_SIG_TTL:
+                permit = permit2_permit(account, cfg, token_in_addr, V4_BASE["universal_router"], p2_nonce)
+                plan["permit2"] = True
+        log(f"Buying {symbol_out} with {amount_in/1e18:.6f} {plan['pay']} via Clanker pool: "
+            f"~{quote['amount_out'] / 10**out_dec:.4f} (min {quote['min_out'] / 10**out_dec:.4f})")
+        gas = PIPELINED_GAS["clanker_buy"] if in_flight else None
+        buy = clanker_buy(w3, account, cfg, tok["address"], amount_in, quote, pay_eth=pay_eth, permit=permit, gas=gas)
+        tx_hash = wait_all(w3, account, in_flight + [buy])[-1]
+        return result("completed",
+            f"Bought ~{quote['amount_out'] / 10**out_dec:.4f} {symbol_out} on base with {amount_in/1e18:.6f} "
+            f"{plan['pay']} via Clanker pool. TX: {tx_hash}", tx=tx_hash, data={"quote": quote, "plan": plan})
+
+    # All other tokens: Uniswap v3 exactInputSingle on the best-quoting fee tier.
+    # The quote simulates the pool only, so it doesn't wait on our approval.
+    quote = quote_best(w3, chain, token_in_addr, token_out_addr, amount_in, slippage_bps)
+    if not quote:
+        wait_all(w3, account, in_flight)
+        fail(f"No Uniswap v3 pool quotes {symbol_in} → {symbol_out} on {chain}")
+    log(f"Best tier {quote['fee']}: ~{quote['amount_out'] / 10**out_dec:.8f} {symbol_out} "
+        f"(min {quote['min_out'] / 10**out_dec:.8f})")
+
+    router = contract(w3, router_addr, ROUTER_ABI)
+    params = (
+        Web3.to_checksum_address(token_in_addr),
+        Web3.to_checksum_address(token_out_addr),
+        quote["fee"],
+        account.address,
+        amount_in,
+        quote["min_out"],
+        0,
+    )
+    gas = None
+    if in_flight:
+        # can't estimate behind an unmined approval — size from the quoter's estimate
+        gas = int(quote["gas_estimate"] * 1.2) + SWAP_GAS_OVERHEAD
+    # Paying with ETH: tokenIn stays WETH and the router wraps msg.value in pay()
+    tx = build_call_tx(cfg, account, router.functions.exactInputSingle(params),
+                       value=amount_in if pay_eth else 0, gas=gas)
+    swap = submit_tx(w3, account, tx)
+    tx_hash = wait_all(w3, account, in_flight + [swap])[-1]
 
-    for fee_tier in [3000, 500, 10000]:
-        log(f"Trying fee tier {fee_tier}...")
-        try:
-            params = (
-                Web3.to_checksum_address(token_in_addr),
-                Web3.to_checksum_address(token_out_addr),
-                fee_tier,
-                account.address,
-                amount_in,
-                0,
-                0,
-            )
-            tx = router.functions.exactInputSingle(params).build_transaction({
-                "chainId": cfg["chain_id"],
-                "from": account.address,
-                "value": 0,
-                "maxFeePerGas": gas_price * 2,
-                "maxPriorityFeePerGas": gas_price,
-            })
-            tx_hash = send_tx(w3, account, tx)
-            break
-        except Exception as e:
-            log(f"Fee tier {fee_tier} failed: {e}")
+    return result("completed",
+        f"Swapped {amount} {plan['pay']} → {symbol_out} on {chain}. TX: {tx_hash}",
+        tx=tx_hash, data={"quote": quote, "plan": plan})
 
-    if not tx_hash:
-        fail(f"All fee tiers failed for {symbol_out} swap")
 
-    out("completed",
-        f"Swapped {args.amount} {symbol_in} → {symbol_out} on {chain}. TX: {tx_hash}",
-        tx=tx_hash)
+def cmd_swap(args):
+    leg_key = f"{args.run_id}:swap:{args.token_out.upper()}" if args.run_id else None
+    amount  = args.amount
+    if args.amount_usd is not None:
+        chain  = TOKENS.get(args.token_out.upper(), {}).get("chain", "base")
+        amount = usd_amount(args.token_in.upper(), chain, args.amount_usd)
+    return swap_leg(args.token_in, args.token_out, amount, args.slippage_bps, leg_key=leg_key)
+
+
+def cmd_bridges(args):
+    """Run the swaps queued behind Across bridges whose fill has landed; report the rest.
+    Only the signing wallet's bridges: the `pool` job's, else punkwallet's."""
+    swaps, waiting = [], []
+    records = bridge_records()
+    mine = (wallet_address() or get_account().address).lower() if records else None
+    for record in records:
+        if record["recipient"].lower() != mine:
+            continue
+        if bridge_filled(record):
+            q = record.get("swap")
+            if not JOURNAL.bridge_close(record["deposit_tx"]):
+                continue   # another process (daemon, cron run) took it first
+            if q:
+                log(f"Across deposit {record['deposit_tx']} landed — running queued {q['token_out']} swap")
+                try:
+                    leg = swap_leg(q["token_in"], q["token_out"], bridged_amount(record, q["amount"]),
+                                   q["slippage_bps"], bridge=False, leg_key=q.get("leg_key"))
+                except CommandFailed as e:
+                    leg = {"status": "failed", "response": str(e)}
+                swaps.append({**leg, "token": q["token_out"], "deposit_tx": record["deposit_tx"]})
+        elif time.time() > record["fill_deadline"]:
+            log(f"Across deposit {record['deposit_tx']} passed its fill deadline — refunded on Base")
+            JOURNAL.bridge_close(record["deposit_tx"])
+        else:
+            waiting.append(record)
+    failed = sum(s["status"] == "failed" for s in swaps)
+    status = "completed" if not failed else ("failed" if failed == len(swaps) else "partial")
+    return result(status, f"{len(swaps)} queued swap(s) run, {len(waiting)} bridge(s) still in flight",
+                  data={"swaps": swaps, "pending": waiting})
+
+
+def cmd_report(args):
+    """Swap history and cost basis from the journal (no RPC, no vault) — this wallet's
+    only: the `pool` job's, else punkwallet's."""
+    if not os.path.exists(JOURNAL_FILE):
+        return result("completed", f"No journal yet at {JOURNAL_FILE}", data={"legs": [], "tokens": {}, "batches": {}})
+    since  = int(time.time() - args.days * 86400)
+    token  = args.token.upper() if args.token else None
+    wallet = _WALLET.get()
+    where  = "l.created_at >= ? AND l.wallet IS ?" + (" AND l.token_out = ?" if token else "")
+    params = (since, wallet, token) if token else (since, wallet)
+    legs = JOURNAL.query(
+        "SELECT l.id, l.created_at, l.chain, l.token_in, l.token_out, l.qty_in, l.qty_out, l.status, l.tx_hash,"
+        " COALESCE(SUM(CAST(t.fee_wei AS REAL)), 0) / 1e18 AS gas_eth"
+        f" FROM legs l LEFT JOIN txs t ON t.leg_id = l.id WHERE {where}"
+        " GROUP BY l.id ORDER BY l.created_at DESC LIMIT ?", params + (args.limit,))
+    for leg in legs:
+        leg["time"] = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(leg.pop("created_at")))
+    totals = JOURNAL.query(
+        "SELECT l.token_out, l.token_in, COUNT(*) AS legs, SUM(l.qty_in) AS spent, SUM(l.qty_out) AS received,"
+        " (SELECT COALESCE(SUM(CAST(t.fee_wei AS REAL)), 0) / 1e18 FROM txs t JOIN legs g ON t.leg_id = g.id"
+        "   WHERE g.token_out = l.token_out AND g.token_in = l.token_in AND g.status = 'completed'"
+        "   AND g.created_at >= ? AND g.wallet IS ?) AS gas_eth"
+        f" FROM legs l WHERE {where} AND l.status = 'completed'"
+        " GROUP BY l.token_out, l.token_in ORDER BY l.token_out", (since, wallet) + params)
+    tokens = {}
+    for t in totals:
+        t["cost_basis"] = t["spent"] / t["received"] if t["received"] else None   # token_in per token_out
+        tokens.setdefault(t.pop("token_out"), []).append(t)
+    summary = ", ".join(f"{sym}: {sum(t['received'] for t in rows):.8g}" for sym, rows in tokens.items())
+    batches = JOURNAL.open_batches()
+    waiting = ", ".join(f"{sym} {b['amount_weth']:.6f} WETH" for sym, b in batches.items())
+    return result("completed",
+        f"{len(legs)} leg(s) in the last {args.days:g} day(s)" + (f" — received {summary}" if summary else "")
+        + (f" — batched {waiting}" if waiting else ""),
+        data={"legs": legs, "tokens": tokens, "batches": batches})
+
+
+def cmd_price(args):
+    """ETH/USD and token prices read from Uniswap pools (no vault, no price API)."""
+    want = args.token.upper()
+    if want in ("ETH", "WETH"):
+        symbols = []
+    elif want == "ALL":
+        symbols = list(TOKENS)
+    else:
+        symbols = [args.token]
+    prices = token_prices(symbols, args.twap)
+    if not prices["ETH"]:
+        fail("No WETH/USDC pool prices ETH on base")
+    lines = [f"ETH ${prices['ETH']['usd']:,.2f}"] + [
+        f"{sym} ${p['usd']:.6g}" if p and p["usd"] else f"{sym}: no pool"
+        for sym, p in prices.items() if sym != "ETH"
+    ]
+    return result("completed", " | ".join(lines), data=prices)
+
+
+def parse_split(spec):
+    """"RED=20,GRT=20" → {"RED": 20.0, "GRT": 20.0}"""
+    split = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        sym, _, pct = part.partition("=")
+        try:
+            split[sym.strip().upper()] = float(pct)
+        except ValueError:
+            fail(f"Bad split entry '{part}' — expected TOKEN=PCT")
+    return split
+
+def default_split():
+    """Split from config.json *SplitPct keys (e.g. grtSplitPct → GRT)."""
+    cfg = load_config()
+    return {k[:-len("SplitPct")].upper(): float(v) for k, v in cfg.items() if k.endswith("SplitPct")}
+
+def allocation(args):
+    """(split, WETH total) for allocate / plan-rebalance, validated."""
+    split = parse_split(args.split) if args.split else default_split()
+    weth  = float(args.weth if args.amount_usd is None else usd_amount("WETH", "base", args.amount_usd))
+    if weth <= 0:
+        fail("--weth must be positive")
+    unknown = [s for s in split if s not in TOKENS]
+    if unknown:
+        fail(f"Unknown token(s) in split: {', '.join(unknown)}. Supported: {', '.join(TOKENS)}")
+    if sum(split.values()) > 100:
+        fail(f"Split adds up to {sum(split.values()):g}% — must be ≤ 100%")
+    return split, weth
+
+def tolerance_pct(args):
+    """--tolerance-pct, else config.json rebalanceTolerancePct."""
+    if args.tolerance_pct is not None:
+        return args.tolerance_pct
+    return float(load_config().get("rebalanceTolerancePct", REBALANCE_TOLERANCE_PCT))
+
+def cmd_plan_rebalance(args):
+    """Buys that bring the wallet within the tolerance band of the split (no vault, no txs).
+    data.split feeds allocate --split; allocate --rebalance plans the same way itself."""
+    split, weth = allocation(args)
+    plan = plan_rebalance(read_address(args), split, weth, tolerance_pct(args))
+    legs = ", ".join(f"{t['token']} {t['amount_weth']:.6f} WETH" + (" (bridged)" if t["bridge"] else "")
+                     for t in plan["trades"])
+    band = "in band" if plan["in_band"] else f"closest ±{plan['max_deviation_pct']:.2f} pts"
+    return result("completed", f"{len(plan['trades'])} buys in {plan['txs']} txs, ~${plan['cost_usd']:.2f} "
+                  f"({band}): {legs or 'nothing to buy'}", data=plan)
+
+def cmd_allocate(args):
+    split, weth = allocation(args)
+    plan = None
+    if args.rebalance:
+        plan  = plan_rebalance(get_account().address, split, weth, tolerance_pct(args))
+        split = plan["split"]
+        log(f"Rebalance: {len(plan['trades'])} buys for ~${plan['cost_usd']:.2f}"
+            f"{'' if plan['in_band'] else ' (band not reachable — closest plan)'}")
+
+    legs = [{"token": sym, "chain": TOKENS[sym]["chain"], "pct": pct, "amount_weth": weth * pct / 100}
+            for sym, pct in split.items() if pct > 0]
+    if not legs:
+        fail("Nothing to allocate")
+    deferred = []
+    if args.batch:
+        conf = load_config()
+        legs, deferred = batch_legs(legs, args.run_id, get_account().address,
+                                    float(conf.get("batchMaxCostPct", BATCH_MAX_COST_PCT)),
+                                    float(conf.get("batchMaxDelayHours", BATCH_MAX_DELAY_HOURS)) * 3600)
+
+    # Plan every leg up front, grouped by chain — chains have independent nonces.
+    lanes = {}
+    for leg in legs:
+        lanes.setdefault(leg["chain"], []).append(leg)
+    for chain, chain_legs in lanes.items():
+        log(f"Plan {chain}: " + ", ".join(f"{l['token']} {l['amount_weth']:.8f} WETH" for l in chain_legs))
+
+    if lanes:
+        get_account()  # unlock once before fanning out
+
+    def run_lane(legs):
+        for leg in legs:
+            try:
+                leg_key = leg.get("leg_key") or (f"{args.run_id}:allocate:{leg['token']}" if args.run_id else None)
+                leg.update(swap_leg("WETH", leg["token"], f"{leg['amount_weth']:.18f}", args.slippage_bps,
+                                    leg_key=leg_key))
+                if leg.get("leg_key") and leg["status"] in ("completed", "queued"):
+                    JOURNAL.batch_done(leg["leg_key"])
+            except CommandFailed as e:
+                leg.update(result("failed", str(e)))
+            except Exception as e:
+                leg.update(result("failed", f"{leg['token']} error: {e}"))
+            if leg.get("leg_key") and leg["status"] == "failed":
+                JOURNAL.batch_release(leg["leg_key"])
+            log(f"{leg['token']}: {leg['status']} — {leg['response']}")
+
+    # Each lane runs in a copy of this context: same journal run, same wallet
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(run_lane, legs), name=chain)
+               for chain, legs in lanes.items()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    legs = [leg for legs in lanes.values() for leg in legs] + deferred
+    ok = sum(1 for l in legs if l["status"] in ("completed", "deferred"))
+    status = "completed" if ok == len(legs) else ("failed" if ok == 0 else "partial")
+    summary = " | ".join(f"{l['token']}: {l['status']}" for l in legs)
+    return result(status, f"Allocated {weth:.8f} WETH across {len(legs)} legs ({ok} ok). {summary}",
+                  data={"legs": legs, **({"plan": plan} if plan else {})})
 
 
 def cmd_transfer(args):
@@ -504,16 +3386,13 @@ def cmd_transfer(args):
     chain   = tok["chain"]
     w3, cfg = connect(chain)
 
-    log(f"Fetching private key from 1claw vault...")
-    pk      = get_private_key()
-    account = Account.from_key(pk)
-    log(f"Wallet: {account.address}")
+    account = get_account()
 
     token_addr = Web3.to_checksum_address(tok["address"])
     to_addr    = Web3.to_checksum_address(args.to)
-    token      = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
+    token      = contract(w3, token_addr, ERC20_ABI)
     decimals   = tok["decimals"]
-    symbol_str = token.functions.symbol().call()
+    symbol_str = token_meta(w3, cfg["chain_id"], token_addr)["symbol"]
 
     if args.amount == "all":
         amount = token.functions.balanceOf(account.address).call()
@@ -524,72 +3403,379 @@ def cmd_transfer(args):
     if amount == 0:
         fail(f"Zero balance for {symbol_str}")
 
-    gas_price = w3.eth.gas_price
-    tx = token.functions.transfer(to_addr, amount).build_transaction({
-        "chainId": cfg["chain_id"],
-        "from": account.address,
-        "maxFeePerGas": gas_price * 2,
-        "maxPriorityFeePerGas": gas_price,
-    })
+    tx = build_call_tx(cfg, account, token.functions.transfer(to_addr, amount))
     tx_hash = send_tx(w3, account, tx)
 
     human = amount / 10**decimals
-    out("completed",
+    return result("completed",
         f"Sent {human:,.4f} {symbol_str} to {to_addr}. TX: {tx_hash}",
         tx=tx_hash)
 
 
-def cmd_balance(args):
-    log(f"Fetching private key from 1claw vault...")
-    pk      = get_private_key()
-    account = Account.from_key(pk)
-    log(f"Wallet: {account.address}")
+def chain_snapshot(chain, address, symbols):
+    """One round trip: balanceOf + totalSupply for each symbol on `chain`, plus the wallet's
+    native ETH, WETH balance and WETH allowance to the router."""
+    w3, cfg = connect(chain)
+    owner   = Web3.to_checksum_address(address)
+    weth_c  = contract(w3, cfg["weth"], ERC20_ABI)
+    calls = [
+        eth_balance_call(w3, owner),
+        (weth_c, "balanceOf", [owner]),
+        (weth_c, "allowance", [owner, Web3.to_checksum_address(cfg["router"])]),
+    ]
+    for sym in symbols:
+        token_c = contract(w3, token_info(sym, chain)["address"], ERC20_ABI)
+        calls += [(token_c, "balanceOf", [owner]), (token_c, "totalSupply", [])]
+    values = multicall(w3, calls)
+
+    eth, weth, weth_allowance = values[:3]
+    wallet = {
+        "ETH":  (eth or 0) / 1e18,
+        "WETH": (weth or 0) / 1e18,
+        "WETH_router_allowance": str(weth_allowance or 0),
+    }
+    tokens = {}
+    for n, sym in enumerate(symbols):
+        bal, total = values[3 + 2 * n], values[4 + 2 * n]
+        bal, total = bal or 0, total or 0
+        dec = token_info(sym, chain)["decimals"]
+        pct = bal / total * 100 if total > 0 else 0
+        tokens[sym] = {"balance": bal / 10**dec, "pct_supply": round(pct, 4)}
+    return wallet, tokens
+
+def token_info(sym, chain=None):
+    """TOKENS entry, or a spending token from INPUTS (WETH/USDC; Base unless chain given)."""
+    if sym in TOKENS:
+        return TOKENS[sym]
+    chain = chain or "base"
+    addr, dec = INPUTS[chain][sym]
+    return {"chain": chain, "address": addr, "decimals": dec}
+
+def read_address(args):
+    """Wallet for read-only commands: --address, else the `pool` job's wallet, else
+    config.json `punkwallet`.
+
+    Outside a pool job (whose vault wallet is unlocked for its address) never touches
+    1claw — reads work without the vault and without the key."""
+    addr = args.address or wallet_address() or load_config().get("punkwallet")
+    if not addr:
+        fail("No wallet address: pass --address or set punkwallet in config.json")
+    if not Web3.is_address(addr):
+        fail(f"Invalid address: {addr}")
+    return Web3.to_checksum_address(addr)
+
+def watch(interval, snapshot, when=None):
+    """CLI --watch: print snapshot() as one JSON line every `interval` seconds until
+    interrupted (only the replies `when` accepts, if given). Connections stay warm
+    between snapshots."""
+    try:
+        while True:
+            t0 = time.monotonic()
+            METRICS.reset()
+            try:
+                reply = snapshot()
+            except CommandFailed as e:
+                reply = result("failed", str(e))
+            reply.setdefault("data", {})["timings"] = METRICS.snapshot()
+            reply["timestamp"] = int(time.time())
+            if when is None or when(reply):
+                print(json.dumps(reply), flush=True)
+            time.sleep(max(0.0, interval - (time.monotonic() - t0)))
+    except KeyboardInterrupt:
+        sys.exit(0)
 
-    tokens = list(TOKENS.keys()) if args.token.upper() == "ALL" else [args.token.upper()]
-    results = {}
+def cmd_balance(args):
+    def snapshot():
+        reply = balance_snapshot(read_address(args), args.token)
+        weth  = reply["data"].get("WETH")
+        if weth and not args.address and os.path.exists(JOURNAL_FILE):
+            # WETH queued in allocation batches is spoken for — size new buys on what's free
+            weth["batched"] = JOURNAL.queued_weth()
+            weth["free"]    = max(0.0, weth["balance"] - weth["batched"])
+        return reply
+    if args.watch:
+        watch(args.watch, snapshot)
+    return snapshot()
+
+def balance_snapshot(address, token):
+    want = token.upper()
+    if want == "ALL":
+        tokens = list(TOKENS.keys())
+    elif want in TOKENS or want in INPUTS["base"]:
+        tokens = [want]
+    else:
+        fail(f"Unknown token: {want}")
 
+    by_chain = {}
     for sym in tokens:
-        if sym not in TOKENS:
-            continue
-        tok     = TOKENS[sym]
-        w3, _   = connect(tok["chain"])
-        addr    = Web3.to_checksum_address(tok["address"])
-        contract = w3.eth.contract(address=addr, abi=ERC20_ABI)
-        bal     = contract.functions.balanceOf(account.address).call()
-        total   = contract.functions.totalSupply().call()
-        dec     = tok["decimals"]
-        pct     = bal / total * 100 if total > 0 else 0
-        results[sym] = {"balance": bal / 10**dec, "pct_supply": round(pct, 4)}
+        by_chain.setdefault(token_info(sym)["chain"], []).append(sym)
+
+    # One multicall per chain, chains read concurrently
+    with ThreadPoolExecutor(max_workers=len(by_chain)) as pool:
+        snaps = dict(zip(by_chain, pool.map(
+            lambda chain: chain_snapshot(chain, address, by_chain[chain]), by_chain)))
 
-    lines = [f"{s}: {v['balance']:,.4f} ({v['pct_supply']:.4f}% of supply)" for s, v in results.items()]
-    out("completed", " | ".join(lines), data=results)
+    results = {}
+    for chain in by_chain:
+        results.update(snaps[chain][1])
+    results = {sym: results[sym] for sym in tokens}
+    results["wallet"] = {chain: snaps[chain][0] for chain in by_chain}
+    results["address"] = address
+
+    lines = [f"{s}: {v['balance']:,.4f} ({v['pct_supply']:.4f}% of supply)" for s, v in results.items() if s in tokens]
+    return result("completed", " | ".join(lines), data=results)
+
+
+def cmd_events(args):
+    """Scan the fee locker and wallet transfers since the cursor; with --follow, poll and
+    print a line only when new events cross a threshold."""
+    if args.follow:
+        watch(args.follow, lambda: events_snapshot(read_address(args), args.cursor),
+              when=lambda r: r["data"].get("changed") and (r["data"].get("claim") or r["data"].get("allocate")))
+    return events_snapshot(read_address(args), args.cursor)
+
+def events_snapshot(address, cursor):
+    ev = scan_events(address, cursor)
+    todo = [name for name in ("claim", "allocate") if ev[name]] or ["nothing to do"]
+    fees = "fees unknown (no feeOwner in config.json)" if ev["claim"] is None else f"fees ${ev['fees_usd']:,.2f}"
+    if ev.get("seeded"):
+        scanned = f"Cursor '{cursor}' seeded at block {ev['to_block']}"
+    elif ev["from_block"] > ev["to_block"]:
+        scanned = f"No new blocks since {ev['to_block']}"
+    else:
+        scanned = (f"Blocks {ev['from_block']}–{ev['to_block']}: {ev['fee_events']} fee event(s), "
+                   f"{ev['weth_in']:.6g} WETH in")
+    msg = f"{scanned}, {fees} — {', '.join(todo)}"
+    return result("completed", msg, data=ev)
 
 
 def cmd_check_burn(args):
+    if args.watch:
+        watch(args.watch, lambda: burn_snapshot(read_address(args)))
+    return burn_snapshot(read_address(args))
+
+def burn_snapshot(address):
     log(f"Checking RED burn eligibility...")
-    pk      = get_private_key()
-    account = Account.from_key(pk)
-    w3, _   = connect("base")
-    bal, total, pct, eligible = red_burn_eligible(w3, account.address)
+    w3, _ = connect("base")
+    bal, total, pct, eligible = red_burn_eligible(w3, address)
     dec = TOKENS["RED"]["decimals"]
     msg = (
         f"RED balance: {bal/10**dec:,.0f} ({pct*100:.4f}% of supply). "
         f"Burn threshold: 5%. "
         f"{'ELIGIBLE to burn.' if eligible else 'NOT eligible — accumulating.'}"
     )
-    out("completed", msg, data={"eligible": eligible, "pct": pct * 100, "balance": bal / 10**dec})
+    return result("completed", msg, data={"eligible": eligible, "pct": pct * 100, "balance": bal / 10**dec})
+
+
+def pool_fixture(chain, state, quotes):
+    """A PoolState and the QuoterV2 outputs at its block, as JSON for tests/fixtures."""
+    return {"chain": chain, "address": state.address, "block": state.block, "token0": state.token0,
+            "token1": state.token1, "fee": state.fee, "sqrt_price_x96": str(state.sqrt_price_x96),
+            "tick": state.tick, "liquidity": str(state.liquidity),
+            "bitmap": {str(p): str(w) for p, w in state.bitmap.items()},
+            "ticks": {str(t): str(net) for t, net in state.ticks.items()}, "quotes": quotes}
+
+def cmd_verify_math(args):
+    """Check the off-chain v3 engine against QuoterV2, both pinned to the same block.
+    --record also quotes each pool the other way round (token in, the WETH quote's output)
+    and writes the snapshots with both QuoterV2 outputs as test fixtures. Any mismatch, or
+    no pool to check at all, is a failed reply (exit 1)."""
+    rows, mismatches, fixtures = [], 0, []
+    for sym, tok in TOKENS.items():
+        chain   = tok["chain"]
+        w3, cfg = connect(chain)
+        weth    = cfg["weth"]
+        amount_in = int(float(args.amount) * 1e18)
+        pools = pool_address(w3, chain, weth, tok["address"])
+        if not pools:
+            log(f"{sym}: no Uniswap v3 pool on {chain} — skipped")
+            continue
+        quoter = contract(w3, cfg["quoter"], QUOTER_V2_ABI)
+        tin, tout = Web3.to_checksum_address(weth), Web3.to_checksum_address(tok["address"])
+        for fee, pool in pools.items():
+            state = load_pool(w3, chain, pool, fee, weth, tok["address"])
+            try:
+                local = state.quote_exact_input(weth, amount_in)[0]
+            except PoolRangeExceeded:
+                local = None
+            onchain = multicall(w3, [(quoter, "quoteExactInputSingle", [(tin, tout, amount_in, fee, 0)])], state.block)[0]
+            quoted = onchain[0] if onchain else None
+            match = local is not None and local == quoted
+            mismatches += not match
+            rows.append({"token": sym, "fee": fee, "block": state.block, "local": str(local),
+                         "quoter": str(quoted), "match": match})
+            log(f"{sym} fee {fee} @ {state.block}: local {local} vs quoter {quoted} — {'OK' if match else 'MISMATCH'}")
+            if args.record and quoted:
+                back = multicall(w3, [(quoter, "quoteExactInputSingle", [(tout, tin, quoted, fee, 0)])], state.block)[0]
+                quotes = [{"token_in": weth.lower(), "amount_in": str(amount_in), "amount_out": str(quoted)}]
+                if back:
+                    quotes.append({"token_in": tok["address"].lower(), "amount_in": str(quoted),
+                                   "amount_out": str(back[0])})
+                fixtures.append(pool_fixture(chain, state, quotes))
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(fixtures, f, indent=2)
+        log(f"Recorded {len(fixtures)} pool snapshot(s) to {args.record}")
+    status = "completed" if rows and mismatches == 0 else "failed"
+    return result(status, f"{len(rows) - mismatches}/{len(rows)} pools match QuoterV2 for {args.amount} WETH in",
+                  data={"pools": rows})
+
+
+def cmd_serve(args):
+    """Keep one warm process on a Unix socket; each line in is a command, each line out its JSON."""
+    import socketserver
+    path = args.socket
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from a previous daemon
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    reply = run_command(request_argv(json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    reply = result("failed", f"Bad request: {e}")
+                self.wfile.write((json.dumps(reply) + "\n").encode())
+                self.wfile.flush()
+
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    os.chmod(path, 0o600)  # the daemon holds a signing key — owner only
+    log(f"Serving on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+    return result("completed", f"Daemon on {path} stopped")
+
+
+def cmd_pool(args):
+    """Run per-wallet command queues in one process: wallets concurrently (at most
+    --workers at once), each wallet's commands in order. Jobs share the RPC pools, the
+    chain-state cache, fee history and the journal; nonces are handed out per (wallet,
+    chain), so wallets never wait on each other's txs."""
+    queues = {}
+    if args.jobs:
+        with (sys.stdin if args.jobs == "-" else open(args.jobs)) as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    req    = json.loads(line)
+                    wallet = req.pop("wallet")
+                    queues.setdefault(wallet, []).append(request_argv(req))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    fail(f"Bad job on line {n}: {e}")
+    if args.wallets:
+        try:
+            argv = request_argv({"argv": args.argv})
+        except ValueError as e:
+            fail(str(e))
+        for wallet in args.wallets.split(","):
+            if wallet.strip():
+                queues.setdefault(wallet.strip(), []).append(argv)
+    if not queues:
+        fail("No jobs: pass --wallets W1,W2 COMMAND ... or --jobs FILE")
+    bad = [w for w in queues if w.startswith("0x") and not Web3.is_address(w)]
+    if bad:
+        fail(f"Invalid wallet address: {', '.join(bad)}")
+
+    def run_queue(wallet, jobs):
+        _WALLET.set(wallet)
+        done = []
+        for argv in jobs:
+            reply = run_job(argv)
+            log(f"[{wallet}] {argv[0]}: {reply['status']} — {reply['response']}")
+            done.append({"argv": argv, **reply})
+        return done
+
+    workers = max(1, min(args.workers, len(queues)))
+    log(f"Pool: {sum(map(len, queues.values()))} job(s) for {len(queues)} wallet(s), {workers} at a time")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wallet") as pool:
+        futures = {w: pool.submit(contextvars.copy_context().run, run_queue, w, jobs) for w, jobs in queues.items()}
+        wallets = {w: f.result() for w, f in futures.items()}
+
+    replies = [r for done in wallets.values() for r in done]
+    ok = sum(1 for r in replies if r["status"] == "completed")
+    status = "completed" if ok == len(replies) else ("failed" if ok == 0 else "partial")
+    return result(status, f"{len(replies)} job(s) for {len(wallets)} wallet(s) ({ok} ok)", data={"wallets": wallets})
 
 
 # ── CLI ────────────────────────────────────────────────────────────────────────
 
-def main():
+COMMANDS = {
+    "swap":        cmd_swap,
+    "allocate":    cmd_allocate,
+    "plan-rebalance": cmd_plan_rebalance,
+    "transfer":    cmd_transfer,
+    "balance":     cmd_balance,
+    "check-burn":  cmd_check_burn,
+    "price":       cmd_price,
+    "events":      cmd_events,
+    "verify-math": cmd_verify_math,
+    "bridges":     cmd_bridges,
+    "report":      cmd_report,
+    "serve":       cmd_serve,
+    "pool":        cmd_pool,
+}
+
+# Commands that can send txs — each run is recorded in the journal.
+JOURNALED_COMMANDS = ("swap", "allocate", "transfer", "bridges")
+
+# Commands reachable over the daemon socket and as pool jobs (serve and pool are not).
+DAEMON_COMMANDS = ("swap", "allocate", "plan-rebalance", "transfer", "balance", "check-burn", "price", "events",
+                   "verify-math", "bridges", "report")
+
+# One command at a time — swaps on the same wallet would otherwise race on nonces.
+_COMMAND_LOCK = threading.Lock()
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Uniswap v3 swap/transfer via 1claw punkwallet")
     sub = parser.add_subparsers(dest="command", required=True)
 
     p_swap = sub.add_parser("swap", help="Swap tokenIn → tokenOut")
     p_swap.add_argument("--token-in",  default="WETH", help="Input token: WETH, USDC (default: WETH)")
-    p_swap.add_argument("--token-out", required=True,   help="Output token: RED, GRT, WBTC")
-    p_swap.add_argument("--amount",    type=str, required=True, help="Amount of tokenIn to spend")
+    p_swap.add_argument("--token-out", required=True,   help="Output token: RED, GRT, WBTC, ... or a Clanker token address on Base")
+    amount = p_swap.add_mutually_exclusive_group(required=True)
+    amount.add_argument("--amount",     type=str, help="Amount of tokenIn to spend")
+    amount.add_argument("--amount-usd", type=float, help="USD worth of tokenIn to spend, priced on-chain")
+    p_swap.add_argument("--slippage-bps", type=int, default=DEFAULT_SLIPPAGE_BPS,
+                        help=f"Min output = quote minus this many bps (default: {DEFAULT_SLIPPAGE_BPS})")
+
+    p_alloc = sub.add_parser("allocate", help="Split WETH across tokens, chains in parallel")
+    total = p_alloc.add_mutually_exclusive_group(required=True)
+    total.add_argument("--weth",       type=str, help="Total WETH to allocate")
+    total.add_argument("--amount-usd", type=float, help="Total to allocate in USD, priced on-chain")
+    p_alloc.add_argument("--split", default=None, help="TOKEN=PCT,... (default: *SplitPct from config.json)")
+    p_alloc.add_argument("--slippage-bps", type=int, default=DEFAULT_SLIPPAGE_BPS)
+    p_alloc.add_argument("--rebalance", action="store_true",
+                         help="Buy only what the holdings need to reach the split (see plan-rebalance)")
+    p_alloc.add_argument("--batch", action="store_true",
+                         help="Queue each token's amount; buy once gas is a small share of it (config.json "
+                              "batchMaxCostPct / batchMaxDelayHours)")
+
+    p_plan = sub.add_parser("plan-rebalance", help="Fewest buys that bring holdings within the split's band")
+    total = p_plan.add_mutually_exclusive_group(required=True)
+    total.add_argument("--weth",       type=str, help="WETH to spend")
+    total.add_argument("--amount-usd", type=float, help="USD to spend, priced on-chain")
+    p_plan.add_argument("--split", default=None, help="Target weights TOKEN=PCT,... (default: *SplitPct from config.json)")
+    p_plan.add_argument("--address", default=None, help="Wallet to plan for (default: punkwallet from config.json)")
+
+    for p_band in (p_alloc, p_plan):
+        p_band.add_argument("--tolerance-pct", type=float, default=None,
+                            help=f"Band around each target weight, in points (default: config.json "
+                                 f"rebalanceTolerancePct or {REBALANCE_TOLERANCE_PCT})")
+
+    for p_write in (p_swap, p_alloc):
+        p_write.add_argument("--run-id", default=None,
+                             help="Rerunning with the same id skips legs already done or in flight")
 
     p_xfer = sub.add_parser("transfer", help="Transfer token to address")
     p_xfer.add_argument("--token",  required=True)
@@ -599,17 +3785,121 @@ def main():
     p_bal = sub.add_parser("balance", help="Check token balance")
     p_bal.add_argument("--token", default="ALL")
 
-    sub.add_parser("check-burn", help="Check if RED burn threshold met")
-
-    args = parser.parse_args()
-    if args.command == "swap":
-        cmd_swap(args)
-    elif args.command == "transfer":
-        cmd_transfer(args)
-    elif args.command == "balance":
-        cmd_balance(args)
-    elif args.command == "check-burn":
-        cmd_check_burn(args)
+    p_burn = sub.add_parser("check-burn", help="Check if RED burn threshold met")
+
+    for p_read in (p_bal, p_burn):
+        p_read.add_argument("--address", default=None, help="Wallet to read (default: punkwallet from config.json)")
+        p_read.add_argument("--watch", type=float, default=None, metavar="N",
+                            help="Print a JSON snapshot every N seconds until interrupted")
+
+    p_ev = sub.add_parser("events", help="Fee-locker and wallet events since the last scan: claim / allocate?")
+    p_ev.add_argument("--cursor", default="main", help="Named block cursor to advance (default: main)")
+    p_ev.add_argument("--address", default=None, help="Wallet to follow (default: punkwallet from config.json)")
+    p_ev.add_argument("--follow", type=float, default=None, metavar="N",
+                      help="Scan every N seconds; print a JSON line whenever new events cross a threshold")
+
+    p_price = sub.add_parser("price", help="ETH/USD and token prices from Uniswap pools")
+    p_price.add_argument("--token", default="ETH", help="ETH, ALL, a symbol or a Clanker token address (default: ETH)")
+    p_price.add_argument("--twap", type=int, default=0, metavar="SECONDS",
+                         help="Average the v3 pool tick over this window instead of the spot price")
+
+    p_vm = sub.add_parser("verify-math", help="Compare off-chain v3 quotes with QuoterV2")
+    p_vm.add_argument("--amount", default="0.01", help="WETH in per quote (default: 0.01)")
+    p_vm.add_argument("--record", default=None, metavar="FILE",
+                      help="Write the pool snapshots and QuoterV2 outputs as test fixtures")
+
+    sub.add_parser("bridges", help="Run swaps queued behind landed Across bridges")
+
+    p_rep = sub.add_parser("report", help="Swap history and cost basis from the journal")
+    p_rep.add_argument("--token", default=None, help="Only this output token")
+    p_rep.add_argument("--days",  type=float, default=30, help="Look back this many days (default: 30)")
+    p_rep.add_argument("--limit", type=int, default=50, help="Most recent legs listed (default: 50)")
+
+    p_serve = sub.add_parser("serve", help="Run as a daemon on a Unix socket (JSON lines)")
+    p_serve.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Socket path (default: {DEFAULT_SOCKET})")
+
+    p_pool = sub.add_parser("pool", help="Run commands for many wallets in one process")
+    p_pool.add_argument("--wallets", default=None,
+                        help="W1,W2,...: vault secrets (path or VAULT_ID:path) or 0x addresses (read-only)")
+    p_pool.add_argument("--jobs", default=None, metavar="FILE",
+                        help='JSON lines {"wallet": ..., "argv": [...]} ("-" for stdin)')
+    p_pool.add_argument("--workers", type=int, default=POOL_WORKERS,
+                        help=f"Wallets worked on at once (default: {POOL_WORKERS})")
+    p_pool.add_argument("argv", nargs=argparse.REMAINDER, help="Command run for every --wallets wallet")
+
+    return parser
+
+def request_argv(req):
+    """Turn a daemon request into CLI argv: {"argv": [...]} or {"command": ..., "<option>": value}."""
+    if not isinstance(req, dict):
+        raise ValueError("request must be a JSON object")
+    if "argv" in req:
+        if not isinstance(req["argv"], list):
+            raise ValueError("argv must be a JSON array")
+        argv = [str(a) for a in req["argv"]]
+    elif "command" in req:
+        argv = [str(req["command"])]
+        for k, v in req.items():
+            if k != "command":
+                argv += [f"--{k.replace('_', '-')}", str(v)]
+    else:
+        raise ValueError('request needs "command" or "argv"')
+    if not argv or argv[0] not in DAEMON_COMMANDS:
+        raise ValueError(f"command must be one of: {', '.join(DAEMON_COMMANDS)}")
+    # Parse for real: argparse also takes --watch=5 and prefixes like --wat 5
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit:
+        raise ValueError(f"Invalid arguments: {' '.join(argv)}") from None
+    if getattr(args, "watch", None) is not None or getattr(args, "follow", None) is not None:
+        raise ValueError("--watch / --follow stream snapshots and are CLI-only; poll the daemon instead")
+    return argv
+
+def execute(args):
+    """Run a parsed command; a failure or crash comes back as a failed reply."""
+    try:
+        return COMMANDS[args.command](args)
+    except CommandFailed as e:
+        return result("failed", str(e))
+    except Exception as e:
+        log(f"{args.command} crashed: {e!r}")
+        return result("failed", f"{args.command} error: {e}")
+
+def run_command(argv):
+    """Parse and run one command, returning its reply dict instead of exiting."""
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit:
+        return result("failed", f"Invalid arguments: {' '.join(argv)}")
+    with _COMMAND_LOCK:
+        start_command(args, argv)
+        return finish_command(args.command, execute(args))
+
+def run_job(argv):
+    """run_command() for a pool job: no command lock (other wallets run alongside) and no
+    per-command timings — the pool's reply carries them for the whole run."""
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit:
+        return result("failed", f"Invalid arguments: {' '.join(argv)}")
+    if args.command in JOURNALED_COMMANDS:
+        JOURNAL.start_run(args.command, argv, getattr(args, "run_id", None))
+    reply = execute(args)
+    JOURNAL.end_run(reply)
+    return reply
+
+# Process exit code per reply status; anything else (completed, deferred, …) exits 0
+EXIT_CODES = {"failed": 1, "partial": 2}
+
+def main():
+    args = build_parser().parse_args()
+    start_command(args, sys.argv[1:])
+    try:
+        reply = COMMANDS[args.command](args)
+    except CommandFailed as e:
+        reply = result("failed", str(e))
+    print(json.dumps(finish_command(args.command, reply)), flush=True)
+    sys.exit(EXIT_CODES.get(reply["status"], 0))
 
 if __name__ == "__main__":
     main()
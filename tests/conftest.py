@@ -0,0 +1,15 @@
+import importlib.util
+import os
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "uniswap-swap.py")
+
+
+@pytest.fixture(scope="session")
+def swap():
+    """scripts/uniswap-swap.py as a module (its name isn't importable)."""
+    spec = importlib.util.spec_from_file_location("uniswap_swap", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
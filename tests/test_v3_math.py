@@ -0,0 +1,148 @@
+"""Off-chain Uniswap v3 engine: TickMath / SwapMath against the v3-core test vectors, the
+swap loop against hand-built pools, and any snapshots recorded with
+`uniswap-swap.py verify-math --record tests/fixtures/<name>.json` against QuoterV2."""
+
+import glob
+import json
+import os
+import sys
+from math import isqrt
+
+import pytest
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fixtures", "*.json")))
+
+Q96 = 1 << 96
+
+
+def encode_price_sqrt(reserve1, reserve0):
+    """v3-core test helper: sqrt(reserve1 / reserve0) as a Q64.96."""
+    return isqrt(reserve1 * (1 << 192) // reserve0)
+
+
+# ── TickMath ──────────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("tick, expected", [
+    (-887272, 4295128739),
+    (-887271, 4295343490),
+    (0, Q96),
+    (887271, 1461373636630004318706518188784493106690254656249),
+    (887272, 1461446703485210103287273052203988822378723970342),
+])
+def test_sqrt_ratio_at_tick(swap, tick, expected):
+    assert swap.sqrt_ratio_at_tick(tick) == expected
+
+
+def test_sqrt_ratio_at_tick_out_of_range(swap):
+    with pytest.raises(ValueError):
+        swap.sqrt_ratio_at_tick(887273)
+
+
+# ── SwapMath.computeSwapStep (exact input) ────────────────────────────────────
+
+def test_swap_step_capped_at_price_target_one_for_zero(swap):
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(101, 100)
+    sqrt_q, amount_in, amount_out, fee = swap.compute_swap_step(price, target, 2 * 10**18, 10**18, 600)
+    assert (amount_in, amount_out, fee) == (9975124224178055, 9925619580021728, 5988667735148)
+    assert sqrt_q == target
+
+
+def test_swap_step_fully_spent_one_for_zero(swap):
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(1000, 100)
+    sqrt_q, amount_in, amount_out, fee = swap.compute_swap_step(price, target, 2 * 10**18, 10**18, 600)
+    assert (amount_in, amount_out, fee) == (999400000000000000, 666399946655997866, 600000000000000)
+    assert price < sqrt_q < target
+
+
+def test_swap_step_target_price_of_one_uses_partial_input(swap):
+    sqrt_q, amount_in, amount_out, fee = swap.compute_swap_step(2, 1, 1, 3915081100057732413702495386755767, 1)
+    assert (amount_in, amount_out, fee) == (39614081257132168796771975168, 0, 39614120871253040049813)
+    assert sqrt_q == 1
+
+
+# ── Swap loop ─────────────────────────────────────────────────────────────────
+# Fee 3000 (spacing 60), price 1, two positions: [-60, 60] with 4e17 and [-600, 600]
+# with 6e17. Bitmap words -1 and 0 are loaded, so a swap may walk to ±15360.
+
+TOKEN0, TOKEN1 = "0x" + "00" * 19 + "01", "0x" + "00" * 19 + "02"
+WIDE, NARROW = 6 * 10**17, 4 * 10**17
+
+
+def make_pool(swap):
+    bitmap = {-1: (1 << 255) | (1 << 246), 0: (1 << 1) | (1 << 10)}
+    ticks = {-600: WIDE, -60: NARROW, 60: -NARROW, 600: -WIDE}
+    return swap.PoolState("0xpool", TOKEN0, TOKEN1, 3000, Q96, 0, WIDE + NARROW, bitmap, ticks, 1)
+
+
+def two_steps(swap, amount_in, cross, stop):
+    """Expected output: swap to `cross` at full liquidity, cross it (narrow position
+    leaves), then continue toward `stop` with only the wide position."""
+    first = swap.compute_swap_step(Q96, swap.sqrt_ratio_at_tick(cross), WIDE + NARROW, amount_in, 3000)
+    left = amount_in - first[1] - first[3]
+    second = swap.compute_swap_step(first[0], swap.sqrt_ratio_at_tick(stop), WIDE, left, 3000)
+    assert first[0] == swap.sqrt_ratio_at_tick(cross) and second[0] != swap.sqrt_ratio_at_tick(stop)
+    return first[2] + second[2], second[0]
+
+
+def test_quote_within_range(swap):
+    pool = make_pool(swap)
+    amount_out, sqrt_after, crossed = pool.quote_exact_input(TOKEN0, 10**15)
+    step = swap.compute_swap_step(Q96, swap.sqrt_ratio_at_tick(-60), WIDE + NARROW, 10**15, 3000)
+    assert (amount_out, sqrt_after, crossed) == (step[2], step[0], 0)
+
+
+def test_quote_zero_for_one_crosses_tick(swap):
+    amount_out, sqrt_after, crossed = make_pool(swap).quote_exact_input(TOKEN0, 5 * 10**15)
+    assert (amount_out, sqrt_after) == two_steps(swap, 5 * 10**15, -60, -600)
+    assert crossed == 1
+
+
+def test_quote_one_for_zero_crosses_tick(swap):
+    amount_out, sqrt_after, crossed = make_pool(swap).quote_exact_input(TOKEN1, 5 * 10**15)
+    assert (amount_out, sqrt_after) == two_steps(swap, 5 * 10**15, 60, 600)
+    assert crossed == 1
+
+
+def test_quote_past_loaded_words(swap):
+    with pytest.raises(swap.PoolRangeExceeded):
+        make_pool(swap).quote_exact_input(TOKEN0, 10**18)
+
+
+# ── verify-math ───────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("off_by, code", [(0, 0), (1, 1)])
+def test_verify_math_exit_code(swap, monkeypatch, tmp_path, off_by, code):
+    """QuoterV2 agreeing exits 0; any mismatch exits 1 so a CI or cron gate notices."""
+    pool = make_pool(swap)
+    quoted = pool.quote_exact_input(TOKEN0, 10**16)[0] + off_by
+    monkeypatch.setattr(swap, "TOKENS", {"TOK": {"chain": "base", "address": TOKEN1}})
+    monkeypatch.setattr(swap, "JOURNAL", swap.Journal(str(tmp_path / "journal.db")))
+    monkeypatch.setattr(swap, "connect", lambda chain: (None, {"weth": TOKEN0, "quoter": TOKEN0}))
+    monkeypatch.setattr(swap, "pool_address", lambda *a: {3000: pool.address})
+    monkeypatch.setattr(swap, "load_pool", lambda *a: pool)
+    monkeypatch.setattr(swap, "contract", lambda *a: None)
+    monkeypatch.setattr(swap, "multicall", lambda *a: [(quoted,)])
+    monkeypatch.setattr(sys, "argv", ["uniswap-swap.py", "verify-math", "--amount", "0.01"])
+    with pytest.raises(SystemExit) as raised:
+        swap.main()
+    assert raised.value.code == code
+
+
+# ── Recorded snapshots ────────────────────────────────────────────────────────
+
+def recorded():
+    for path in FIXTURES:
+        with open(path) as f:
+            for fx in json.load(f):
+                for q in fx["quotes"]:
+                    yield pytest.param(fx, q, id=f"{os.path.basename(path)}:{fx['address'][:10]}@{fx['block']}"
+                                                 f":{'0for1' if q['token_in'] == fx['token0'] else '1for0'}")
+
+
+@pytest.mark.skipif(not FIXTURES, reason="no snapshots in tests/fixtures — record with verify-math --record")
+@pytest.mark.parametrize("fx, quote", list(recorded()))
+def test_recorded_pool_matches_quoter(swap, fx, quote):
+    state = swap.PoolState(fx["address"], fx["token0"], fx["token1"], fx["fee"], int(fx["sqrt_price_x96"]),
+                           fx["tick"], int(fx["liquidity"]), {int(p): int(w) for p, w in fx["bitmap"].items()},
+                           {int(t): int(net) for t, net in fx["ticks"].items()}, fx["block"])
+    assert state.quote_exact_input(quote["token_in"], int(quote["amount_in"]))[0] == int(quote["amount_out"])